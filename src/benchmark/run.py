@@ -0,0 +1,192 @@
+#先cd到/src目录下 在终端执行python main.py benchmark
+import asyncio
+import json
+import logging
+import random
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from benchmark.stubs import FakeEmbeddings, FakeLLM, InMemoryGraph, InMemoryPool
+from configuration import config
+from web.admission import AdmissionRejected
+from web.metrics import ChatMetrics, Histogram
+from web.server import ChatService
+
+PERCENTILES = (50, 95, 99)
+
+
+class _RecordingHistogram(Histogram):
+    '''同时保留原始样本,用于计算精确分位数'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.samples = defaultdict(list)
+
+    def observe(self, value, **labels):
+        super().observe(value, **labels)
+        self.samples[tuple(labels[name] for name in self.label_names)].append(value)
+
+
+class RecordingMetrics(ChatMetrics):
+    histogram_class = _RecordingHistogram
+
+    def reset_samples(self):
+        for histogram in (self.request_seconds, self.stage_seconds, self.llm_seconds):
+            histogram.samples.clear()
+
+
+def load_samples(path, limit, seed=42):
+    '''读取data.jsonl,按固定随机种子打乱后取前limit条,保证每次回放的问题相同'''
+    with open(path, encoding='utf-8') as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    random.Random(seed).shuffle(samples)
+    return samples[:limit]
+
+
+def build_service(samples, bench_config, work_dir):
+    '''用本地替身构造ChatService;模板/索引等运行时文件写到临时目录,不影响data目录'''
+    config.GRAPH_VERSION_PATH = work_dir / 'graph_version'
+    config.GRAPH_SCHEMA_CACHE_PATH = work_dir / 'schema_snapshot.json'
+    config.CYPHER_TEMPLATE_PATH = work_dir / 'templates.json'
+    config.ENTITY_INDEX_CONFIG = {**config.ENTITY_INDEX_CONFIG, 'index_dir': work_dir / 'entity_index', 'rebuild': True}
+    config.ANSWER_CACHE_CONFIG = {**config.ANSWER_CACHE_CONFIG, 'enabled': bench_config['answer_cache']}
+    config.QUERY_CACHE_CONFIG = {**config.QUERY_CACHE_CONFIG, 'enabled': bench_config['query_cache']}
+    config.SPECULATIVE_CONSULT_CONFIG = {**config.SPECULATIVE_CONSULT_CONFIG, 'enabled': bench_config['speculative']}
+    config.FUSED_PROMPT_ENABLED = bench_config['fused']
+
+    embedding_model = FakeEmbeddings(latency=bench_config['embedding_latency'])
+    graph = InMemoryGraph(embedding_model, latency=bench_config['graph_latency'])
+    llm = FakeLLM(graph, {sample['text']: sample for sample in samples}, bench_config['llm_latency'])
+    return ChatService(components={'llm': llm,
+                                   'embedding_model': embedding_model,
+                                   'neo4j_pool': InMemoryPool(graph),
+                                   'metrics': RecordingMetrics()})
+
+
+def _run_sync(service, questions, concurrency):
+    def ask(question):
+        try:
+            service.chat(question)
+            return None
+        except AdmissionRejected as e:
+            return e.reason
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(ask, questions))
+
+
+async def _run_async(service, questions, concurrency, stream):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask(question):
+        async with semaphore:
+            try:
+                if stream:
+                    async for _ in service.astream_chat(question):
+                        pass
+                else:
+                    await service.achat(question)
+                return None
+            except AdmissionRejected as e:
+                return e.reason
+
+    return await asyncio.gather(*[ask(question) for question in questions])
+
+
+async def _run_batch(service, questions, concurrency, batch_size):
+    '''每batch_size个问题一次abatch_chat,同时最多concurrency个批次;被拒绝时整批计为拒绝'''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask(batch):
+        async with semaphore:
+            try:
+                await service.abatch_chat(batch)
+                return [None] * len(batch)
+            except AdmissionRejected as e:
+                return [e.reason] * len(batch)
+
+    batches = [questions[start:start + batch_size] for start in range(0, len(questions), batch_size)]
+    return [outcome for outcomes in await asyncio.gather(*[ask(batch) for batch in batches]) for outcome in outcomes]
+
+
+def _percentiles(values):
+    if not values:
+        return {f'p{p}': None for p in PERCENTILES}
+    return {f'p{p}': round(float(np.percentile(values, p)) * 1000, 2) for p in PERCENTILES}
+
+
+def run_level(service, questions, concurrency, mode, batch_size):
+    service.metrics.reset_samples()
+    started = time.perf_counter()
+    if mode == 'sync':
+        outcomes = _run_sync(service, questions, concurrency)
+    elif mode == 'batch':
+        outcomes = asyncio.run(_run_batch(service, questions, concurrency, batch_size))
+    else:
+        outcomes = asyncio.run(_run_async(service, questions, concurrency, stream=mode == 'stream'))
+    elapsed = time.perf_counter() - started
+    metrics = service.metrics
+    return {
+        'concurrency': concurrency,
+        'requests': len(questions),
+        'rejected': sum(outcome is not None for outcome in outcomes),
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(questions) / elapsed, 2),
+        'request_ms': _percentiles([value for values in metrics.request_seconds.samples.values() for value in values]),
+        'stage_ms': {stage: {'count': len(values), **_percentiles(values)}
+                     for (stage,), values in sorted(metrics.stage_seconds.samples.items())},
+        'llm_ms': {stage: {'count': len(values), **_percentiles(values)}
+                   for (stage,), values in sorted(metrics.llm_seconds.samples.items())},
+    }
+
+
+def _print_level(result):
+    request = result['request_ms']
+    print(f"\n⏱️并发{result['concurrency']}: {result['requests']}个问题,耗时{result['seconds']}s,"
+          f"吞吐{result['throughput']}个/s,拒绝{result['rejected']}个,"
+          f"请求p50/p95/p99={request['p50']}/{request['p95']}/{request['p99']}ms")
+    print(f"{'阶段':<12}{'次数':>8}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}")
+    for group, prefix in (('stage_ms', ''), ('llm_ms', 'llm:')):
+        for stage, stats in result[group].items():
+            print(f"{prefix + stage:<12}{stats['count']:>8}{stats['p50']:>12}{stats['p95']:>12}{stats['p99']:>12}")
+
+
+def _print_curve(results):
+    print('\n📈并发扩展曲线')
+    print(f"{'并发':>6}{'吞吐(个/s)':>14}{'p50(ms)':>12}{'p95(ms)':>12}{'p99(ms)':>12}{'拒绝':>8}")
+    for result in results:
+        request = result['request_ms']
+        print(f"{result['concurrency']:>6}{result['throughput']:>14}{request['p50']:>12}{request['p95']:>12}"
+              f"{request['p99']:>12}{result['rejected']:>8}")
+
+
+def benchmark(concurrency=None, limit=None, mode=None, output=None):
+    bench_config = config.BENCHMARK_CONFIG
+    concurrency = concurrency or bench_config['concurrency']
+    limit = limit or bench_config['limit']
+    mode = mode or bench_config['mode']
+    # 每个问题的处理日志会淹没报告,只保留错误
+    logging.getLogger('web').setLevel(logging.ERROR)
+
+    samples = load_samples(bench_config['data_path'], limit)
+    questions = [sample['text'] for sample in samples]
+    with tempfile.TemporaryDirectory(prefix='chat-benchmark-') as work_dir:
+        service = build_service(samples, bench_config, Path(work_dir))
+        print(f'🚀回放{len(questions)}个问题,模式:{mode},并发:{concurrency}')
+        results = []
+        for level in concurrency:
+            results.append(run_level(service, questions, level, mode, bench_config['batch_size']))
+            _print_level(results[-1])
+        _print_curve(results)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'mode': mode, 'config': {key: value for key, value in bench_config.items() if key != 'data_path'},
+                       'results': results}, f, ensure_ascii=False, indent=2)
+        print(f'\n💾结果已保存-->{output}')
+    return results
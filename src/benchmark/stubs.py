@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from web.cypher_library import CONSULT_QUERIES
+from web.entity_index import LABEL_TEXT_PROPERTY
+
+#🌻 benchmark用的本地替身:不需要DeepSeek密钥和Neo4j服务,延迟可配置,用来对比缓存/异步等改动前后的性能
+
+# 合成知识图谱的节点文本,关系方向与table_sync/json_sync.py一致
+SEED_NODES = {
+    'Disease': ['高血压', '糖尿病', '感冒', '胃炎', '肺炎', '哮喘', '冠心病', '肠胃炎', '偏头痛', '贫血', '痛风', '鼻炎',
+                '支气管炎', '颈椎病', '失眠', '湿疹', '结膜炎', '肾结石', '脂肪肝', '骨质疏松', '甲状腺功能亢进', '乙型肝炎',
+                '心肌梗死', '脑梗死', '慢性支气管炎', '过敏性鼻炎', '腰椎间盘突出', '口腔溃疡', '荨麻疹', '扁桃体炎'],
+    'Symptom': ['头痛', '头晕', '发热', '咳嗽', '腹痛', '腹泻', '恶心', '呕吐', '乏力', '胸闷', '心悸', '失眠', '皮疹',
+                '鼻塞', '流涕', '咽痛', '关节痛', '腰痛', '呼吸困难', '食欲不振'],
+    'Department': ['内科', '心内科', '呼吸内科', '消化内科', '内分泌科', '神经内科', '皮肤科', '耳鼻喉科', '骨科', '儿科'],
+    'Drug': ['硝苯地平', '二甲双胍', '布洛芬', '奥美拉唑', '阿莫西林', '沙丁胺醇', '阿司匹林', '氯雷他定', '维生素D',
+             '别嘌醇', '蒙脱石散', '头孢克肟'],
+    'Food': ['芹菜', '燕麦', '鸡蛋', '牛奶', '苹果', '菠菜', '辣椒', '白酒', '海鲜', '动物内脏', '咖啡', '油炸食品'],
+    'Check': ['血常规', '尿常规', '血压测量', '血糖检测', '胸部X线', '心电图', '胃镜', '腹部B超', 'CT', '肝功能'],
+    'Treat': ['药物治疗', '手术治疗', '饮食疗法', '物理治疗', '支持性治疗'],
+    'Cause': ['长期高盐饮食', '遗传因素', '病毒感染', '细菌感染', '过度劳累', '吸烟饮酒', '精神紧张', '受凉'],
+    'Way': ['飞沫传播', '接触传播', '血液传播', '无传染性'],
+    'PreventWay': ['低盐低脂饮食', '规律作息', '适量运动', '勤洗手', '接种疫苗', '戒烟限酒'],
+    'People': ['老年人', '儿童', '孕妇', '肥胖人群', '长期熬夜人群'],
+    'Duration': ['1周', '2-4周', '3个月', '长期'],
+}
+
+# (关系类型, 起点类型, 终点类型, 每个疾病连接的节点数)
+SEED_RELATIONS = [
+    ('BELONG', 'Disease', 'Department', 1), ('HAVE', 'Disease', 'Symptom', 4), ('ACCOMPANY', 'Disease', 'Disease', 2),
+    ('LEAD_TO', 'Cause', 'Disease', 2), ('COMMON_USE', 'Disease', 'Drug', 2), ('EAT', 'Disease', 'Food', 3),
+    ('NO_EAT', 'Disease', 'Food', 2), ('TRANSMIT', 'Disease', 'Way', 1), ('PREVENT', 'PreventWay', 'Disease', 2),
+    ('COMMON_ON', 'Disease', 'People', 2), ('TO_CHECK', 'Check', 'Disease', 2), ('TO_TREAT', 'Treat', 'Disease', 2),
+    ('TREAT_DURATION', 'Disease', 'Duration', 1),
+]
+
+_QUESTION_PATTERN = re.compile(r'用户问题[:：](.*)')
+_NUMBERED_PATTERN = re.compile(r'^\s*\d+\.(.*)$', re.MULTILINE)
+
+
+def _sleep_seconds(latency, rng):
+    '''latency为(均值, 抖动)秒,抖动按均匀分布上下浮动'''
+    mean, jitter = latency
+    return max(0.0, mean + rng.uniform(-jitter, jitter))
+
+
+class FakeLLM:
+    '''
+    按提示词判断所处阶段,返回与真实大模型同格式的输出;script为{问题:data.jsonl中的标注},
+    按标注决定意图和咨询类别,延迟按阶段配置
+    '''
+
+    def __init__(self, graph, script, latency, answer_chunks=20, seed=42):
+        self.graph = graph
+        self.script = script
+        self.latency = latency
+        self.answer_chunks = answer_chunks
+        self._rng = random.Random(seed)
+
+    def _stage(self, prompt):
+        if '意图识别与Cypher生成助手' in prompt:
+            return 'fused'
+        if '请判断以下每个用户问题属于哪种意图' in prompt:
+            return 'batch_intent'
+        if '请判断用户问题属于以下哪种意图' in prompt:
+            return 'intent'
+        if '实体抽取助手' in prompt:
+            return 'extract'
+        if 'Cypher查询生成器' in prompt:
+            return 'cypher'
+        return 'answer'
+
+    def _respond(self, prompt):
+        stage = self._stage(prompt)
+        match = _QUESTION_PATTERN.search(prompt)
+        question = match.group(1).strip() if match else ''
+        sample = self.script.get(question, {})
+        if stage == 'intent':
+            content = self._intent(sample)
+        elif stage == 'batch_intent':
+            # 一次调用判断多个问题,延迟按单个意图识别计
+            questions = _NUMBERED_PATTERN.findall(prompt.split('用户问题列表', 1)[1])
+            content = json.dumps([self._intent(self.script.get(item.strip(), {})) for item in questions])
+            stage = 'intent'
+        elif stage == 'fused':
+            intent = self._intent(sample)
+            result = {'intent': intent, 'request_type': (sample.get('request') or [None])[0] if intent == 'request' else None,
+                      'consult_type': None, 'cypher_query': '', 'entities_to_align': []}
+            if intent == 'consult':
+                # 咨询类别都在预置查询库中,和真实大模型一样只输出类别和实体,输出长度与实体抽取相当
+                result.update(self._cypher_result(question, sample, with_query=False))
+            content = json.dumps(result, ensure_ascii=False)
+        elif stage in ('extract', 'cypher'):
+            content = json.dumps(self._cypher_result(question, sample, with_query=stage == 'cypher'), ensure_ascii=False)
+        else:
+            content = f'根据知识图谱的查询结果,关于“{question}”的建议如下:注意休息,遵医嘱用药,必要时及时就医。'
+        return stage, content
+
+    @staticmethod
+    def _intent(sample):
+        intents = sample.get('intent', [])
+        return 'consult' if 'consult' in intents else ('request' if 'request' in intents else 'unknown')
+
+    def _cypher_result(self, question, sample, with_query):
+        # 没有咨询标注的问题(如本地意图模型误判为consult)按疾病详情处理
+        consult_types = [item for item in sample.get('consult', []) if item in CONSULT_QUERIES] or ['疾病对应详情']
+        consult_type = consult_types[0]
+        labels, cypher = CONSULT_QUERIES[consult_type]
+        entity = self.graph.mention(labels[0], question)
+        result = {'consult_type': consult_type,
+                  'entities_to_align': [{'param_name': 'param_0', 'entity': entity, 'label': labels[0]}]}
+        if with_query:
+            result['cypher_query'] = cypher
+        return result
+
+    def _usage(self, prompt, content):
+        return {'input_tokens': len(prompt), 'output_tokens': len(content), 'total_tokens': len(prompt) + len(content)}
+
+    def invoke(self, prompt, *args, **kwargs):
+        prompt = str(prompt)
+        stage, content = self._respond(prompt)
+        time.sleep(_sleep_seconds(self.latency[stage], self._rng))
+        return AIMessage(content=content, usage_metadata=self._usage(prompt, content))
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        prompt = str(prompt)
+        stage, content = self._respond(prompt)
+        await asyncio.sleep(_sleep_seconds(self.latency[stage], self._rng))
+        return AIMessage(content=content, usage_metadata=self._usage(prompt, content))
+
+    async def astream(self, prompt, *args, **kwargs):
+        '''首个chunk前等待一半延迟(首token时间),其余延迟均摊到各chunk'''
+        prompt = str(prompt)
+        stage, content = self._respond(prompt)
+        total = _sleep_seconds(self.latency[stage], self._rng)
+        step = max(1, len(content) // self.answer_chunks)
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        await asyncio.sleep(total / 2)
+        for piece in pieces:
+            await asyncio.sleep(total / 2 / len(pieces))
+            yield AIMessageChunk(content=piece)
+        yield AIMessageChunk(content='', usage_metadata=self._usage(prompt, content))
+
+
+class FakeEmbeddings:
+    '''按文本哈希生成固定的单位向量,latency模拟bge前向计算耗时(秒/次)'''
+
+    def __init__(self, dimension=512, latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _vector(self, text):
+        seed = int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).standard_normal(self.dimension)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+
+# 单跳的MATCH模式,覆盖预置查询库和实体索引构建用到的所有查询形状
+_NODE = r'\((\w+):(\w+)(?: \{(\w+):\$(\w+)\})?\)'
+_MATCH_PATTERN = re.compile(rf'MATCH {_NODE}(?:-\[:(\w+)\]->{_NODE})?')
+_WHERE_PATTERN = re.compile(r'WHERE (\w+)\.(\w+) = \$(\w+)')
+_RETURN_PATTERN = re.compile(r'(\w+)\.(\w+) AS (\w+)')
+_LIMIT_PATTERN = re.compile(r'LIMIT (\d+)')
+
+
+class InMemoryGraph:
+    '''内存中的合成知识图谱,实现ChatService用到的Neo4jGraph接口(query/refresh_schema/structured_schema)'''
+
+    def __init__(self, embedding_model, latency=0.0, seed=42):
+        self.latency = latency
+        self.structured_schema = {}
+        rng = random.Random(seed)
+        self.nodes = {label: [{LABEL_TEXT_PROPERTY[label]: text, 'embedding': embedding}
+                              for text, embedding in zip(texts, embedding_model.embed_documents(texts))]
+                      for label, texts in SEED_NODES.items()}
+        for node in self.nodes['Disease']:
+            node['desc'] = f"{node['name']}是一种常见疾病。"
+        self.edges = {}
+        for rel_type, start, end, fanout in SEED_RELATIONS:
+            pairs = []
+            for disease in self.nodes['Disease']:
+                others = rng.sample(self.nodes[end if start == 'Disease' else start], fanout)
+                pairs += [(disease, other) if start == 'Disease' else (other, disease) for other in others]
+            self.edges[rel_type] = pairs
+
+    def mention(self, label, question):
+        '''问题中出现的该类型节点文本,没有时按问题哈希取一个(保证同一问题结果稳定)'''
+        texts = [node[LABEL_TEXT_PROPERTY[label]] for node in self.nodes[label]]
+        mentioned = [text for text in texts if text in question]
+        if mentioned:
+            return max(mentioned, key=len)
+        return texts[int(hashlib.md5(question.encode('utf-8')).hexdigest(), 16) % len(texts)]
+
+    def refresh_schema(self):
+        self.structured_schema = {
+            'node_props': {label: [{'property': prop, 'type': 'STRING'} for prop in nodes[0] if prop != 'embedding']
+                           for label, nodes in self.nodes.items()},
+            'rel_props': {},
+            'relationships': [{'start': start, 'type': rel_type, 'end': end}
+                              for rel_type, start, end, _ in SEED_RELATIONS],
+        }
+
+    def query(self, query, params=None):
+        time.sleep(self.latency)
+        return self.run(query, params or {})
+
+    def run(self, query, params):
+        match = _MATCH_PATTERN.search(query)
+        if match is None:
+            raise ValueError(f'不支持的查询形状:{query}')
+        start_var, start_label, start_prop, start_param, rel_type, end_var, end_label, end_prop, end_param = match.groups()
+        if rel_type is None:
+            bindings = [{start_var: node} for node in self.nodes[start_label]]
+        else:
+            bindings = [{start_var: a, end_var: b} for a, b in self.edges.get(rel_type, [])]
+        filters = [(start_var, start_prop, start_param), (end_var, end_prop, end_param)]
+        filters += [(var, prop, param) for var, prop, param in _WHERE_PATTERN.findall(query)]
+        for var, prop, param in filters:
+            if prop is not None:
+                bindings = [binding for binding in bindings if binding[var].get(prop) == params.get(param)]
+        for var, prop in re.findall(r'(\w+)\.(\w+) IS NOT NULL', query):
+            bindings = [binding for binding in bindings if binding[var].get(prop) is not None]
+        limit = _LIMIT_PATTERN.search(query)
+        if limit is not None:
+            bindings = bindings[:int(limit.group(1))]
+        returns = _RETURN_PATTERN.findall(query.split('RETURN', 1)[1])
+        return [{alias: binding[var].get(prop) for var, prop, alias in returns} for binding in bindings]
+
+
+class _Record:
+    def __init__(self, data):
+        self._data = data
+
+    def data(self):
+        return self._data
+
+
+class InMemoryAsyncDriver:
+    def __init__(self, graph):
+        self.graph = graph
+
+    async def execute_query(self, query, parameters=None, *args, **kwargs):
+        await asyncio.sleep(self.graph.latency)
+        return [_Record(row) for row in self.graph.run(query, parameters or {})], None, None
+
+    async def close(self):
+        pass
+
+
+class InMemoryVectorStore:
+    '''单个节点类型的混合检索替身:向量余弦相似度最高的节点'''
+
+    def __init__(self, graph, label):
+        self.graph = graph
+        self.prop = LABEL_TEXT_PROPERTY[label]
+        self.texts = [node[self.prop] for node in graph.nodes[label]]
+        self.vectors = np.asarray([node['embedding'] for node in graph.nodes[label]], dtype=np.float32)
+
+    def _search(self, embedding, k, query):
+        if query in self.texts:
+            return [Document(page_content=query)]
+        scores = self.vectors @ np.asarray(embedding, dtype=np.float32)
+        return [Document(page_content=self.texts[i]) for i in np.argsort(-scores)[:k]]
+
+    def similarity_search_by_vector(self, embedding, k=4, query=None, **kwargs):
+        time.sleep(self.graph.latency)
+        return self._search(embedding, k, query)
+
+    async def asimilarity_search_by_vector(self, embedding, k=4, query=None, **kwargs):
+        await asyncio.sleep(self.graph.latency)
+        return self._search(embedding, k, query)
+
+
+class InMemoryPool:
+    '''替代web.neo4j_pool.Neo4jPool'''
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.async_driver = InMemoryAsyncDriver(graph)
+
+    def vector_store(self, embedding, index_name, **kwargs):
+        label = next(label for label in LABEL_TEXT_PROPERTY
+                     if index_name.lower() == f'{label.lower()}_vector_index')
+        return InMemoryVectorStore(self.graph, label)
+
+    def query(self, cypher, params=None, timeout=None):
+        return self.graph.query(cypher, params)
+
+    async def aquery(self, cypher, params=None, timeout=None):
+        records, _, _ = await self.async_driver.execute_query(cypher, params)
+        return [record.data() for record in records]
+
+    def explain(self, cypher, params=None):
+        time.sleep(self.graph.latency)
+        return self._plan(cypher)
+
+    async def aexplain(self, cypher, params=None):
+        await asyncio.sleep(self.graph.latency)
+        return self._plan(cypher)
+
+    @staticmethod
+    def _plan(cypher):
+        '''起点带属性条件时是索引查找,否则是按标签扫描'''
+        start = _MATCH_PATTERN.search(cypher)
+        operator = 'NodeIndexSeek' if start is not None and start.group(3) else 'NodeByLabelScan'
+        return {'operatorType': 'ProduceResults@neo4j', 'args': {},
+                'children': [{'operatorType': f'{operator}@neo4j', 'args': {}, 'children': []}]}
+
+    def stats(self):
+        idle = {'in_use': 0, 'peak_in_use': 0, 'acquired': 0, 'acquire_timeouts': 0}
+        return {'sync': idle, 'async': idle}
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
@@ -8,5 +8,155 @@ TEMPLATE_DIR = ROOT_DIR / 'src' / 'web' / 'templates'
 NEO4J_CONFIG = {'uri':'neo4j://localhost:7687',
                 'auth':('neo4j','12345678')}
 
+# Neo4j连接池:服务端Neo4jGraph和所有向量索引共用一个driver
+# max_connection_pool_size最大连接数,max_connection_lifetime连接最长存活秒数,connection_acquisition_timeout获取连接等待秒数
+NEO4J_POOL_CONFIG = {'max_connection_pool_size': 50,
+                     'max_connection_lifetime': 3600,
+                     'connection_acquisition_timeout': 60}
+
+# web服务:workers>1时使用gunicorn+UvicornWorker多进程部署,preload=True时embedding模型在master中加载后fork给各worker共享
+# torch_threads为每个worker的torch计算线程数,None表示按CPU核数/worker数自动分配
+WEB_SERVER_CONFIG = {'host': '0.0.0.0',
+                     'port': 8000,
+                     'workers': 1,
+                     'preload': True,
+                     'timeout': 120,
+                     'graceful_timeout': 30,
+                     'torch_threads': None}
+
+# 服务日志级别:DEBUG / INFO / WARNING / ERROR,OFF表示关闭
+LOG_LEVEL = 'INFO'
+
+# 服务启动时并行加载组件(embedding模型、Neo4j连接、12组向量索引等)的线程数
+STARTUP_WORKERS = 8
+
 DEEPSEEK_API_KEY = 'you deepseek api key'
 
+# 大模型后端:type为deepseek / openai_compatible(本机vLLM、Ollama等OpenAI兼容服务) / huggingface(进程内加载的小模型),
+# type以外的键作为模型参数(model、base_url、api_key、temperature、timeout等)
+LLM_BACKENDS = {'deepseek': {'type': 'deepseek', 'model': 'deepseek-chat', 'api_key': DEEPSEEK_API_KEY},
+                'local': {'type': 'openai_compatible', 'model': 'qwen2.5-1.5b-instruct',
+                          'base_url': 'http://localhost:8001/v1', 'timeout': 30},
+                'in_process': {'type': 'huggingface', 'model': 'Qwen/Qwen2.5-0.5B-Instruct', 'max_new_tokens': 256}}
+# 各阶段使用的后端:意图识别、cypher生成/实体抽取可以换成本地小模型,只有生成回答使用大模型;fused为融合调用
+LLM_STAGE_BACKENDS = {'intent': 'deepseek',
+                      'cypher': 'deepseek',
+                      'fused': 'deepseek',
+                      'answer': 'deepseek'}
+
+# 图谱版本号文件:json_sync导入数据、create_index_utils构建索引后会写入新版本,服务端据此刷新schema快照等缓存
+GRAPH_VERSION_PATH = ROOT_DIR / 'data' / 'knowledge_graph' / 'graph_version'
+# 精简后的图谱schema快照(传给大模型生成cypher)
+GRAPH_SCHEMA_CACHE_PATH = ROOT_DIR / 'data' / 'knowledge_graph' / 'schema_snapshot.json'
+
+# 本地意图分类模型(python main.py intent_train 训练生成)
+INTENT_DATA_PATH = ROOT_DIR / 'data' / 'intent_classify' / 'raw' / 'data.jsonl'
+INTENT_MODEL_PATH = ROOT_DIR / 'data' / 'intent_classify' / 'model' / 'intent_model.json'
+# 意图识别方式: llm(仅大模型) / local(仅本地模型) / hybrid(本地模型优先,置信度低于阈值或给不出子类别时再调用大模型)
+INTENT_CLASSIFY_MODE = 'hybrid'
+INTENT_CONFIDENCE_THRESHOLD = 0.8
+
+# 关键词路由:纯事务问题(如“我要挂号”)在调用任何模型之前直接返回功能入口
+REQUEST_ROUTER_ENABLED = True
+
+# 回答缓存:一级按归一化问题精确匹配,二级按bge向量余弦相似度匹配(两个问题提到的图谱实体、本地模型预测的咨询子类别都必须相同,
+# 依赖实体别名表和本地意图模型);查询结果为空或被查询安全检查拒绝时回答不写入缓存
+ANSWER_CACHE_CONFIG = {'enabled': True,
+                       'semantic': True,
+                       'similarity_threshold': 0.95,
+                       'ttl_seconds': 3600,
+                       'max_entries': 10000}
+
+# 查询结果缓存:key为规范化的cypher+对齐后的参数值,总大小超过max_mb(按序列化长度估算)时按LRU淘汰;
+# 每隔version_check_interval秒检查一次图谱版本号,json_sync导入数据后一次清空
+QUERY_CACHE_CONFIG = {'enabled': True,
+                      'max_mb': 64,
+                      'version_check_interval': 5.0}
+
+# 准入控制:每个阶段最多max_concurrency个请求同时调用大模型,最多max_queue个排队,排队超过wait_timeout秒返回503
+ADMISSION_CONFIG = {'enabled': True,
+                    'stages': {'intent': {'max_concurrency': 16, 'max_queue': 64, 'wait_timeout': 5},
+                               'cypher': {'max_concurrency': 16, 'max_queue': 64, 'wait_timeout': 10},
+                               'fused': {'max_concurrency': 16, 'max_queue': 64, 'wait_timeout': 10},
+                               'answer': {'max_concurrency': 16, 'max_queue': 64, 'wait_timeout': 10}}}
+
+# 生成cypher的改写与查询结果精简:RETURN整个节点时不返回embedding属性,最终RETURN补上LIMIT(超过limit时收紧);
+# 生成回答前查询结果最多保留answer_max_rows行,文本属性截断到answer_max_text_chars个字
+CYPHER_GUARD_CONFIG = {'enabled': True,
+                       'limit': 50,
+                       'answer_max_rows': 30,
+                       'answer_max_text_chars': 300}
+
+# 查询安全检查:每条cypher第一次执行前EXPLAIN,执行计划包含reject_operators中的算子或超过max_expand_hops跳的变长扩展时拒绝
+# (无上限的变长关系先改写成最多max_expand_hops跳);timeout为每次查询的事务超时秒数,
+# 超时的查询(cypher+参数值)timeout_ban_seconds秒内不再执行,同一条cypher换了参数照常执行
+QUERY_GUARD_CONFIG = {'plan_check': True,
+                      'reject_operators': ['AllNodesScan', 'CartesianProduct'],
+                      'max_expand_hops': 3,
+                      'timeout': 5.0,
+                      'timeout_ban_seconds': 300,
+                      'verdict_cache_size': 1024}
+
+# 批量问答(/chat/batch):每次最多max_questions个问题,本地模型判断不了意图的问题每intent_batch_size个合并成一次大模型调用
+BATCH_CHAT_CONFIG = {'max_questions': 64,
+                     'intent_batch_size': 20}
+
+# 多轮对话会话(请求带session_id时启用):保存最近几轮consult问题对齐后的实体和查询结果,追问时补全指代、复用对齐结果和查询结果;
+# 有上文的会话不使用回答缓存(同一句追问在不同会话里含义不同);context_turns为拼进提示词的最近轮数;
+# store: memory(进程内,超过max_sessions按LRU淘汰;workers>1时每个worker各有一份,负载均衡需按session_id粘滞路由) /
+#        shelve(本地键值文件shelve_path,重启后仍有效,只按过期清理;只能单进程部署,workers>1时启动报错)
+SESSION_CONFIG = {'enabled': True,
+                  'store': 'memory',
+                  'shelve_path': ROOT_DIR / 'data' / 'sessions' / 'sessions',
+                  'ttl_seconds': 1800,
+                  'max_sessions': 10000,
+                  'max_turns': 10,
+                  'max_kb': 256,
+                  'context_turns': 3}
+
+# 推测执行:意图需要大模型判断时,同时生成cypher并对齐实体(consult占绝大多数),意图不是consult时丢弃,
+# consult问题少等一次大模型往返,代价是request/unknown问题多一次cypher调用;workers为同步chat预先执行用的线程数
+SPECULATIVE_CONSULT_CONFIG = {'enabled': False, 'workers': 16}
+# 融合调用:意图需要大模型判断时,一次调用同时输出意图、事务类别、cypher和待对齐实体(按JSON schema校验),
+# 输出不合格时退回分步调用;开启后优先于推测执行
+FUSED_PROMPT_ENABLED = False
+
+# 预置查询库:21个咨询子类别的手写cypher(web/cypher_library.py),命中时不再由大模型生成cypher
+CYPHER_LIBRARY_ENABLED = True
+# cypher模板:按(咨询子类别,实体节点类型)保存验证通过的cypher,命中后大模型只需抽取实体
+CYPHER_TEMPLATE_ENABLED = True
+CYPHER_TEMPLATE_PATH = ROOT_DIR / 'data' / 'cypher_templates' / 'templates.json'
+# 模板淘汰:保存超过ttl_seconds的模板失效(None表示不过期),命中后连续max_empty_results次查不到结果时删除;
+# 也可以调用 DELETE /cypher_templates 手动删除
+CYPHER_TEMPLATE_EVICTION = {'ttl_seconds': 7 * 24 * 3600,
+                            'max_empty_results': 3}
+
+# 进程内实体对齐索引:名称/描述及其embedding载入NumPy矩阵,本地完成混合检索,不再访问Neo4j
+ENTITY_INDEX_CONFIG = {'enabled': True,
+                       'index_dir': ROOT_DIR / 'data' / 'entity_index',
+                       'rebuild': False}
+
+# 实体精确匹配/别名表:命中时不做向量检索,别名表可自行扩展 {节点类型:{别名:图谱名称}}
+ENTITY_ALIAS_CONFIG = {'enabled': True,
+                       'alias_path': ROOT_DIR / 'data' / 'entity_align' / 'alias.json'}
+
+# 离线benchmark(python main.py benchmark):用假大模型+内存图谱回放data.jsonl中的问题,不需要DeepSeek密钥和Neo4j
+# mode: sync(chat,线程池并发) / async(achat) / stream(astream_chat) / batch(abatch_chat,每批batch_size个问题,并发数为批次数)
+# llm_latency为各阶段大模型调用的(平均延迟, 抖动)秒,embedding_latency/graph_latency为每次调用的延迟秒数
+# speculative/fused:是否开启推测执行(SPECULATIVE_CONSULT_CONFIG)/融合调用(FUSED_PROMPT_ENABLED),可对比开启前后的延迟
+BENCHMARK_CONFIG = {'data_path': INTENT_DATA_PATH,
+                    'limit': 100,
+                    'concurrency': [1, 4, 16, 32],
+                    'mode': 'async',
+                    'batch_size': 16,
+                    'answer_cache': False,
+                    'query_cache': True,
+                    'speculative': False,
+                    'fused': False,
+                    'llm_latency': {'intent': (0.3, 0.1),
+                                    'extract': (0.4, 0.15),
+                                    'cypher': (1.2, 0.4),
+                                    'fused': (0.45, 0.15),
+                                    'answer': (1.5, 0.5)},
+                    'embedding_latency': 0.01,
+                    'graph_latency': 0.003}
@@ -0,0 +1,108 @@
+import json
+import math
+import random
+from collections import defaultdict
+
+
+class IntentClassifier:
+    '''
+    基于字符n-gram特征的多标签逻辑回归(one-vs-rest)分类器。
+    每个标签一个二分类器,可同时预测意图(intent:request/intent:consult)以及事务/咨询子类别,
+    适合"挂号+咨询"这类混合意图的问题。纯Python实现,CPU上单条预测在毫秒以内。
+    '''
+
+    def __init__(self, ngram_range=(1, 3)):
+        self.ngram_range = ngram_range
+        self.labels = []
+        self.weights = {}  # {特征:[每个标签的权重]}
+        self.bias = []
+
+    def extract_features(self, text):
+        '''提取字符n-gram特征(去重),首尾加边界符号'''
+        text = f'^{text.strip().lower()}$'
+        features = set()
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                features.add(text[i:i + n])
+        return features
+
+    def fit(self, texts, label_sets, epochs=15, lr=0.5, l2=1e-5, min_count=2, seed=42):
+        '''
+        :param texts: 文本列表
+        :param label_sets: 每条文本对应的标签集合,如{'intent:consult','consult:疾病对应药物'}
+        :param min_count: 出现次数少于该值的n-gram不作为特征
+        '''
+        self.labels = sorted({label for label_set in label_sets for label in label_set})
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        num_labels = len(self.labels)
+
+        text_features = [self.extract_features(text) for text in texts]
+        feature_counts = defaultdict(int)
+        for features in text_features:
+            for feature in features:
+                feature_counts[feature] += 1
+
+        samples = []
+        for features, label_set in zip(text_features, label_sets):
+            targets = [0.0] * num_labels
+            for label in label_set:
+                targets[label_index[label]] = 1.0
+            features = [feature for feature in features if feature_counts[feature] >= min_count]
+            samples.append((features, targets))
+
+        weights = defaultdict(lambda: [0.0] * num_labels)
+        bias = [0.0] * num_labels
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            step = lr / (1 + epoch * 0.5)
+            for features, targets in samples:
+                rows = [weights[feature] for feature in features]
+                for j in range(num_labels):
+                    z = bias[j]
+                    for row in rows:
+                        z += row[j]
+                    grad = targets[j] - _sigmoid(z)
+                    bias[j] += step * grad
+                    for row in rows:
+                        row[j] += step * (grad - l2 * row[j])
+        self.weights = dict(weights)
+        self.bias = bias
+        return self
+
+    def predict_proba(self, text):
+        '''返回{标签:概率}'''
+        scores = list(self.bias)
+        for feature in self.extract_features(text):
+            row = self.weights.get(feature)
+            if row is None:
+                continue
+            for j, weight in enumerate(row):
+                scores[j] += weight
+        return {label: _sigmoid(score) for label, score in zip(self.labels, scores)}
+
+    def save(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 权重保留6位小数,减小模型文件体积
+        weights = {feature: [round(w, 6) for w in row] for feature, row in self.weights.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'ngram_range': list(self.ngram_range), 'labels': self.labels,
+                       'bias': self.bias, 'weights': weights}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        model = cls(ngram_range=tuple(data['ngram_range']))
+        model.labels = data['labels']
+        model.bias = data['bias']
+        model.weights = data['weights']
+        return model
+
+
+def _sigmoid(z):
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
@@ -0,0 +1,39 @@
+from configuration import config
+from intent_classify.model import IntentClassifier
+
+
+class IntentPredictor:
+    '''加载本地意图分类模型,给出意图、子类别以及置信度'''
+
+    def __init__(self, model_path=None, threshold=0.5):
+        self.model = IntentClassifier.load(model_path or config.INTENT_MODEL_PATH)
+        self.threshold = threshold
+
+    def predict(self, question):
+        '''
+        :return: {'intent':'consult','confidence':0.98,'request':[...],'consult':[...]}
+        intent与ChatService保持一致只取一个:同时包含咨询和事务时按consult处理(事务部分页面有按钮引导);
+        confidence取request/consult两个二分类器中"最不确定"的那个,越接近1说明两个判断都越明确。
+        '''
+        proba = self.model.predict_proba(question)
+        p_request = proba.get('intent:request', 0.0)
+        p_consult = proba.get('intent:consult', 0.0)
+        if p_consult >= self.threshold:
+            intent = 'consult'
+        elif p_request >= self.threshold:
+            intent = 'request'
+        else:
+            intent = 'unknown'
+        confidence = min(max(p_request, 1 - p_request), max(p_consult, 1 - p_consult))
+        return {
+            'intent': intent,
+            'confidence': confidence,
+            'request': self._sub_labels(proba, 'request:'),
+            'consult': self._sub_labels(proba, 'consult:'),
+        }
+
+    def _sub_labels(self, proba, prefix):
+        '''按概率从高到低返回超过阈值的子类别'''
+        hits = [(p, label[len(prefix):]) for label, p in proba.items()
+                if label.startswith(prefix) and p >= self.threshold]
+        return [name for _, name in sorted(hits, reverse=True)]
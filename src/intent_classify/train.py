@@ -0,0 +1,57 @@
+##训练本地意图分类模型(先cd到/src目录下 在终端执行python main.py intent_train)
+import json
+import random
+
+from configuration import config
+from intent_classify.model import IntentClassifier
+
+
+def load_samples(path):
+    '''读取标注数据,把intent/request/consult三类标注合并成带前缀的标签集合'''
+    texts, label_sets = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            label_set = {f'intent:{intent}' for intent in item['intent']}
+            label_set.update(f'request:{name}' for name in item.get('request', []))
+            label_set.update(f'consult:{name}' for name in item.get('consult', []))
+            texts.append(item['text'])
+            label_sets.append(label_set)
+    return texts, label_sets
+
+
+def evaluate(model, texts, label_sets, threshold=0.5):
+    '''意图完全匹配准确率 + 全部标签的micro-F1'''
+    intent_correct = tp = fp = fn = 0
+    for text, gold in zip(texts, label_sets):
+        proba = model.predict_proba(text)
+        pred = {label for label, p in proba.items() if p >= threshold}
+        intent_correct += {l for l in pred if l.startswith('intent:')} == {l for l in gold if l.startswith('intent:')}
+        tp += len(pred & gold)
+        fp += len(pred - gold)
+        fn += len(gold - pred)
+    return {'intent_accuracy': intent_correct / len(texts),
+            'micro_f1': 2 * tp / (2 * tp + fp + fn)}
+
+
+def train(dev_ratio=0.1, seed=42):
+    texts, label_sets = load_samples(config.INTENT_DATA_PATH)
+    samples = list(zip(texts, label_sets))
+    random.Random(seed).shuffle(samples)
+    dev_size = int(len(samples) * dev_ratio)
+    dev, train_samples = samples[:dev_size], samples[dev_size:]
+    print(f'✅ 加载标注数据{len(samples)}条,训练集{len(train_samples)}条,验证集{len(dev)}条')
+
+    model = IntentClassifier().fit(*zip(*train_samples))
+    print(f'🍉验证集评估结果-->{evaluate(model, *zip(*dev))}')
+
+    # 评估完成后用全部数据重新训练再保存
+    model = IntentClassifier().fit(texts, label_sets)
+    model.save(config.INTENT_MODEL_PATH)
+    print(f'🍊意图分类模型已保存-->{config.INTENT_MODEL_PATH}')
+
+
+if __name__ == '__main__':
+    train()
@@ -4,7 +4,17 @@ from argparse import  ArgumentParser
 
 if __name__ == '__main__':
     arg_parse = ArgumentParser(usage='usage:main.py action')
-    arg_parse.add_argument('action',choices=['app'])
+    arg_parse.add_argument('action',choices=['app', 'intent_train', 'benchmark'])
+    # 仅app使用,未指定时取config.WEB_SERVER_CONFIG
+    arg_parse.add_argument('--host')
+    arg_parse.add_argument('--port', type=int)
+    arg_parse.add_argument('--workers', type=int, help='worker进程数,大于1时使用gunicorn多进程部署')
+    # 仅benchmark使用,未指定时取config.BENCHMARK_CONFIG
+    arg_parse.add_argument('--concurrency', type=lambda text: [int(item) for item in text.split(',')],
+                           help='逗号分隔的并发数,如1,4,16')
+    arg_parse.add_argument('--limit', type=int, help='回放的问题数')
+    arg_parse.add_argument('--mode', choices=['sync', 'async', 'stream', 'batch'])
+    arg_parse.add_argument('--output', help='结果保存为json,便于对比改动前后')
 
     args = arg_parse.parse_args()
     action = args.action
@@ -12,4 +22,10 @@ if __name__ == '__main__':
     match action:
         case 'app':
          from web.app import web_serve
-         web_serve()
+         web_serve(host=args.host, port=args.port, workers=args.workers)
+        case 'intent_train':
+         from intent_classify.train import train
+         train()
+        case 'benchmark':
+         from benchmark.run import benchmark
+         benchmark(concurrency=args.concurrency, limit=args.limit, mode=args.mode, output=args.output)
@@ -7,6 +7,7 @@ from datasets import load_dataset
 from neo4j import GraphDatabase
 
 from src.configuration import config
+from src.web.graph_version import bump_graph_version
 
 
 class MedicalKGWriter:
@@ -289,3 +290,7 @@ if __name__ == '__main__':
         kg_writer.write_relations(rel_type, start_label, end_label, relations)
     print(f'医疗知识图谱写入完成！\n共处理{len(dataset)}种疾病,生成{len(all_relations)}条关系') #共处理3776种疾病,生成131791条关系
 
+    # 3.更新图谱版本号,服务端的schema快照等缓存随之失效
+    version = bump_graph_version(config.GRAPH_VERSION_PATH)
+    print(f'✅ 图谱版本号已更新-->{version}')
+
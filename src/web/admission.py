@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+
+class AdmissionRejected(Exception):
+    '''阶段已饱和:排队已满(queue_full)或排队超时(timeout),web层据此直接返回503'''
+
+    def __init__(self, stage, reason):
+        super().__init__(f'{stage} stage saturated: {reason}')
+        self.stage = stage
+        self.reason = reason
+
+
+class _Waiter:
+    '''排队中的请求;同步请求用Event唤醒,异步请求用所属事件循环的future唤醒'''
+    __slots__ = ('granted', 'event', 'loop', 'future')
+
+    def __init__(self, loop=None):
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def wake(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class StageLimiter:
+    '''
+    单个阶段的准入控制:最多max_concurrency个请求同时调用大模型,其余按先来先到排队;
+    排队数达到max_queue时新请求立即拒绝,排队超过wait_timeout秒也拒绝。同步/异步调用共用一份额度
+    '''
+
+    def __init__(self, stage, max_concurrency, max_queue, wait_timeout):
+        self.stage = stage
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.in_flight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds = 0.0
+
+    def _enter(self, waiter):
+        '''有空闲额度时直接占用并返回None,否则排队并返回waiter'''
+        with self._lock:
+            if self.in_flight < self.max_concurrency and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+            if len(self._waiters) >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected(self.stage, 'queue_full')
+            self._waiters.append(waiter)
+            self.peak_queued = max(self.peak_queued, len(self._waiters))
+            return waiter
+
+    def _abandon(self, waiter, timed_out=True):
+        '''等待结束但未被唤醒(超时/取消):仍在队列中则移出并返回False;已被唤醒说明额度已转交,返回True'''
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            if timed_out:
+                self.rejected_timeout += 1
+            return False
+
+    def _granted(self, started):
+        with self._lock:
+            self.admitted += 1
+            self.wait_seconds += time.perf_counter() - started
+
+    def release(self):
+        '''释放额度:有排队请求时直接转交给队首,不经过空闲状态,避免被新请求插队'''
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().wake()
+            else:
+                self.in_flight -= 1
+
+    def acquire(self):
+        waiter = self._enter(_Waiter())
+        if waiter is None:
+            return
+        started = time.perf_counter()
+        if not waiter.event.wait(self.wait_timeout) and not self._abandon(waiter):
+            raise AdmissionRejected(self.stage, 'timeout')
+        self._granted(started)
+
+    async def aacquire(self):
+        waiter = self._enter(_Waiter(asyncio.get_running_loop()))
+        if waiter is None:
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.wait_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise AdmissionRejected(self.stage, 'timeout')
+        except asyncio.CancelledError:
+            # 请求被取消(如客户端断开):已拿到的额度要还回去
+            if self._abandon(waiter, timed_out=False):
+                self.release()
+            raise
+        self._granted(started)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {'max_concurrency': self.max_concurrency,
+                    'in_flight': self.in_flight,
+                    'queued': len(self._waiters),
+                    'peak_queued': self.peak_queued,
+                    'admitted': self.admitted,
+                    'rejected_queue_full': self.rejected_queue_full,
+                    'rejected_timeout': self.rejected_timeout,
+                    'avg_wait_ms': round(self.wait_seconds * 1000 / self.admitted, 2) if self.admitted else 0.0}
+
+
+class AdmissionController:
+    '''按阶段(intent/cypher/answer)分别限制调用大模型的并发数'''
+
+    def __init__(self, stages):
+        self.limiters = {stage: StageLimiter(stage, **stage_config) for stage, stage_config in stages.items()}
+
+    def slot(self, stage):
+        return self.limiters[stage].slot()
+
+    def aslot(self, stage):
+        return self.limiters[stage].aslot()
+
+    def stats(self):
+        return {stage: limiter.stats() for stage, limiter in self.limiters.items()}
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from web.text_utils import dbc2sbc
+
+# 归一化时去掉的空白和标点(问句末尾的问号、句号等不影响语义)
+_PUNCT_PATTERN = re.compile(r'[\s,.!?;:，。！？；：、~～…"“”\'‘’]+')
+
+
+def normalize_question(question):
+    '''全角转半角、转小写、去空白和标点,作为一级缓存的key'''
+    return _PUNCT_PATTERN.sub('', dbc2sbc(question).lower())
+
+
+class AnswerCache:
+    '''
+    ChatService.chat前面的回答缓存,分两级:
+    1.归一化后的问题文本精确匹配;
+    2.未命中时用bge向量做最近邻,余弦相似度不低于阈值、且语义匹配条件semantic_key相同才视为同一个问题
+      (“高血压吃什么药”和“低血压吃什么药”向量几乎一样,但实体不同;“高血压宜吃什么”和“高血压忌吃什么”咨询子类别不同)。
+    条目有TTL,超过max_entries按LRU淘汰;向量存放在预分配的矩阵里,最近邻是一次矩阵乘法。
+    semantic_key由调用方给出(如(咨询子类别,实体集合)),为None时该问题不参与语义匹配,只做精确匹配。
+    '''
+
+    def __init__(self, embedding_model, max_entries=10000, ttl_seconds=3600, similarity_threshold=0.95,
+                 semantic=True):
+        self.embedding_model = embedding_model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.semantic = semantic
+
+        self._entries = OrderedDict()  # {归一化问题:(回答,过期时间,向量槽位,语义匹配条件)},顺序即LRU顺序
+        self._vectors = None  # 第一次写入时按向量维度分配 [max_entries, dim]
+        self._slot_keys = [None] * max_entries  # 槽位-->归一化问题
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.counters = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def lookup(self, question, semantic_key=None):
+        '''
+        :return: (回答或None, probe) 未命中时把probe原样传给store,避免重复计算向量;
+                 回答不应缓存(如查询结果为空)时调用方把probe['cacheable']置为False
+        '''
+        key = normalize_question(question)
+        answer = self._get_exact(key)
+        semantic_key = semantic_key if self.semantic and answer is None else None
+        if semantic_key is None:
+            return self._count(answer, 'exact_hits'), self._probe(key, None, None)
+        vector = self._to_vector(self.embedding_model.embed_query(question))
+        return (self._count(self._get_semantic(vector, semantic_key), 'semantic_hits'),
+                self._probe(key, vector, semantic_key))
+
+    async def alookup(self, question, semantic_key=None):
+        key = normalize_question(question)
+        answer = self._get_exact(key)
+        semantic_key = semantic_key if self.semantic and answer is None else None
+        if semantic_key is None:
+            return self._count(answer, 'exact_hits'), self._probe(key, None, None)
+        vector = self._to_vector(await self.embedding_model.aembed_query(question))
+        return (self._count(self._get_semantic(vector, semantic_key), 'semantic_hits'),
+                self._probe(key, vector, semantic_key))
+
+    def store(self, probe, answer):
+        if not probe['cacheable']:
+            return
+        key, vector, semantic_key = probe['key'], probe['vector'], probe['semantic_key']
+        if semantic_key is not None and vector is None:
+            vector = self._to_vector(self.embedding_model.embed_query(key))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.counters['evictions'] += 1
+            slot = None
+            if vector is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                slot = self._free_slots.pop()
+                self._vectors[slot] = vector
+                self._slot_keys[slot] = key
+            self._entries[key] = (answer, time.monotonic() + self.ttl_seconds, slot, semantic_key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['exact_hits'] + self.counters['semantic_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return {**self.counters, 'size': len(self._entries), 'hit_rate': hits / lookups if lookups else 0.0}
+
+    def _get_exact(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                self._remove(key)
+                self.counters['expirations'] += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _get_semantic(self, vector, semantic_key):
+        '''相似度不低于阈值的条目按相似度从高到低检查:跳过(并清理)已过期的,返回第一个语义匹配条件相同的条目的回答'''
+        with self._lock:
+            if self._vectors is None or not self._entries:
+                return None
+            # 向量已归一化,点积即余弦相似度;空槽位是全0向量,相似度为0不会被选中
+            scores = self._vectors @ vector
+            candidates = np.flatnonzero(scores >= self.similarity_threshold)
+            now = time.monotonic()
+            for slot in candidates[np.argsort(-scores[candidates])]:
+                key = self._slot_keys[slot]
+                answer, expires_at, _, cached_key = self._entries[key]
+                if expires_at < now:
+                    self._remove(key)
+                    self.counters['expirations'] += 1
+                elif cached_key == semantic_key:
+                    self._entries.move_to_end(key)
+                    return answer
+            return None
+
+    @staticmethod
+    def _probe(key, vector, semantic_key):
+        return {'key': key, 'vector': vector, 'semantic_key': semantic_key, 'cacheable': True}
+
+    def _remove(self, key):
+        _, _, slot, _ = self._entries.pop(key)
+        if slot is not None:
+            self._vectors[slot] = 0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def _count(self, answer, hit_counter):
+        with self._lock:
+            self.counters[hit_counter if answer is not None else 'misses'] += 1
+        return answer
+
+    @staticmethod
+    def _to_vector(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
@@ -1,29 +1,173 @@
 
 
+import json
+import logging
+
 import uvicorn
-from fastapi import FastAPI
-from starlette.responses import RedirectResponse
+from fastapi import FastAPI, Request
+from starlette.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from starlette.staticfiles import StaticFiles
 
 from configuration import config
+from web.admission import AdmissionRejected
 from web.schema import Question, Answer
 from web.server import ChatService
+from web.session_store import check_session_config
+
+
+def setup_logging():
+    '''服务日志(web.*、intent_classify.*):LOG_LEVEL设为OFF时关闭'''
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(name)s] %(message)s'))
+    for name in ('web', 'intent_classify'):
+        logger = logging.getLogger(name)
+        logger.handlers[:] = [handler]
+        logger.propagate = False
+        logger.disabled = config.LOG_LEVEL == 'OFF'
+        if not logger.disabled:
+            logger.setLevel(config.LOG_LEVEL)
 
+setup_logging()
 app = FastAPI()
 app.mount("/static", StaticFiles(directory=config.TEMPLATE_DIR), name="static")
-service = ChatService()
+# 只做轻量初始化,模型和索引在startup事件中后台并行加载,加载期间/ready可用于健康检查
+service = ChatService(lazy=True)
+
+def warming_up_response():
+    return JSONResponse(status_code=503, headers={'Retry-After': '5'},
+                        content={'message': '服务正在预热中,请稍后再试', **service.readiness()})
+
+@app.exception_handler(AdmissionRejected)
+def admission_rejected(request: Request, exc: AdmissionRejected):
+    # 大模型调用已饱和:快速失败,由客户端稍后重试,不在服务端无限排队
+    return JSONResponse(status_code=503, headers={'Retry-After': '1'},
+                        content={'message': '当前咨询人数较多,请稍后再试', 'stage': exc.stage, 'reason': exc.reason})
+
 @app.get('/')
 def read_root():
     return RedirectResponse('/static/index.html')
 
 @app.post('/chat')
-def read_item(question:Question)->Answer:
-    result = service.chat(question.message)
+async def read_item(question:Question)->Answer:
+    if not service.is_ready():
+        return warming_up_response()
+    result = await service.achat(question.message, session_id=question.session_id)
     return Answer(message=result)
 
+@app.post('/chat/batch')
+async def batch_items(questions:list[Question])->list[Answer]:
+    '''一次提交多个问题(分诊系统对接、夜间批量测试),回答与问题顺序一致;各问题按单轮问答处理,不使用session_id'''
+    if not service.is_ready():
+        return warming_up_response()
+    max_questions = config.BATCH_CHAT_CONFIG['max_questions']
+    if len(questions) > max_questions:
+        return JSONResponse(status_code=413, content={'message': f'每次最多提交{max_questions}个问题'})
+    answers = await service.abatch_chat([question.message for question in questions])
+    return [Answer(message=answer) for answer in answers]
+
+@app.post('/chat/stream')
+async def stream_item(question:Question):
+    if not service.is_ready():
+        return warming_up_response()
+    async def event_stream():
+        # Server-Sent Events:每个事件一行event+一行data(JSON),空行分隔
+        try:
+            async for event in service.astream_chat(question.message, session_id=question.session_id):
+                data = json.dumps(event['data'], ensure_ascii=False)
+                yield f"event: {event['event']}\ndata: {data}\n\n"
+        except AdmissionRejected as e:
+            # 响应头已经发出,饱和时改为推送error事件
+            data = json.dumps({'message': '当前咨询人数较多,请稍后再试', 'stage': e.stage, 'reason': e.reason},
+                              ensure_ascii=False)
+            yield f"event: error\ndata: {data}\n\n"
+    return StreamingResponse(event_stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.get('/ready')
+def ready():
+    '''就绪检查:返回各组件加载状态,未就绪时状态码503'''
+    readiness = service.readiness()
+    return JSONResponse(status_code=200 if readiness['ready'] else 503, content=readiness)
+
+@app.get('/cache/stats')
+def cache_stats():
+    return service.answer_cache.stats() if service.answer_cache is not None else {'enabled': False}
+
+@app.get('/query_cache/stats')
+def query_cache_stats():
+    '''图谱查询结果缓存:命中率、占用内存、因图谱版本变化清空的次数'''
+    return service.query_cache.stats() if service.query_cache is not None else {'enabled': False}
+
+@app.delete('/session/{session_id}')
+def delete_session(session_id: str):
+    '''清空会话上下文(前端“新对话”),之后的提问不再带上文'''
+    if service.session_store is not None:
+        service.session_store.delete(session_id)
+    return {'session_id': session_id}
+
+@app.get('/session/stats')
+def session_stats():
+    '''多轮会话:保存中的会话数、过期/淘汰的会话数、超出上限被丢弃的轮次'''
+    return service.session_store.stats() if service.session_store is not None else {'enabled': False}
+
+@app.get('/cypher_templates/stats')
+def cypher_template_stats():
+    '''cypher模板:模板数、命中/未命中次数、过期/淘汰的模板数'''
+    return service.cypher_templates.stats() if service.cypher_templates is not None else {'enabled': False}
+
+@app.delete('/cypher_templates')
+def evict_cypher_templates(consult_type: str | None = None, labels: str | None = None):
+    '''删除查错的cypher模板:不带参数时全部删除,labels为逗号分隔的节点类型(与模板保存时的顺序一致)'''
+    if service.cypher_templates is None:
+        return {'evicted': 0}
+    return {'evicted': service.cypher_templates.evict(consult_type, labels.split(',') if labels else None)}
+
+@app.get('/metrics')
+def metrics():
+    '''Prometheus文本格式:各阶段耗时直方图、大模型token数、准入控制/缓存/连接池状态'''
+    return PlainTextResponse(service.metrics.render(), media_type='text/plain; version=0.0.4')
+
+@app.get('/admission/stats')
+def admission_stats():
+    '''各阶段准入控制状态:并发数、排队深度、拒绝次数'''
+    return service.admission.stats() if service.admission is not None else {'enabled': False}
+
+@app.get('/query_guard/stats')
+def query_guard_stats():
+    '''查询安全检查:EXPLAIN/改写/拒绝/超时次数,以及最近被拒绝的查询'''
+    return service.query_guard.stats()
+
+@app.get('/neo4j/pool/stats')
+def neo4j_pool_stats():
+    return service.neo4j_pool.stats() if service.neo4j_pool is not None else {'connected': False}
+
+@app.on_event('startup')
+def start_service():
+    service.start()
+
+@app.on_event('shutdown')
+async def close_service():
+    if service.neo4j_pool is not None:
+        await service.neo4j_pool.aclose()
+        service.neo4j_pool.close()
+    if service.session_store is not None:
+        service.session_store.close()
+    if service.cypher_templates is not None:
+        # 写入后台线程还没来得及保存的模板
+        service.cypher_templates.close()
+
 
-def web_serve():
-    uvicorn.run('web.app:app',host='0.0.0.0',port=8000)
+def web_serve(host=None, port=None, workers=None):
+    server_config = config.WEB_SERVER_CONFIG
+    host = host or server_config['host']
+    port = port or server_config['port']
+    workers = workers or server_config['workers']
+    check_session_config(config.SESSION_CONFIG, workers)
+    if workers > 1:
+        from web.multiworker import serve
+        serve(host, port, workers)
+        return
+    uvicorn.run('web.app:app', host=host, port=port)
 
 if __name__ == '__main__':
     web_serve()
\ No newline at end of file
@@ -5,6 +5,7 @@ from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_neo4j import Neo4jGraph
 
 from src.configuration import config
+from src.web.graph_version import bump_graph_version
 
 
 class IndexUtil:
@@ -23,6 +24,18 @@ class IndexUtil:
         self.graph.query(cypher)
         print(f'🍉{label}全文索引cypher语句-->{cypher}')
 
+    def create_property_index(self,index_name,label,property,index_type='RANGE'):
+        '''
+        属性索引:预置查询库(web/cypher_library.py)按name/desc精确匹配起点节点时走索引。
+        desc是长文本,可能超出RANGE索引的键长度上限,用TEXT索引(同样支持等值查找)
+        '''
+        cypher = f'''
+                CREATE {index_type} INDEX {index_name} IF NOT EXISTS
+                FOR (n:{label}) ON (n.{property})
+        '''
+        self.graph.query(cypher)
+        print(f'🍓{label}属性索引cypher语句-->{cypher}')
+
     def create_vector_index(self,index_name,label,source_property,embedding_property):
         embedding_dim = self._add_embedding(label,source_property,embedding_property)
         cypher=f'''
@@ -128,6 +141,13 @@ if __name__ == '__main__':
     index_util.create_vector_index('duration_vector_index','Duration','desc','embedding')
     print('🍊治疗周期节点--索引(全文+向量)已创建')
 
+    #13.属性索引(name/desc精确匹配)
+    for label,property in [('Disease','name'),('Department','name'),('Symptom','name'),('Cause','desc'),
+                           ('Drug','name'),('Food','name'),('Way','desc'),('PreventWay','desc'),
+                           ('Check','name'),('Treat','name'),('People','desc'),('Duration','desc')]:
+        index_type = 'TEXT' if property == 'desc' else 'RANGE'
+        index_util.create_property_index(f'{label[0].lower()}{label[1:]}_{property}_index',label,property,index_type)
+    print('🍊属性索引已创建')
 
-
-
+    # 新增了embedding属性和索引,更新图谱版本号
+    bump_graph_version(config.GRAPH_VERSION_PATH)
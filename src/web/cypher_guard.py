@@ -0,0 +1,200 @@
+import json
+import re
+
+from neo4j.graph import Node, Path, Relationship
+
+# 执行前改写大模型生成的cypher,执行后精简查询结果再交给大模型生成回答:
+# 1.RETURN整个节点或路径时去掉embedding属性(512维向量),不再经Bolt传回;
+# 2.最终RETURN没有LIMIT时补上(返回项全是聚合的除外),LIMIT过大或不是整数常量(如LIMIT $n)时收紧;
+# 3.查询结果去掉向量、截断长文本、限制行数,合并各行相同的列,减少回答提示词的token
+
+_UNION_PATTERN = re.compile(r'\bUNION(?:\s+ALL)?\b', re.IGNORECASE)
+_RETURN_PATTERN = re.compile(r'\bRETURN\b', re.IGNORECASE)
+_TAIL_PATTERN = re.compile(r'(?<![$.\w])(?:ORDER\s+BY|SKIP|LIMIT)\b', re.IGNORECASE)
+_LIMIT_PATTERN = re.compile(r'(?<![$.\w])LIMIT\b', re.IGNORECASE)
+_DISTINCT_PATTERN = re.compile(r'^\s*DISTINCT\b', re.IGNORECASE)
+_ALIAS_PATTERN = re.compile(r'\s+AS\s+', re.IGNORECASE)
+# 聚合函数:返回项全部是聚合时(RETURN count(d))结果只有一行,不需要LIMIT
+_AGGREGATE_PATTERN = re.compile(r'(?:count|sum|avg|min|max|collect|stDev|stDevP|percentileCont|percentileDisc)\s*\(.*\)',
+                                re.IGNORECASE | re.DOTALL)
+# 模式中声明的节点变量:(d:Disease ...)、(d {...})、(d)
+_NODE_VARIABLE_PATTERN = re.compile(r'\(\s*(\w+)\s*(?=[:{)])')
+# 模式中声明的路径变量:p = (a)-[]->(b)、p = shortestPath((a)-[*]-(b))
+_PATH_VARIABLE_PATTERN = re.compile(r'\b(\w+)\s*=\s*(?:(?:all)?shortestPath\s*\(\s*)?\(', re.IGNORECASE)
+_PROPERTIES_PATTERN = re.compile(r'\bproperties\(\s*(\w+)\s*\)', re.IGNORECASE)
+_WHOLE_NODE_PATTERN = re.compile(r'((?:collect\(\s*(?:DISTINCT\s+)?)?)(\w+)(\s*\)?)', re.IGNORECASE)
+
+VECTOR_PROPERTIES = {'embedding'}
+# 查询结果中长度超过该值的纯数字列表视为向量,不交给大模型
+_VECTOR_MIN_LENGTH = 16
+
+
+def _split_top_level(text, separator=','):
+    '''按不在括号/字符串内的分隔符切分'''
+    parts, depth, quote, start = [], 0, None, 0
+    for i, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _top_level_match(pattern, text, last=False):
+    '''pattern在括号/字符串外的第一个(last=True时最后一个)匹配'''
+    found = None
+    for match in pattern.finditer(text):
+        if _is_top_level(text, match.start()):
+            if not last:
+                return match
+            found = match
+    return found
+
+
+def _is_top_level(text, position):
+    depth, quote = 0, None
+    for char in text[:position]:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+    return depth == 0 and quote is None
+
+
+def _project_item(item, node_variables, path_variables):
+    '''
+    返回项里的整个节点改写成去掉向量属性的map投影,整条路径改写成{nodes:[节点投影], relationships:[关系类型]};
+    直接返回向量属性的项返回None
+    '''
+    parts = _ALIAS_PATTERN.split(item, maxsplit=1)
+    expression = original = parts[0].strip()
+    if any(re.fullmatch(rf'\w+\.{prop}', expression) for prop in VECTOR_PROPERTIES):
+        return None
+    excluded = ', '.join(f'{prop}: null' for prop in sorted(VECTOR_PROPERTIES))
+    expression = _PROPERTIES_PATTERN.sub(lambda m: f'{m.group(1)} {{.*, {excluded}}}', expression)
+    # 只改写直接返回的节点d和collect(d),labels(d)、count(d)等函数参数保持不变
+    whole_node = _WHOLE_NODE_PATTERN.fullmatch(expression)
+    if whole_node is not None and whole_node.group(2) in path_variables:
+        path = whole_node.group(2)
+        expression = (f'{whole_node.group(1)}{{nodes: [node_ IN nodes({path}) | node_ {{.*, {excluded}}}], '
+                      f'relationships: [rel_ IN relationships({path}) | type(rel_)]}}{whole_node.group(3)}')
+    elif whole_node is not None and whole_node.group(2) in node_variables:
+        expression = f'{whole_node.group(1)}{whole_node.group(2)} {{.*, {excluded}}}{whole_node.group(3)}'
+    if len(parts) > 1:
+        return f'{expression} AS {parts[1].strip()}'
+    if expression == original:
+        return expression
+    # 没有别名的返回项以表达式文本作为列名,改写后保持原来的列名
+    return f'{expression} AS {original if original.isidentifier() else "`" + original + "`"}'
+
+
+def _is_aggregate_only(items_text):
+    items = [_ALIAS_PATTERN.split(item, maxsplit=1)[0].strip() for item in _split_top_level(items_text)]
+    return all(_AGGREGATE_PATTERN.fullmatch(item) for item in items)
+
+
+def _guard_part(cypher, limit):
+    return_match = _top_level_match(_RETURN_PATTERN, cypher, last=True)
+    if return_match is None:
+        return cypher
+    head, body = cypher[:return_match.end()], cypher[return_match.end():]
+    tail_match = _top_level_match(_TAIL_PATTERN, body)
+    items_text, tail = (body[:tail_match.start()], body[tail_match.start():]) if tail_match else (body, '')
+
+    distinct = _DISTINCT_PATTERN.match(items_text)
+    prefix = ' DISTINCT' if distinct else ''
+    items_text = items_text[distinct.end():] if distinct else items_text
+    node_variables = set(_NODE_VARIABLE_PATTERN.findall(head))
+    path_variables = set(_PATH_VARIABLE_PATTERN.findall(head))
+    items = [item for item in (_project_item(item, node_variables, path_variables)
+                               for item in _split_top_level(items_text)) if item is not None]
+    if items and items_text.strip() != '*':
+        body = f'{prefix} {", ".join(items)}'
+    else:
+        body = f'{prefix} {items_text.strip()}'
+
+    tail = tail.strip()
+    if _is_aggregate_only(items_text):
+        return f'{head}{body} {tail}'.rstrip()
+    limit_match = _top_level_match(_LIMIT_PATTERN, tail, last=True)
+    if limit_match is None:
+        tail = f'{tail} LIMIT {limit}'.strip()
+    else:
+        # LIMIT $n、LIMIT 10*10等无法在改写时确定大小,一律换成上限
+        value = tail[limit_match.end():].strip()
+        if not value.isdigit() or int(value) > limit:
+            tail = tail[:limit_match.start()] + f'LIMIT {limit}'
+    return f'{head}{body} {tail}'
+
+
+def guard_cypher(cypher, limit):
+    '''改写生成的cypher:RETURN整个节点时不返回向量属性,最终RETURN补上/收紧LIMIT(UNION的每个分支分别处理)'''
+    cypher = cypher.strip().rstrip(';').strip()
+    separators = [match for match in _UNION_PATTERN.finditer(cypher) if _is_top_level(cypher, match.start())]
+    parts, start = [], 0
+    for match in separators:
+        parts.append(_guard_part(cypher[start:match.start()].strip(), limit))
+        parts.append(match.group(0))
+        start = match.end()
+    parts.append(_guard_part(cypher[start:].strip(), limit))
+    return ' '.join(parts)
+
+
+def _condense_value(value, max_text_chars):
+    # 未经record.data()转换的neo4j图对象:节点/关系取属性,路径展开成[节点,关系类型,节点,...]
+    if isinstance(value, Path):
+        value = [value.start_node] + [item for relationship, node in zip(value.relationships, value.nodes[1:])
+                                      for item in (relationship.type, node)]
+    elif isinstance(value, Relationship):
+        value = [value.start_node, value.type, value.end_node]
+    elif isinstance(value, Node):
+        value = dict(value)
+    if isinstance(value, dict):
+        return {key: _condense_value(item, max_text_chars) for key, item in value.items()
+                if key not in VECTOR_PROPERTIES and not _is_vector(item)}
+    # record.data()把关系转换成(起点属性,关系类型,终点属性)元组
+    if isinstance(value, (list, tuple)):
+        return [_condense_value(item, max_text_chars) for item in value if not _is_vector(item)]
+    if isinstance(value, str) and len(value) > max_text_chars:
+        return value[:max_text_chars] + '…'
+    return value
+
+
+def _is_vector(value):
+    return (isinstance(value, list) and len(value) >= _VECTOR_MIN_LENGTH
+            and all(isinstance(item, float) for item in value))
+
+
+def condense_rows(rows, max_rows, max_text_chars):
+    '''
+    精简查询结果,返回交给回答提示词的文本:去掉向量、截断长文本、最多保留max_rows行;
+    各行取值相同的列只输出一次,例如[{疾病:高血压,药物:A},{疾病:高血压,药物:B}]-->{疾病:高血压,药物:[A,B]}
+    '''
+    total = len(rows)
+    rows = [_condense_value(row, max_text_chars) for row in rows[:max_rows]]
+    condensed = rows
+    if len(rows) > 1 and all(isinstance(row, dict) and row.keys() == rows[0].keys() for row in rows):
+        constant = {key: value for key, value in rows[0].items() if all(row[key] == value for row in rows)}
+        varying = [key for key in rows[0] if key not in constant]
+        if constant and len(varying) == 1:
+            condensed = {**constant, varying[0]: [row[varying[0]] for row in rows]}
+        elif constant and varying:
+            condensed = {**constant, 'rows': [{key: row[key] for key in varying} for row in rows]}
+    text = json.dumps(condensed, ensure_ascii=False, default=str)
+    if total > max_rows:
+        text += f'(共{total}条,仅列出前{max_rows}条)'
+    return text
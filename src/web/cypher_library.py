@@ -0,0 +1,55 @@
+# 21个咨询子类别对应的手写参数化cypher,关系方向与table_sync/json_sync.py写入时一致。
+# 起点都是按name/desc精确匹配的单个节点,配合create_index_utils.py里创建的属性索引走索引查找,不会全标签扫描。
+LIBRARY_LIMIT = 50
+
+
+def _disease_to(rel_type, label, prop='name', alias='item'):
+    '''(疾病)-[关系]->(目标) 由疾病查目标'''
+    return (f'MATCH (d:Disease {{name:$param_0}})-[:{rel_type}]->(x:{label}) '
+            f'RETURN d.name AS disease, x.{prop} AS {alias} LIMIT {LIBRARY_LIMIT}')
+
+
+def _to_disease(rel_type, label, prop='name', alias='item'):
+    '''(来源)-[关系]->(疾病) 由疾病查来源'''
+    return (f'MATCH (x:{label})-[:{rel_type}]->(d:Disease {{name:$param_0}}) '
+            f'RETURN d.name AS disease, x.{prop} AS {alias} LIMIT {LIBRARY_LIMIT}')
+
+
+def _diseases_by(pattern, prop='name', alias='item'):
+    '''由其它实体反查疾病,pattern里用s表示起点实体、d表示疾病'''
+    return (f'MATCH {pattern} WHERE s.{prop} = $param_0 '
+            f'RETURN s.{prop} AS {alias}, d.name AS disease LIMIT {LIBRARY_LIMIT}')
+
+
+# {咨询子类别:(实体节点类型, cypher)}
+CONSULT_QUERIES = {
+    "疾病对应详情": (('Disease',), 'MATCH (d:Disease {name:$param_0}) RETURN d.name AS disease, d.desc AS description'),
+    "疾病对应科室": (('Disease',), _disease_to('BELONG', 'Department', alias='department')),
+    "疾病对应症状": (('Disease',), _disease_to('HAVE', 'Symptom', alias='symptom')),
+    "疾病对应并发症": (('Disease',), _disease_to('ACCOMPANY', 'Disease', alias='accompany')),
+    "疾病对应诱因": (('Disease',), _to_disease('LEAD_TO', 'Cause', prop='desc', alias='cause')),
+    "疾病对应药物": (('Disease',), _disease_to('COMMON_USE', 'Drug', alias='drug')),
+    "疾病宜食用": (('Disease',), _disease_to('EAT', 'Food', alias='food')),
+    "疾病忌食用": (('Disease',), _disease_to('NO_EAT', 'Food', alias='food')),
+    "疾病对应传播途径": (('Disease',), _disease_to('TRANSMIT', 'Way', prop='desc', alias='way')),
+    "疾病对应预防措施": (('Disease',), _to_disease('PREVENT', 'PreventWay', prop='desc', alias='prevent_way')),
+    "疾病对应易感人群": (('Disease',), _disease_to('COMMON_ON', 'People', prop='desc', alias='people')),
+    "疾病对应检查": (('Disease',), _to_disease('TO_CHECK', 'Check', alias='check_item')),
+    "疾病对应治疗方式": (('Disease',), _to_disease('TO_TREAT', 'Treat', alias='treat')),
+    "疾病对应治疗周期": (('Disease',), _disease_to('TREAT_DURATION', 'Duration', prop='desc', alias='duration')),
+    "症状解读": (('Symptom',), _diseases_by('(d:Disease)-[:HAVE]->(s:Symptom)', alias='symptom')),
+    "诱因导致疾病": (('Cause',), _diseases_by('(s:Cause)-[:LEAD_TO]->(d:Disease)', prop='desc', alias='cause')),
+    "药物用于疾病": (('Drug',), _diseases_by('(d:Disease)-[:COMMON_USE]->(s:Drug)', alias='drug')),
+    "食物益于疾病": (('Food',), _diseases_by('(d:Disease)-[:EAT]->(s:Food)', alias='food')),
+    "食物忌于疾病": (('Food',), _diseases_by('(d:Disease)-[:NO_EAT]->(s:Food)', alias='food')),
+    "人群类别易感疾病": (('People',), _diseases_by('(d:Disease)-[:COMMON_ON]->(s:People)', prop='desc', alias='people')),
+    "检查项目用于疾病": (('Check',), _diseases_by('(s:Check)-[:TO_CHECK]->(d:Disease)', alias='check_item')),
+}
+
+
+def get_library_query(consult_type, labels):
+    '''子类别和实体节点类型都对得上时返回预置cypher,否则返回None'''
+    entry = CONSULT_QUERIES.get(consult_type)
+    if entry is None or entry[0] != tuple(labels):
+        return None
+    return entry[1]
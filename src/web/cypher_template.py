@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_PARAM_PATTERN = re.compile(r'\$(param_\d+)\b')
+
+
+def canonicalize(cypher, entities_to_align):
+    '''
+    统一参数顺序:实体按(节点类型,原顺序)排序后依次改名为param_0,param_1...,
+    这样同一类问题无论大模型怎么给参数编号,得到的模板都相同。
+    :return: (规范化后的cypher, 规范化后的实体列表)
+    '''
+    ordered = sorted(enumerate(entities_to_align), key=lambda item: (item[1]['label'], item[0]))
+    rename = {}
+    entities = []
+    for new_index, (_, item) in enumerate(ordered):
+        rename[item['param_name']] = f'param_{new_index}'
+        entities.append({**item, 'param_name': f'param_{new_index}'})
+    cypher = _PARAM_PATTERN.sub(lambda m: '$' + rename.get(m.group(1), m.group(1)), cypher)
+    return cypher, entities
+
+
+def is_reusable(cypher, entities_to_align):
+    '''
+    判断生成的cypher能否作为模板:参数恰好是待对齐实体的param_name,
+    且没有把实体名直接写死在语句里(否则换一个疾病就查错了)。
+    '''
+    if not entities_to_align:
+        return False
+    if set(_PARAM_PATTERN.findall(cypher)) != {item['param_name'] for item in entities_to_align}:
+        return False
+    return not any(item['entity'] and item['entity'] in cypher for item in entities_to_align)
+
+
+class CypherTemplateStore:
+    '''
+    经过验证的Cypher模板,按(咨询子类别,实体节点类型)索引,持久化为JSON文件。
+    模板在查询成功且有结果后才写入,重启后继续复用。
+    “查到结果”不代表cypher一定正确,所以模板不是永久有效:保存超过ttl_seconds后失效(None表示不过期),
+    命中后连续max_empty_results次查不到结果时淘汰,也可以用evict手动删除。
+    get/put等在事件循环中调用,只修改内存并标记待保存,由后台线程每隔flush_interval秒写一次文件
+    '''
+
+    def __init__(self, path, ttl_seconds=None, max_empty_results=3, flush_interval=5.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_empty_results = max_empty_results
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 后台线程和close不同时写文件
+        self._dirty = False
+        self._flusher = None
+        self._closed = threading.Event()
+        self._templates = {}  # {(咨询子类别,(节点类型,...)):{'cypher':...,'hits':...,'empty':...,'created':...}}
+        self.counters = {'hits': 0, 'misses': 0, 'saved': 0, 'expired': 0, 'evicted': 0}
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                for item in json.load(f):
+                    key = (item['consult_type'], tuple(item['labels']))
+                    self._templates[key] = {'cypher': item['cypher'], 'hits': item.get('hits', 0),
+                                            'empty': item.get('empty', 0), 'created': item.get('created', 0)}
+
+    def label_sets(self, consult_type):
+        '''某个咨询子类别下已有模板的节点类型组合'''
+        with self._lock:
+            self._expire()
+            return [labels for (c_type, labels) in self._templates if c_type == consult_type]
+
+    def get(self, consult_type, labels):
+        with self._lock:
+            self._expire()
+            template = self._templates.get((consult_type, tuple(labels)))
+            if template is None:
+                self.counters['misses'] += 1
+                return None
+            template['hits'] += 1
+            self.counters['hits'] += 1
+            return template['cypher']
+
+    def report(self, consult_type, labels, has_rows):
+        '''模板命中后的查询结果:查到结果时清零计数,连续max_empty_results次没有结果时淘汰该模板'''
+        key = (consult_type, tuple(labels))
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                return
+            template['empty'] = 0 if has_rows else template['empty'] + 1
+            if template['empty'] >= self.max_empty_results:
+                del self._templates[key]
+                self.counters['evicted'] += 1
+                self._mark_dirty()
+
+    def evict(self, consult_type=None, labels=None):
+        '''删除模板:不指定条件时全部删除,只指定consult_type时删除该子类别下的全部模板;返回删除的个数'''
+        with self._lock:
+            keys = [key for key in self._templates
+                    if consult_type in (None, key[0]) and (labels is None or key[1] == tuple(labels))]
+            for key in keys:
+                del self._templates[key]
+            if keys:
+                self.counters['evicted'] += len(keys)
+                self._mark_dirty()
+            return len(keys)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'size': len(self._templates)}
+
+    def put(self, consult_type, cypher, labels):
+        key = (consult_type, tuple(labels))
+        with self._lock:
+            if key in self._templates:
+                return
+            self._templates[key] = {'cypher': cypher, 'hits': 0, 'empty': 0, 'created': time.time()}
+            self.counters['saved'] += 1
+            self._mark_dirty()
+
+    def flush(self):
+        '''有未保存的修改时写入文件'''
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                items = [{'consult_type': c_type, 'labels': list(labels), **template}
+                         for (c_type, labels), template in self._templates.items()]
+                self._dirty = False
+            try:
+                self._save(items)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f'⚠️cypher模板保存失败,稍后重试-->{e!r}')
+
+    def _save(self, items):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 先写临时文件再替换,避免进程中途退出留下半个文件;
+        # 临时文件名每次不同,多个worker同时保存时不会互相覆盖对方写了一半的临时文件
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.path.parent, prefix=self.path.name + '.',
+                                         suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            try:
+                json.dump(items, f, ensure_ascii=False, indent=2)
+            except BaseException:
+                f.close()
+                os.unlink(tmp_path)
+                raise
+        os.replace(tmp_path, self.path)
+
+    # 以下方法在持有锁时调用
+    def _mark_dirty(self):
+        self._dirty = True
+        # 第一次修改时才启动后台线程(多进程部署时在各worker中启动)
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_periodically, name='cypher-template-flush',
+                                             daemon=True)
+            self._flusher.start()
+
+    def _expire(self):
+        if self.ttl_seconds is None:
+            return
+        deadline = time.time() - self.ttl_seconds
+        expired = [key for key, template in self._templates.items() if template['created'] < deadline]
+        for key in expired:
+            del self._templates[key]
+        if expired:
+            self.counters['expired'] += len(expired)
+            self._mark_dirty()
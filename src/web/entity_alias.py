@@ -0,0 +1,71 @@
+import json
+import logging
+import re
+
+from web.text_utils import dbc2sbc, to_simplified
+
+logger = logging.getLogger(__name__)
+
+_SPACE_PATTERN = re.compile(r'\s+')
+# mentions只查找这个长度范围内的名称:单字名称误命中太多,长描述(Cause/Way等的desc)不会整句出现在问题里
+_MENTION_MIN_LENGTH = 2
+_MENTION_MAX_LENGTH = 12
+
+
+def normalize_entity(text):
+    '''全角转半角、繁体转简体、去空白、转小写'''
+    return _SPACE_PATTERN.sub('', to_simplified(dbc2sbc(text))).lower()
+
+
+class AliasDictionary:
+    '''
+    实体对齐的精确匹配快速通道:按节点类型把"归一化名称-->图谱中的名称"放进哈希表,
+    再叠加可由用户扩展的别名表(如“肚子疼”-->“腹痛”)。命中即确定性对齐,未命中才走向量检索。
+    '''
+
+    def __init__(self, names_by_label, aliases=None):
+        self._index = {}  # {节点类型:{归一化名称:图谱名称}}
+        for label, names in names_by_label.items():
+            self._index[label] = {normalize_entity(name): name for name in names}
+        for label, label_aliases in (aliases or {}).items():
+            self.add_aliases(label, label_aliases)
+
+    @staticmethod
+    def load_aliases(path):
+        '''别名表文件格式 {节点类型:{别名:图谱名称}}'''
+        if not path.exists():
+            return {}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def add_aliases(self, label, label_aliases):
+        names = self._index.setdefault(label, {})
+        known_names = set(names.values())
+        ignored = []
+        for alias, name in label_aliases.items():
+            # 只接受指向图谱中已有名称的别名,避免对齐到不存在的节点
+            if known_names and name not in known_names:
+                ignored.append(alias)
+                continue
+            names[normalize_entity(alias)] = name
+        if ignored:
+            logger.warning(f'⚠️{label}别名的目标名称不在图谱中,已忽略-->{ignored}')
+
+    def lookup(self, label, entity):
+        return self._index.get(label, {}).get(normalize_entity(entity))
+
+    def mentions(self, text):
+        '''
+        文本中出现的所有图谱名称/别名(不分节点类型),返回对应图谱名称的集合;
+        如“高血压吃什么药”-->{高血压},“低血压吃什么药”-->{低血压}
+        '''
+        text = normalize_entity(text)
+        found = set()
+        for start in range(len(text)):
+            for end in range(start + _MENTION_MIN_LENGTH, min(len(text), start + _MENTION_MAX_LENGTH) + 1):
+                fragment = text[start:end]
+                for names in self._index.values():
+                    name = names.get(fragment)
+                    if name is not None:
+                        found.add(name)
+        return found
@@ -0,0 +1,135 @@
+import json
+from collections import defaultdict
+
+import numpy as np
+
+# 与索引文件一起保存的图谱版本号,与当前版本不一致时服务启动时重建索引
+VERSION_FILE = 'graph_version'
+
+# 各节点类型用来对齐的文本属性,与create_index_utils.py建索引时一致
+LABEL_TEXT_PROPERTY = {
+    'Cause': 'desc', 'Check': 'name', 'Department': 'name', 'Disease': 'name', 'Drug': 'name', 'Duration': 'desc',
+    'Food': 'name', 'People': 'desc', 'Symptom': 'name', 'Treat': 'name', 'Way': 'desc', 'PreventWay': 'desc',
+}
+
+
+def _bigrams(text):
+    text = text.lower()
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class _LabelIndex:
+    '''单个节点类型的索引:归一化向量矩阵 + 字符bigram倒排表'''
+
+    def __init__(self, texts, vectors):
+        self.texts = texts
+        self.vectors = vectors  # [N, dim] float32,已按行归一化,可以是memmap
+        self.text_sizes = []
+        self.postings = defaultdict(list)  # {bigram:[行号,...]}
+        for row, text in enumerate(texts):
+            grams = _bigrams(text)
+            self.text_sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(row)
+
+    def vector_scores(self, query_vector, k):
+        '''余弦相似度top-k,一次矩阵乘法'''
+        scores = self.vectors @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return {int(row): float(scores[row]) for row in top}
+
+    def keyword_scores(self, query, k):
+        '''字符bigram的Dice系数,近似全文索引的关键词匹配'''
+        grams = _bigrams(query)
+        overlaps = defaultdict(int)
+        for gram in grams:
+            for row in self.postings.get(gram, ()):
+                overlaps[row] += 1
+        scores = {row: 2 * overlap / (len(grams) + self.text_sizes[row]) for row, overlap in overlaps.items()}
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k])
+
+
+class EntityIndex:
+    '''
+    进程内的实体对齐索引,替代Neo4jVector的混合检索:
+    启动时把各节点类型的名称/描述及其embedding载入连续的NumPy矩阵(可从.npy内存映射加载),
+    向量检索与关键词检索分别按各自最高分归一化后取最大值融合,与SearchType.HYBRID的打分方式一致。
+    '''
+
+    def __init__(self, label_indexes):
+        self.label_indexes = label_indexes  # {节点类型:_LabelIndex}
+
+    @classmethod
+    def from_graph(cls, graph, labels=None):
+        '''从Neo4j读出节点文本和create_index_utils.py写入的embedding属性'''
+        label_indexes = {}
+        for label in labels or LABEL_TEXT_PROPERTY:
+            prop = LABEL_TEXT_PROPERTY[label]
+            rows = graph.query(f'MATCH (n:{label}) WHERE n.{prop} IS NOT NULL AND n.embedding IS NOT NULL '
+                               f'RETURN n.{prop} AS text, n.embedding AS embedding')
+            if not rows:
+                continue
+            vectors = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+            label_indexes[label] = _LabelIndex([row['text'] for row in rows], vectors)
+        return cls(label_indexes)
+
+    @classmethod
+    def load(cls, index_dir):
+        '''向量矩阵以内存映射方式加载,多个worker进程共享同一份页缓存'''
+        label_indexes = {}
+        for texts_path in sorted(index_dir.glob('*.json')):
+            with open(texts_path, encoding='utf-8') as f:
+                texts = json.load(f)
+            vectors = np.load(texts_path.with_suffix('.npy'), mmap_mode='r')
+            label_indexes[texts_path.stem] = _LabelIndex(texts, vectors)
+        return cls(label_indexes)
+
+    def save(self, index_dir, graph_version):
+        '''graph_version为构建索引时的图谱版本号;图谱中已没有节点的类型,其旧索引文件一并删除'''
+        index_dir.mkdir(parents=True, exist_ok=True)
+        for path in [*index_dir.glob('*.npy'), *index_dir.glob('*.json')]:
+            if path.stem not in self.label_indexes:
+                path.unlink()
+        for label, label_index in self.label_indexes.items():
+            np.save(index_dir / f'{label}.npy', np.asarray(label_index.vectors, dtype=np.float32))
+            with open(index_dir / f'{label}.json', 'w', encoding='utf-8') as f:
+                json.dump(label_index.texts, f, ensure_ascii=False)
+        # 版本号最后写入:中途失败时版本号对不上,下次启动会重建
+        (index_dir / VERSION_FILE).write_text(graph_version, encoding='utf-8')
+
+    @staticmethod
+    def saved_version(index_dir):
+        '''索引文件对应的图谱版本号,没有保存过索引(或旧版本未记录版本号)时返回None'''
+        try:
+            return (index_dir / VERSION_FILE).read_text(encoding='utf-8').strip()
+        except FileNotFoundError:
+            return None
+
+    def __contains__(self, label):
+        return label in self.label_indexes
+
+    def texts(self, label):
+        return self.label_indexes[label].texts
+
+    def search(self, label, query, embedding, k=1):
+        '''
+        :param embedding: 查询文本的向量(已由调用方批量计算)
+        :return: [(文本, 融合得分)] 按得分从高到低
+        '''
+        label_index = self.label_indexes[label]
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+
+        fused = {}
+        for scores in (label_index.vector_scores(query_vector, k), label_index.keyword_scores(query, k)):
+            if not scores:
+                continue
+            max_score = max(scores.values()) or 1.0
+            for row, score in scores.items():
+                fused[row] = max(fused.get(row, 0.0), score / max_score)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(label_index.texts[row], score) for row, score in ranked]
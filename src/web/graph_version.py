@@ -0,0 +1,19 @@
+# 图谱数据版本号:数据导入/索引构建完成后写入新版本号,服务端据此让schema快照、查询缓存等失效。
+# 只依赖标准库,table_sync等以src.开头导入的脚本也能直接使用。
+import time
+
+
+def read_graph_version(path):
+    '''读取当前图谱版本号,从未写入过时返回"0"'''
+    try:
+        return path.read_text(encoding='utf-8').strip() or '0'
+    except FileNotFoundError:
+        return '0'
+
+
+def bump_graph_version(path):
+    '''写入新的版本号(纳秒时间戳),返回该版本号'''
+    version = str(time.time_ns())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(version, encoding='utf-8')
+    return version
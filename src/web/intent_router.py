@@ -0,0 +1,138 @@
+from collections import deque
+
+# 事务关键词的同义说法,与INTENT_INFO["request"]中的功能入口一一对应
+REQUEST_SYNONYMS = {
+    "挂号预约": ["挂号", "挂个号", "挂专家号", "预约专家", "约专家号", "预约门诊", "门诊预约", "预约号源", "抢号"],
+    "检查预约": ["预约检查", "约检查", "预约做检查", "预约体检", "体检预约", "预约CT", "预约B超", "预约胃镜", "预约核磁"],
+    "住院预约": ["住院", "预约住院", "办理住院", "住院登记", "申请住院", "床位预约", "预约床位"],
+    "报告查询/下载": ["报告", "查报告", "查询报告", "下载报告", "报告下载", "打印报告", "取报告", "查检查结果", "化验单"],
+    "费用支付/退费": ["支付", "缴费", "交费", "付款", "付费", "退款", "退钱", "医保结算", "开发票"],
+    "转诊/转院申请": ["转诊", "转院", "转到上级医院"],
+    "病例邮寄": ["邮寄", "病历邮寄", "邮寄病历", "寄病历", "复印病历", "病案复印"],
+    "个人信息修改": ["个人信息", "修改", "修改信息", "修改手机号", "更改手机号", "修改联系方式", "修改地址", "改名字",
+               "修改就诊人"],
+    "服务投诉": ["投诉", "举报"],
+    "建议反馈": ["建议", "意见", "提建议", "意见反馈", "提意见"],
+    "系统故障反馈": ["系统故障", "故障", "出错", "报错", "错误", "卡顿", "失灵", "花屏", "离线", "闪退", "打不开",
+               "无法登录", "登录不上", "识别不了", "无法识别", "不识别", "支付失败", "联网失败", "重复扣款", "维修",
+               "修复",
+               "异常", "乱码", "卡纸", "卡住", "卡死", "加载不出", "无法点击", "延迟", "系统维护", "版本过低",
+               "服务器繁忙", "数据不存在", "加载中", "不工作", "不更新",
+               # 问题里提到“XX系统”时多半是在反馈故障,和其他功能入口同时命中时不走关键词路由
+               "系统",
+               # 自助设备、APP:“自助挂号机卡纸”同时命中挂号和设备,属于有歧义的问题,不走关键词路由
+               "挂号机", "缴费机", "读卡器", "打印机", "叫号系统", "APP"],
+}
+
+# 医疗咨询的提示词:问题里出现这些词时说明不只是办事,不能直接短路,交给意图识别
+CONSULT_CUES = [
+    "咨询", "了解", "知道", "请问", "什么", "哪些", "哪个科", "挂哪", "为什么", "怎么回事", "怎么办", "会不会", "能不能",
+    "是否", "应该", "可能", "注意", "原因", "诱因", "风险", "影响", "作用", "表现", "适合", "多久", "多长",
+    "症", "病", "炎", "癌", "瘤", "痛", "疼", "药", "吃", "食", "传染", "感染", "预防", "治", "术", "康复", "怀孕", "产检",
+    "患者", "血压", "血糖", "骨质", "体重", "指标", "监测", "摄入", "补充", "诊断", "意义", "关系",
+    # 常见症状:“我要挂号，感冒了”除了挂号还在描述病情
+    "感冒", "发烧", "发热", "咳嗽", "头晕", "腹泻", "拉肚子", "过敏", "不舒服", "难受", "恶心", "呕吐",
+    # 复合问句的连接词,通常后半句是另一个问题
+    "另外", "顺便", "同时", "还想", "还有", "并且", "，并", "后，", "时，",
+]
+
+# 中性短语:其中包含的咨询提示词不计入(如“病例邮寄”里的“病”、“怎么办理”里的“怎么办”)
+NEUTRAL_PHRASES = ["怎么办理", "如何办理", "病例", "病历", "病房", "病案", "检查结果", "医疗费", "治疗费", "药费"]
+
+
+class KeywordAutomaton:
+    '''
+    Aho-Corasick多模式匹配自动机:一次扫描文本即可找出所有关键词的出现位置,
+    与关键词数量无关。先add全部关键词,再build一次,之后只读,可多线程共享。
+    '''
+
+    def __init__(self):
+        self._goto = [{}]  # 每个状态的转移表 {字符:下一状态}
+        self._fail = [0]
+        self._output = [[]]  # 每个状态命中的(关键词,值)
+        self._built = False
+
+    def add(self, keyword, value):
+        keyword = keyword.lower()
+        state = 0
+        for char in keyword:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append((keyword, value))
+        self._built = False
+
+    def build(self):
+        '''BFS构建失败指针,并把失败链上的输出合并到当前状态'''
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def find_all(self, text):
+        '''返回全部命中 [(起始位置,结束位置,关键词,值)]'''
+        assert self._built, 'KeywordAutomaton需要先build()'
+        matches = []
+        state = 0
+        for end, char in enumerate(text.lower(), 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for keyword, value in self._output[state]:
+                matches.append((end - len(keyword), end, keyword, value))
+        return matches
+
+
+class RequestRouter:
+    '''
+    在任何模型调用之前识别"明显的事务办理"问题(如“我要挂号”):
+    命中的事务关键词都属于同一个功能入口、且没有医疗咨询提示词时,直接给出该功能入口;
+    命中多个功能入口(如“下载报告时提示错误”是查报告还是故障反馈)时交给意图识别。
+    '''
+
+    def __init__(self, request_keywords, synonyms=None, consult_cues=None, neutral_phrases=None):
+        synonyms = REQUEST_SYNONYMS if synonyms is None else synonyms
+        consult_cues = CONSULT_CUES if consult_cues is None else consult_cues
+        neutral_phrases = NEUTRAL_PHRASES if neutral_phrases is None else neutral_phrases
+        self.automaton = KeywordAutomaton()
+        for req_keyword in request_keywords:
+            # 与原有逻辑一致:“费用支付/退费”拆成“费用支付”、“退费”两个核心词
+            for core_word in req_keyword.replace("/", " ").split():
+                self.automaton.add(core_word, ('request', req_keyword))
+            for synonym in synonyms.get(req_keyword, []):
+                self.automaton.add(synonym, ('request', req_keyword))
+        for cue in consult_cues:
+            self.automaton.add(cue, ('consult', cue))
+        for phrase in neutral_phrases:
+            self.automaton.add(phrase, ('neutral', phrase))
+        self.automaton.build()
+
+    def route(self, question):
+        '''只有纯事务问题才返回功能入口;包含咨询提示词、未命中或命中多个功能入口时返回None'''
+        requests, consults = self._split_matches(question)
+        req_keywords = {m[3][1] for m in requests}
+        if len(req_keywords) != 1 or consults:
+            return None
+        return req_keywords.pop()
+
+    def _split_matches(self, question):
+        matches = self.automaton.find_all(question)
+        requests = [m for m in matches if m[3][0] == 'request']
+        # 落在事务关键词或中性短语内部的咨询提示词不算(如“病例邮寄”里的“病”)
+        masks = [m for m in matches if m[3][0] != 'consult']
+        consults = [m for m in matches if m[3][0] == 'consult'
+                    and not any(r[0] <= m[0] and m[1] <= r[1] for r in masks)]
+        return requests, consults
@@ -0,0 +1,44 @@
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_deepseek import ChatDeepSeek
+
+#🌻 大模型后端:按配置创建,ChatService的intent/cypher/answer各阶段可以使用不同后端
+# deepseek: DeepSeek官方接口
+# openai_compatible: 任意OpenAI兼容接口,如本机的vLLM/Ollama/llama.cpp server(base_url指向http://localhost:xxxx/v1)
+# huggingface: 进程内加载的小模型(transformers),无网络开销
+
+
+class TextModelAdapter:
+    '''把返回字符串的文本模型(如HuggingFacePipeline)包装成和chat模型一样返回消息对象'''
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def invoke(self, prompt, *args, **kwargs):
+        return AIMessage(content=self.llm.invoke(prompt, *args, **kwargs))
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        return AIMessage(content=await self.llm.ainvoke(prompt, *args, **kwargs))
+
+    async def astream(self, prompt, *args, **kwargs):
+        async for text in self.llm.astream(prompt, *args, **kwargs):
+            yield AIMessageChunk(content=text)
+
+
+def create_llm(backend):
+    '''backend为config.LLM_BACKENDS中的一项,type以外的键原样作为模型参数'''
+    options = dict(backend)
+    backend_type = options.pop('type')
+    if backend_type == 'deepseek':
+        # stream_usage:流式输出时也返回token用量,供metrics统计
+        return ChatDeepSeek(stream_usage=True, **options)
+    if backend_type == 'openai_compatible':
+        from langchain_openai import ChatOpenAI
+        options.setdefault('api_key', 'EMPTY')
+        return ChatOpenAI(stream_usage=True, **options)
+    if backend_type == 'huggingface':
+        from langchain_community.llms import HuggingFacePipeline
+        max_new_tokens = options.pop('max_new_tokens', 512)
+        return TextModelAdapter(HuggingFacePipeline.from_model_id(
+            model_id=options.pop('model'), task='text-generation',
+            pipeline_kwargs={'max_new_tokens': max_new_tokens, 'return_full_text': False}, **options))
+    raise ValueError(f'未知的大模型后端类型:{backend_type}')
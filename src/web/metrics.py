@@ -0,0 +1,224 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# 耗时直方图的桶(秒):覆盖从本地规则/缓存的毫秒级到大模型调用的数十秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# chat_intent_total的intent标签取值;意图可能来自大模型的原始输出,其他取值一律计为other,避免标签取值无限增长
+INTENT_LABELS = ('request', 'consult', 'unknown')
+
+
+def _format_labels(label_names, label_values):
+    if not label_names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._lock = threading.Lock()
+        # labels -> [各桶计数(非累计), sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.label_names)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        label_names = self.label_names + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(label_names, key + (_format_value(bound),))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.label_names, key)
+                lines.append(f'{self.name}_sum{labels} {total!r}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class GaugeCallback:
+    '''采集时才读取的指标(队列深度、缓存大小等),collect返回[(labels字典, 值)]'''
+
+    def __init__(self, name, help_text, collect, metric_type='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.collect = collect
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.metric_type}']
+        for labels, value in self.collect():
+            lines.append(f'{self.name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        '''Prometheus文本格式(text/plain; version=0.0.4)'''
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class _Timer:
+    '''计时时扣除paused()期间的时间:流式输出中把token交给调用方(客户端读取)的时间不算作本阶段耗时'''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.paused_seconds = 0.0
+
+    @contextmanager
+    def paused(self):
+        paused_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.paused_seconds += time.perf_counter() - paused_at
+
+    def elapsed(self):
+        return time.perf_counter() - self.started - self.paused_seconds
+
+
+class _LLMCall(_Timer):
+    def __init__(self):
+        super().__init__()
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def record(self, message):
+        '''累加一次调用(或流式输出的一个chunk)的usage_metadata'''
+        usage = getattr(message, 'usage_metadata', None)
+        if usage:
+            self.input_tokens += usage.get('input_tokens', 0)
+            self.output_tokens += usage.get('output_tokens', 0)
+
+
+class ChatMetrics:
+    '''ChatService的各阶段耗时、大模型调用耗时及token数'''
+    # 子类可替换成同时保留原始样本的直方图(如benchmark统计精确分位数)
+    histogram_class = Histogram
+
+    def __init__(self):
+        self.registry = MetricsRegistry()
+        self.request_seconds = self.registry.register(
+            self.histogram_class('chat_request_seconds', '一次问答请求的总耗时', ['entry']))
+        self.stage_seconds = self.registry.register(
+            self.histogram_class('chat_stage_seconds', '问答流程各阶段耗时', ['stage']))
+        self.intents = self.registry.register(
+            Counter('chat_intent_total', '各意图的请求数', ['intent']))
+        self.speculations = self.registry.register(
+            Counter('chat_speculation_total', '推测执行的cypher生成结果:used被使用/discarded意图不是consult而丢弃',
+                    ['outcome']))
+        self.fused = self.registry.register(
+            Counter('chat_fused_total', '融合调用(意图+cypher一次生成)的结果:ok通过校验/fallback改为分步调用', ['outcome']))
+        self.session_events = self.registry.register(
+            Counter('chat_session_total', '多轮会话:context带上文的提问/entity_reused复用已对齐的实体/rows_reused复用上一轮的查询结果',
+                    ['event']))
+        self.llm_seconds = self.registry.register(
+            self.histogram_class('llm_call_seconds', '大模型调用耗时(不含准入排队)', ['stage']))
+        self.llm_tokens = self.registry.register(
+            Counter('llm_tokens_total', '大模型调用消耗的token数', ['stage', 'type']))
+
+    def add_gauge(self, name, help_text, collect, metric_type='gauge'):
+        self.registry.register(GaugeCallback(name, help_text, collect, metric_type))
+
+    @contextmanager
+    def request(self, entry):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.request_seconds.observe(time.perf_counter() - started, entry=entry)
+
+    @contextmanager
+    def span(self, stage):
+        '''返回的计时器可用paused()扣除等待调用方的时间(流式输出yield期间)'''
+        timer = _Timer()
+        try:
+            yield timer
+        finally:
+            self.stage_seconds.observe(timer.elapsed(), stage=stage)
+
+    @contextmanager
+    def llm_call(self, stage):
+        call = _LLMCall()
+        try:
+            yield call
+        finally:
+            self.llm_seconds.observe(call.elapsed(), stage=stage)
+            if call.input_tokens:
+                self.llm_tokens.inc(call.input_tokens, stage=stage, type='input')
+            if call.output_tokens:
+                self.llm_tokens.inc(call.output_tokens, stage=stage, type='output')
+
+    def count_intent(self, intent):
+        self.intents.inc(intent=intent if intent in INTENT_LABELS else 'other')
+
+    def count_speculation(self, outcome):
+        self.speculations.inc(outcome=outcome)
+
+    def count_fused(self, outcome):
+        self.fused.inc(outcome=outcome)
+
+    def count_session(self, event, amount=1):
+        self.session_events.inc(amount, event=event)
+
+    def render(self):
+        return self.registry.render()
@@ -0,0 +1,74 @@
+import gc
+import logging
+import os
+
+from configuration import config
+
+logger = logging.getLogger(__name__)
+
+#🌻 多进程部署:gunicorn master先加载应用(embedding模型等只读权重),再fork出多个UvicornWorker
+# fork后各worker与master共享模型权重所在的内存页(写时复制),不会每个worker各占一份
+# Neo4j连接、线程池等在每个worker的startup事件中各自创建,不跨进程共享
+# 平滑重启:kill -HUP <master pid> 逐个替换worker,正在处理的请求会先处理完(graceful_timeout)
+# 注意preload模式下代码在master中加载,修改代码后需要完整重启服务(HUP不会重新import)
+
+
+def _torch_threads(workers):
+    '''每个worker的torch计算线程数,默认按CPU核数平均分配,避免多个worker互相抢占CPU'''
+    threads = config.WEB_SERVER_CONFIG['torch_threads']
+    if threads:
+        return threads
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _post_fork(server, worker):
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(_torch_threads(server.cfg.workers))
+
+
+def _load_app():
+    from web.app import app, service
+    # 只加载不涉及网络连接的组件,fork之后在worker中继续加载其余组件
+    service.preload()
+    # 把已加载的对象移出gc跟踪,避免worker中gc扫描时修改对象头导致共享内存页被复制
+    gc.freeze()
+    return app
+
+
+def serve(host, port, workers):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        # 没有gunicorn(如Windows)时退回uvicorn多进程:spawn方式启动,每个worker各自加载模型
+        logger.warning('⚠️未安装gunicorn,使用uvicorn多进程模式,模型不能在worker间共享(pip install gunicorn)')
+        import uvicorn
+        uvicorn.run('web.app:app', host=host, port=port, workers=workers)
+        return
+
+    class Application(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return _load_app()
+
+    # tokenizers在fork前用过多线程时会在worker中告警/死锁,这里关闭其并行
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    server_config = config.WEB_SERVER_CONFIG
+    Application({
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'worker_class': 'uvicorn.workers.UvicornWorker',
+        'preload_app': server_config['preload'],
+        'timeout': server_config['timeout'],
+        'graceful_timeout': server_config['graceful_timeout'],
+        'post_fork': _post_fork,
+    }).run()
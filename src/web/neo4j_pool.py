@@ -0,0 +1,175 @@
+import threading
+
+from langchain_neo4j import Neo4jGraph, Neo4jVector
+from neo4j import AsyncGraphDatabase, Query, RoutingControl
+from neo4j.exceptions import ConnectionAcquisitionTimeoutError
+
+
+class _PoolMeter:
+    '''统计连接占用情况:每个执行中的execute_query/session占用连接池中的一个连接'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.acquired = 0
+        self.acquire_timeouts = 0
+
+    def enter(self):
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def exit(self, exc_type=None):
+        with self._lock:
+            self.in_use -= 1
+            if exc_type is not None and issubclass(exc_type, ConnectionAcquisitionTimeoutError):
+                self.acquire_timeouts += 1
+
+    def stats(self):
+        with self._lock:
+            return {'in_use': self.in_use,
+                    'peak_in_use': self.peak_in_use,
+                    'acquired': self.acquired,
+                    'acquire_timeouts': self.acquire_timeouts}
+
+
+class _MeteredSession:
+    def __init__(self, session, meter):
+        self._session = session
+        self._meter = meter
+
+    def __enter__(self):
+        self._meter.enter()
+        try:
+            return self._session.__enter__()
+        except BaseException as e:
+            self._meter.exit(type(e))
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            return self._session.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self._meter.exit(exc_type)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+class _MeteredDriver:
+    '''包装同步driver,其余属性/方法原样转发'''
+
+    def __init__(self, driver, meter):
+        self._driver = driver
+        self._meter = meter
+
+    def execute_query(self, *args, **kwargs):
+        self._meter.enter()
+        exc_type = None
+        try:
+            return self._driver.execute_query(*args, **kwargs)
+        except BaseException as e:
+            exc_type = type(e)
+            raise
+        finally:
+            self._meter.exit(exc_type)
+
+    def session(self, *args, **kwargs):
+        return _MeteredSession(self._driver.session(*args, **kwargs), self._meter)
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class _MeteredAsyncDriver:
+    '''包装异步driver,其余属性/方法原样转发'''
+
+    def __init__(self, driver, meter):
+        self._driver = driver
+        self._meter = meter
+
+    async def execute_query(self, *args, **kwargs):
+        self._meter.enter()
+        exc_type = None
+        try:
+            return await self._driver.execute_query(*args, **kwargs)
+        except BaseException as e:
+            exc_type = type(e)
+            raise
+        finally:
+            self._meter.exit(exc_type)
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+
+class Neo4jPool:
+    '''
+    服务内共用的Neo4j连接池:
+    Neo4jGraph和所有Neo4jVector共用同一个同步driver(Neo4jVector传入graph时直接复用graph的driver),
+    achat使用同一份配置的异步driver,每个进程只建立两个连接池
+    '''
+
+    def __init__(self, uri, auth, max_connection_pool_size=50, max_connection_lifetime=3600,
+                 connection_acquisition_timeout=60):
+        self.settings = {'max_connection_pool_size': max_connection_pool_size,
+                         'max_connection_lifetime': max_connection_lifetime,
+                         'connection_acquisition_timeout': connection_acquisition_timeout}
+        self._meter = _PoolMeter()
+        self._async_meter = _PoolMeter()
+        # schema由SchemaSnapshot按需计算并缓存,创建连接时不再扫描数据库
+        self.graph = Neo4jGraph(url=uri, username=auth[0], password=auth[1],
+                                refresh_schema=False, driver_config=self.settings)
+        self.graph._driver = _MeteredDriver(self.graph._driver, self._meter)
+        self.async_driver = _MeteredAsyncDriver(AsyncGraphDatabase.driver(uri, auth=auth, **self.settings),
+                                                self._async_meter)
+
+    @classmethod
+    def from_config(cls, neo4j_config, pool_config):
+        return cls(neo4j_config['uri'], neo4j_config['auth'], **pool_config)
+
+    def vector_store(self, embedding, **kwargs):
+        '''基于已有向量索引创建Neo4jVector,复用共享driver'''
+        return Neo4jVector.from_existing_index(embedding, graph=self.graph, **kwargs)
+
+    def query(self, cypher, params=None, timeout=None):
+        '''
+        执行问答流程中的只读查询:按读事务执行(写语句会被数据库拒绝),
+        timeout为事务超时秒数,超时后由数据库终止事务并抛出TransactionTimedOut
+        '''
+        records, _, _ = self.graph._driver.execute_query(Query(cypher, timeout=timeout), parameters_=params,
+                                                         routing_=RoutingControl.READ,
+                                                         database_=self.graph._database)
+        return [record.data() for record in records]
+
+    async def aquery(self, cypher, params=None, timeout=None):
+        records, _, _ = await self.async_driver.execute_query(Query(cypher, timeout=timeout), parameters_=params,
+                                                              routing_=RoutingControl.READ,
+                                                              database_=self.graph._database)
+        return [record.data() for record in records]
+
+    def explain(self, cypher, params=None):
+        '''只生成执行计划不执行,返回summary.plan(算子树的字典)'''
+        _, summary, _ = self.graph._driver.execute_query(f'EXPLAIN {cypher}', parameters_=params,
+                                                         routing_=RoutingControl.READ,
+                                                         database_=self.graph._database)
+        return summary.plan
+
+    async def aexplain(self, cypher, params=None):
+        _, summary, _ = await self.async_driver.execute_query(f'EXPLAIN {cypher}', parameters_=params,
+                                                              routing_=RoutingControl.READ,
+                                                              database_=self.graph._database)
+        return summary.plan
+
+    def stats(self):
+        return {**self.settings,
+                'sync': self._meter.stats(),
+                'async': self._async_meter.stats()}
+
+    def close(self):
+        self.graph.close()
+
+    async def aclose(self):
+        await self.async_driver.close()
@@ -0,0 +1,89 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from web.graph_version import read_graph_version
+
+
+def query_key(cypher, params):
+    '''规范化后的cypher(合并空白)+参数值,同一条查询无论换行缩进如何都得到同一个key'''
+    return ' '.join(cypher.split()) + '\n' + json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def _estimate_bytes(key, result):
+    '''按序列化后的长度估算条目占用的内存'''
+    return len(key.encode('utf-8')) + len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class QueryCache:
+    '''
+    图谱查询结果缓存,放在graph.query/async_driver.execute_query前面:
+    key为规范化的cypher+对齐后的参数值,总大小超过max_bytes时按LRU淘汰;
+    图谱只在json_sync导入数据时变化,版本号变化时一次清空全部条目。
+    缓存的结果会被多个请求共享,调用方不要原地修改。
+    '''
+
+    def __init__(self, version_path, max_bytes=64 * 1024 * 1024, check_interval=5.0):
+        self.version_path = version_path
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval  # 检查版本号文件的最小间隔(秒)
+
+        self._entries = OrderedDict()  # {key:(查询结果,估算字节数)},顺序即LRU顺序
+        self._bytes = 0
+        self._version = read_graph_version(version_path)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'oversized': 0}
+
+    def get(self, key):
+        '''命中时返回查询结果(可能是空列表),未命中返回None'''
+        self._check_version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[0]
+
+    def put(self, key, result):
+        size = _estimate_bytes(key, result)
+        with self._lock:
+            if size > self.max_bytes:
+                # 单条结果就超过预算的不缓存,避免把其他条目全部挤掉
+                self.counters['oversized'] += 1
+                return
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            while self._entries and self._bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.counters['evictions'] += 1
+            self._entries[key] = (result, size)
+            self._bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {**self.counters, 'size': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'graph_version': self._version, 'hit_rate': self.counters['hits'] / lookups if lookups else 0.0}
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        version = read_graph_version(self.version_path)
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._entries.clear()
+                self._bytes = 0
+                self._version = version
+                self.counters['invalidations'] += 1
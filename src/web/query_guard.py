@@ -0,0 +1,189 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from neo4j.exceptions import ClientError
+
+from web.query_cache import query_key
+
+logger = logging.getLogger(__name__)
+
+#🌻 大模型生成的cypher执行前的安全检查:
+# 1.无上限的变长关系(如-[*]->)改写成最多max_expand_hops跳;
+# 2.EXPLAIN得到执行计划,包含全库扫描(AllNodesScan)、笛卡尔积(CartesianProduct)或无上限变长扩展的查询直接拒绝;
+# 3.执行时带事务超时,超时的查询(cypher+参数值)在timeout_ban_seconds秒内不再执行;
+#   预置查询/模板是参数化的,只按cypher文本封禁会让同类问题全部查不到结果,所以只封禁这一组参数,且到期自动解除。
+# 同一条cypher只EXPLAIN一次,结论缓存起来;被拒绝的查询记录在offenders中,可通过/query_guard/stats查看
+
+# 关系模式中的变长部分:-[r:HAVE*1..3]->、-[*]-
+_VAR_LENGTH_PATTERN = re.compile(r'(?<=-)\[([^\[\]]*?)\*\s*(\d*)\s*(\.\.)?\s*(\d*)\s*\]')
+# 执行计划Details中的变长部分:(d)-[anon_0*..]->(x)
+_PLAN_HOPS_PATTERN = re.compile(r'\*(\d*)(\.\.)?(\d*)')
+
+
+class UnsafeQueryError(Exception):
+    '''查询被安全检查拒绝:执行计划包含危险的算子,或执行超时'''
+
+    def __init__(self, cypher, reason):
+        super().__init__(f'{reason}: {cypher}')
+        self.cypher = cypher
+        self.reason = reason
+
+
+def bound_var_length(cypher, max_hops):
+    '''
+    把无上限的变长关系改写成最多max_hops跳,上限超过max_hops的收紧到max_hops;
+    下限本身超过max_hops时上限不能低于下限(如[*5..]改成[*5..5]),交给执行计划检查拒绝
+    '''
+    def bound(match):
+        prefix, lower, dots, upper = match.groups()
+        if not dots:
+            # -[*]-无上下限;-[*3]-是固定跳数
+            return match.group(0) if lower else f'[{prefix}*1..{max_hops}]'
+        ceiling = max(int(lower or 1), max_hops)
+        upper = min(int(upper), ceiling) if upper else ceiling
+        return f'[{prefix}*{lower}..{upper}]'
+
+    return _VAR_LENGTH_PATTERN.sub(bound, cypher)
+
+
+def is_timeout(error):
+    return isinstance(error, ClientError) and (error.code or '').startswith('Neo.ClientError.Transaction.TransactionTimedOut')
+
+
+def _operator_name(operator):
+    # Neo4j 5的算子名带运行时后缀,如AllNodesScan@neo4j
+    return operator.get('operatorType', '').split('@')[0]
+
+
+def plan_violations(plan, reject_operators, max_expand_hops):
+    '''遍历执行计划,返回违规原因列表'''
+    violations = []
+    stack = [plan]
+    while stack:
+        operator = stack.pop()
+        name = _operator_name(operator)
+        if name in reject_operators:
+            violations.append(name)
+        elif 'VarLengthExpand' in name or 'VarExpand' in name:
+            details = str(operator.get('args', {}).get('Details', ''))
+            for lower, dots, upper in _PLAN_HOPS_PATTERN.findall(details):
+                hops = int(upper) if upper else (None if dots or not lower else int(lower))
+                if hops is None or hops > max_expand_hops:
+                    violations.append(f'{name}(上限{hops or "无"})')
+        stack.extend(operator.get('children', []))
+    return violations
+
+
+class QueryGuard:
+    '''
+    check(cypher, params, explain)返回可以执行的cypher(可能经过改写),不安全时抛出UnsafeQueryError;
+    explain为pool.explain / pool.aexplain,只在该cypher第一次出现时调用
+    '''
+
+    def __init__(self, reject_operators=('AllNodesScan', 'CartesianProduct'), max_expand_hops=3, plan_check=True,
+                 cache_size=1024, max_offenders=50, timeout_ban_seconds=300.0):
+        self.reject_operators = set(reject_operators)
+        self.max_expand_hops = max_expand_hops
+        self.plan_check = plan_check
+        self.cache_size = cache_size
+        self.timeout_ban_seconds = timeout_ban_seconds
+        self._verdicts = OrderedDict()  # {cypher:(改写后的cypher, 拒绝原因或None)},顺序即LRU顺序
+        self._timeouts = OrderedDict()  # {query_key(改写后的cypher, 参数):解除封禁的时间},顺序即写入顺序
+        self._offenders = deque(maxlen=max_offenders)
+        self._lock = threading.Lock()
+        self.counters = {'checked': 0, 'explained': 0, 'rewritten': 0, 'rejected': 0, 'timeouts': 0}
+
+    def check(self, cypher, params, explain):
+        verdict = self._cached(cypher)
+        if verdict is None:
+            rewritten = bound_var_length(cypher, self.max_expand_hops)
+            plan = None
+            if self.plan_check:
+                try:
+                    plan = explain(rewritten, params)
+                except ClientError as e:
+                    return self._apply(cypher, self._judge(cypher, rewritten, None, f'EXPLAIN失败:{e.code}'))
+            verdict = self._judge(cypher, rewritten, plan)
+        return self._check_timeout(cypher, self._apply(cypher, verdict), params)
+
+    async def acheck(self, cypher, params, aexplain):
+        verdict = self._cached(cypher)
+        if verdict is None:
+            rewritten = bound_var_length(cypher, self.max_expand_hops)
+            plan = None
+            if self.plan_check:
+                try:
+                    plan = await aexplain(rewritten, params)
+                except ClientError as e:
+                    return self._apply(cypher, self._judge(cypher, rewritten, None, f'EXPLAIN失败:{e.code}'))
+            verdict = self._judge(cypher, rewritten, plan)
+        return self._check_timeout(cypher, self._apply(cypher, verdict), params)
+
+    def record_timeout(self, cypher, params):
+        '''执行超时的查询(cypher为check返回的cypher)在timeout_ban_seconds秒内不再以同样的参数执行,其他参数不受影响'''
+        reason = '事务超时'
+        with self._lock:
+            self.counters['timeouts'] += 1
+            key = query_key(cypher, params)
+            self._timeouts.pop(key, None)
+            self._timeouts[key] = time.monotonic() + self.timeout_ban_seconds
+            while len(self._timeouts) > self.cache_size:
+                self._timeouts.popitem(last=False)
+            self._offenders.append({'cypher': cypher, 'params': params, 'reason': reason, 'time': time.time()})
+        logger.warning(f'🚫查询被拒绝({reason},{self.timeout_ban_seconds:.0f}秒内不再执行)-->{cypher} {params}')
+        return UnsafeQueryError(cypher, reason)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'verdicts': len(self._verdicts), 'timeout_bans': len(self._timeouts),
+                    'offenders': list(self._offenders)}
+
+    def _check_timeout(self, cypher, checked, params):
+        '''该组参数最近执行超时过(且未到解除时间)时拒绝,否则返回可以执行的cypher'''
+        key = query_key(checked, params)
+        with self._lock:
+            until = self._timeouts.get(key)
+            if until is None:
+                return checked
+            if until <= time.monotonic():
+                del self._timeouts[key]
+                return checked
+        raise UnsafeQueryError(cypher, '事务超时')
+
+    def _cached(self, cypher):
+        with self._lock:
+            self.counters['checked'] += 1
+            verdict = self._verdicts.get(cypher)
+            if verdict is not None:
+                self._verdicts.move_to_end(cypher)
+            return verdict
+
+    def _judge(self, cypher, rewritten, plan, reason=None):
+        if plan is not None:
+            violations = plan_violations(plan, self.reject_operators, self.max_expand_hops)
+            reason = '、'.join(violations) or None
+        with self._lock:
+            self.counters['explained'] += plan is not None
+            if rewritten != cypher:
+                self.counters['rewritten'] += 1
+            if reason is not None:
+                self.counters['rejected'] += 1
+                self._offenders.append({'cypher': cypher, 'reason': reason, 'time': time.time()})
+            self._verdicts[cypher] = (rewritten, reason)
+            while len(self._verdicts) > self.cache_size:
+                self._verdicts.popitem(last=False)
+        if reason is not None:
+            logger.warning(f'🚫查询被拒绝({reason})-->{cypher}')
+        elif rewritten != cypher:
+            logger.info(f'✂️变长关系已限制为最多{self.max_expand_hops}跳-->{rewritten}')
+        return rewritten, reason
+
+    @staticmethod
+    def _apply(cypher, verdict):
+        rewritten, reason = verdict
+        if reason is not None:
+            raise UnsafeQueryError(cypher, reason)
+        return rewritten
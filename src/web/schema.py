@@ -1,9 +1,33 @@
-from pydantic import BaseModel
+from typing import Literal, Optional
+
+from pydantic import BaseModel, model_validator
 
 
 class Question(BaseModel):
     message: str
+    # 多轮对话的会话id(前端生成),同一会话的追问可以省略上文提到的实体;不传时为单轮问答
+    session_id: Optional[str] = None
 
 class Answer(BaseModel):
     message: str
 
+
+# 融合提示词(一次大模型调用同时输出意图、事务类别、cypher和待对齐实体)的结构化输出
+class AlignEntity(BaseModel):
+    param_name: str
+    entity: str
+    label: str
+
+class FusedOutput(BaseModel):
+    intent: Literal['request', 'consult', 'unknown']
+    request_type: Optional[str] = None
+    consult_type: Optional[str] = None
+    cypher_query: str = ''
+    entities_to_align: list[AlignEntity] = []
+
+    @model_validator(mode='after')
+    def check_consult(self):
+        # 命中现成查询时cypher_query可以为空,但必须给出咨询类别
+        if self.intent == 'consult' and not (self.consult_type or self.cypher_query.strip()):
+            raise ValueError('consult意图缺少consult_type和cypher_query')
+        return self
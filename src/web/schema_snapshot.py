@@ -0,0 +1,78 @@
+import json
+import logging
+import threading
+import time
+
+from web.graph_version import read_graph_version
+
+logger = logging.getLogger(__name__)
+
+# 不需要大模型知道的属性:embedding是向量,id是导入时生成的内部编号
+HIDDEN_PROPERTIES = {'embedding', 'id'}
+
+
+def compact_schema(structured_schema):
+    '''
+    把Neo4jGraph.structured_schema压缩成尽量少token的描述:
+    节点: Disease(name,desc);Symptom(name)...
+    关系: (Disease)-[:HAVE]->(Symptom);...
+    '''
+    nodes = []
+    for label, props in sorted(structured_schema.get('node_props', {}).items()):
+        names = [prop['property'] for prop in props if prop['property'] not in HIDDEN_PROPERTIES]
+        nodes.append(f'{label}({",".join(names)})')
+    relationships = sorted({f'({rel["start"]})-[:{rel["type"]}]->({rel["end"]})'
+                            for rel in structured_schema.get('relationships', [])})
+    return f'节点:{";".join(nodes)}\n关系:{";".join(relationships)}'
+
+
+class SchemaSnapshot:
+    '''
+    图谱schema快照:计算一次后缓存到文件,进程重启直接读取,不再每次启动都扫描数据库。
+    图谱版本号变化(json_sync导入数据后)或手动invalidate()时重新计算。
+    '''
+
+    def __init__(self, graph, cache_path, version_path, check_interval=5.0):
+        self.graph = graph
+        self.cache_path = cache_path
+        self.version_path = version_path
+        self.check_interval = check_interval  # 检查版本号文件的最小间隔(秒)
+        self._schema = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._schema is not None and now - self._checked_at < self.check_interval:
+            return self._schema
+        with self._lock:
+            self._checked_at = now
+            version = read_graph_version(self.version_path)
+            if self._schema is None or version != self._version:
+                self._schema = self._load_cached(version) or self._refresh(version)
+                self._version = version
+            return self._schema
+
+    def invalidate(self):
+        '''丢弃内存和文件中的快照,下次get()时重新计算'''
+        with self._lock:
+            self._schema = None
+            self.cache_path.unlink(missing_ok=True)
+
+    def _load_cached(self, version):
+        if not self.cache_path.exists():
+            return None
+        with open(self.cache_path, encoding='utf-8') as f:
+            cached = json.load(f)
+        return cached['schema'] if cached.get('version') == version else None
+
+    def _refresh(self, version):
+        self.graph.refresh_schema()
+        schema = compact_schema(self.graph.structured_schema)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'schema': schema}, f, ensure_ascii=False)
+        logger.info(f'🗺️图谱schema快照已更新(版本{version})')
+        logger.debug(schema)
+        return schema
@@ -1,12 +1,38 @@
 
+import asyncio
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager, nullcontext
+
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
 from langchain_core.prompts import PromptTemplate
-from langchain_deepseek import ChatDeepSeek
-from langchain_neo4j import Neo4jGraph, Neo4jVector
 from langchain_neo4j.vectorstores.neo4j_vector import SearchType
+from pydantic import ValidationError
 
 from configuration import config
+from intent_classify.predict import IntentPredictor
+from web.admission import AdmissionController, AdmissionRejected
+from web.answer_cache import AnswerCache
+from web.cypher_guard import condense_rows, guard_cypher
+from web.cypher_library import CONSULT_QUERIES, get_library_query
+from web.entity_alias import AliasDictionary
+from web.entity_index import EntityIndex, LABEL_TEXT_PROPERTY
+from web.graph_version import read_graph_version
+from web.cypher_template import CypherTemplateStore, canonicalize, is_reusable
+from web.intent_router import RequestRouter
+from web.llm_backend import create_llm
+from web.metrics import ChatMetrics
+from web.neo4j_pool import Neo4jPool
+from web.query_cache import QueryCache, query_key
+from web.query_guard import QueryGuard, UnsafeQueryError, is_timeout
+from web.schema import FusedOutput
+from web.schema_snapshot import SchemaSnapshot
+from web.session_store import SessionLocks, create_session_store
+
+logger = logging.getLogger(__name__)
 
 #🌻🌻🌻
 INTENT_INFO = {
@@ -22,27 +48,466 @@ INTENT_INFO = {
     ]
 }
 
+#🌻 需要对齐实体的节点类型,每个类型对应一组向量索引+全文索引
+VECTOR_LABELS = ['Cause', 'Check', 'Department', 'Disease', 'Drug', 'Duration', 'Food', 'People', 'Symptom', 'Treat',
+                 'Way', 'PreventWay']
+# 必需组件:加载完成前服务不接收问答请求;其余组件加载失败时按关闭处理(如意图模型失败则全部走大模型)
+REQUIRED_COMPONENTS = ['llm', 'neo4j', 'embedding_model', *[f'vector:{label}' for label in VECTOR_LABELS]]
+
+#🌻 提示词模板:在ChatService.__init__中预编译一次,每个问题只做format
+INTENT_PROMPT = '''
+            请判断用户问题属于以下哪种意图：
+            - request（事务办理）：包含{request_keywords}
+            - consult（医疗咨询）：包含{consult_keywords}
+            若都不属于，输出"unknown"。
+            要求：仅输出"request"、"consult"或"unknown"，不添加任何多余内容。
+            用户问题：{question}
+        '''
+
+BATCH_INTENT_PROMPT = '''
+            请判断以下每个用户问题属于哪种意图：
+            - request（事务办理）：包含{request_keywords}
+            - consult（医疗咨询）：包含{consult_keywords}
+            若都不属于，为"unknown"。
+            要求：按问题编号顺序输出JSON数组，每个元素只能是"request"、"consult"或"unknown"，如["consult","request"]，不添加任何多余内容。
+            用户问题列表：
+            {questions}
+        '''
+
+UNKNOWN_PROMPT = '''
+            你是一个医疗行业领域的智能医生小助手,精通各种医学知识以及熟悉所有的医院诊断流程。
+            请你根据自己仅有的知识，尽可能回答用户的问题。如果确实无法回答，就回复“暂未支持该需求，请换个问题试试”。
+            
+            要求:
+            1.回答简洁、准确,使用人类的自然语言。
+            2.仅输出普通文本。
+            3.直接给出具体结论，无需额外冗余内容。
+
+            用户问题：{question}
+        '''
+
+CYPHER_PROMPT = '''
+                你是一个专业的Neo4j Cypher查询生成器,你的任务是根据用户问题生成一条Cypher查询语句,用于从知识图谱中获取回答用户问题所需的信息。
+                
+                用户问题:{question}
+                知识图谱结构信息:{schema_info}
+                
+                要求:
+                1.生成参数化Cypher查询语句,用param_0,param_1等代替具体值
+                2.识别需要对齐的实体
+                3.从以下咨询类别中选出问题所属的一个:{consult_types}
+                4.必须严格使用以下JSON格式输出结果
+                {{
+                    "consult_type": "咨询类别",
+                    "cypher_query": "生成的Cypher语句",
+                    "entities_to_align":[
+                        {{
+                            "param_name": "param_0",
+                            "entity": "原始实体名称",
+                            "label": "节点类型"
+                        }}
+                    ]
+                }}
+        '''
+
+EXTRACT_PROMPT = '''
+                你是一个医疗知识图谱的实体抽取助手,请从用户问题中判断咨询类别并抽取需要查询的实体。
+
+                用户问题:{question}
+                可选的咨询类别及其对应的实体节点类型组合:{candidates}
+
+                要求:
+                1.consult_type只能从上面的咨询类别中选择,都不符合时输出"none"
+                2.实体的节点类型组合必须与所选咨询类别的某个组合一致
+                3.必须严格使用以下JSON格式输出结果
+                {{
+                    "consult_type": "咨询类别",
+                    "entities_to_align":[
+                        {{
+                            "entity": "原始实体名称",
+                            "label": "节点类型"
+                        }}
+                    ]
+                }}
+        '''
+
+FUSED_PROMPT = '''
+                你是一个医疗问答系统的意图识别与Cypher生成助手,请一次性完成意图判断,以及医疗咨询问题的Cypher查询生成。
+
+                用户问题:{question}
+                知识图谱结构信息:{schema_info}
+                已有现成查询的咨询类别及其对应的实体节点类型组合:{candidates}
+
+                要求:
+                1.intent只能是"request"(事务办理,包含{request_keywords})、"consult"(医疗咨询)或"unknown"(都不属于)
+                2.intent为request时,request_type从以下事务类别中选择一个:{request_keywords};否则为null
+                3.intent为consult时:consult_type从以下咨询类别中选择一个:{consult_types},并识别需要对齐的实体;
+                  咨询类别和实体节点类型组合属于上面已有现成查询的组合时cypher_query输出空字符串,
+                  否则生成参数化Cypher查询语句,用param_0,param_1等代替具体值;
+                  intent不是consult时cypher_query为空字符串,entities_to_align为空列表
+                4.必须严格使用以下JSON格式输出结果
+                {{
+                    "intent": "request/consult/unknown",
+                    "request_type": "事务类别或null",
+                    "consult_type": "咨询类别或null",
+                    "cypher_query": "生成的Cypher语句",
+                    "entities_to_align":[
+                        {{
+                            "param_name": "param_0",
+                            "entity": "原始实体名称",
+                            "label": "节点类型"
+                        }}
+                    ]
+                }}
+        '''
+
+ANSWER_PROMPT = '''
+                你是一个医疗行业领域的智能医生小助手,精通各种医学知识以及熟悉所有的医院诊断流程。根据用户问题,以及数据库查询结果生成回答。
+                要求:
+                1.回答简洁、准确,使用人类的自然语言。
+                2.仅输出普通文本。
+                3.直接给出具体结论，无需额外冗余内容。
+                用户问题:{question}
+                数据库返回结果:{query_result}
+        '''
+
 class ChatService:
-    def __init__(self):
-        self.graph = Neo4jGraph(url=config.NEO4J_CONFIG['uri'],
-                                username=config.NEO4J_CONFIG['auth'][0],
-                                password=config.NEO4J_CONFIG['auth'][1])
+    def __init__(self, lazy=False, components=None):
+        '''
+        lazy=False时在构造函数里加载完所有组件(脚本/命令行使用);
+        lazy=True时只做轻量初始化,由start()在后台并行加载模型和索引,web服务启动后即可响应健康检查
+        components:预先构造好的组件{属性名:对象},如benchmark里的假大模型(llm,所有阶段共用)、内存图谱(neo4j_pool)、
+        embedding_model、metrics,提供了的组件不再创建
+        '''
+        components = dict(components or {})
         # 🌻🌻🌻
         self.INTENT_INFO = INTENT_INFO
+        # 事务关键词+同义词预编译成AC自动机,启动时构建一次
+        self.request_router = RequestRouter(self.INTENT_INFO["request"])
+        self.prompts = self._init_prompts()
 
-        self.llm = ChatDeepSeek(model='deepseek-chat', api_key=config.DEEPSEEK_API_KEY)
+        # 各阶段(intent/cypher/answer)使用的大模型,按config.LLM_STAGE_BACKENDS选择后端,由start()创建
+        llm = components.pop('llm', None)
+        self.llms = {stage: llm for stage in config.LLM_STAGE_BACKENDS} if llm is not None else None
+        # 准入控制:按阶段(intent/cypher/answer)限制同时调用大模型的请求数,超出的排队,排满/超时直接拒绝
+        self.admission = AdmissionController(config.ADMISSION_CONFIG['stages']) if config.ADMISSION_CONFIG['enabled'] else None
 
-        self.embedding_model = HuggingFaceEmbeddings(model_name='BAAI/bge-small-zh-v1.5',
-                                                     encode_kwargs={"normalize_embeddings": True})
-        self.neo4j_vectors = self._init_neo4j_vectors()
+        # 查询安全检查:EXPLAIN拒绝全库扫描/笛卡尔积/无上限变长扩展,执行带事务超时
+        guard_config = config.QUERY_GUARD_CONFIG
+        self.query_guard = QueryGuard(reject_operators=guard_config['reject_operators'],
+                                      max_expand_hops=guard_config['max_expand_hops'],
+                                      plan_check=guard_config['plan_check'],
+                                      cache_size=guard_config['verdict_cache_size'],
+                                      # 升级前的config.py没有该项时使用默认值
+                                      timeout_ban_seconds=guard_config.get('timeout_ban_seconds', 300))
 
         self.json_parser = JsonOutputParser()
         self.str_parser = StrOutputParser()
 
-    def _init_neo4j_vectors(self):
-        labels = ['Cause', 'Check', 'Department', 'Disease', 'Drug', 'Duration', 'Food', 'People', 'Symptom', 'Treat',
-                  'Way', 'PreventWay']
-        return {label: self._create_neo4j_vector(label) for label in labels}
+        # 以下组件由start()在后台加载,就绪前为None
+        # 共享连接池:graph和12个向量索引共用一个driver,异步driver供achat使用,查询时不占用线程
+        self.neo4j_pool = None
+        self.graph = None
+        self.async_driver = None
+        self.schema_snapshot = None
+        self.embedding_model = None
+        self.intent_predictor = None
+        self.neo4j_vectors = {}
+        # 进程内实体对齐索引:命中的节点类型不再访问Neo4j的向量/全文索引
+        self.entity_index = None
+        # 精确名称/别名哈希表:实体本来就是图谱中的名称时直接对齐,不做向量检索
+        self.alias_dictionary = None
+        # 回答缓存:相同/语义相近的问题直接返回之前的回答
+        self.answer_cache = None
+        # 查询结果缓存:相同cypher+对齐后的实体直接返回之前的查询结果,不访问Neo4j
+        self.query_cache = None
+        # 多轮对话会话:保存各会话对齐后的实体和查询结果,追问时复用
+        self.session_store = None
+        self.session_locks = SessionLocks()
+        # 已验证的cypher模板:命中时大模型只需抽取实体,不必带着完整schema重新生成cypher
+        self.cypher_templates = None
+        # 同步实体对齐时并发检索用的线程池
+        self.align_executor = ThreadPoolExecutor(max_workers=len(VECTOR_LABELS), thread_name_prefix='entity-align')
+        # 同步chat推测执行cypher生成+实体对齐用的线程池
+        speculative = config.SPECULATIVE_CONSULT_CONFIG
+        self.speculative_executor = ThreadPoolExecutor(max_workers=speculative['workers'],
+                                                       thread_name_prefix='speculative-consult') \
+            if speculative['enabled'] else None
+        for attr, component in components.items():
+            setattr(self, attr, component)
+
+        # 各阶段耗时、大模型调用耗时/token数,以及准入控制、缓存、连接池的状态,/metrics输出
+        self.metrics = self._init_metrics(components.get('metrics') or ChatMetrics())
+
+        # 组件状态: pending / loading / ready / disabled / failed
+        self.components = {name: 'pending' for name in self._component_names()}
+        self.startup_errors = {}
+        self._startup_futures = {}
+        if not lazy:
+            self.start()
+            self.wait_ready()
+
+    #✨启动:各组件按依赖关系在线程池中并行加载
+    @staticmethod
+    def _component_names():
+        return ['llm', 'neo4j', 'embedding_model', 'intent_model', 'cypher_templates', 'answer_cache',
+                'query_cache', 'session_store', *[f'vector:{label}' for label in VECTOR_LABELS], 'entity_index',
+                'alias_dictionary']
+
+    def start(self):
+        '''提交后台加载任务后立即返回,重复调用无副作用'''
+        if self._startup_futures:
+            return self
+        executor = ThreadPoolExecutor(max_workers=config.STARTUP_WORKERS, thread_name_prefix='startup')
+        futures = self._startup_futures
+
+        def submit(name, attr, loader, requires=()):
+            futures[name] = executor.submit(self._load_component, name, attr, loader, [futures[r] for r in requires])
+
+        # 先提交被依赖的组件:线程池按提交顺序取任务,等待依赖的任务不会饿死被依赖的任务
+        submit('llm', 'llms', self._init_llms)
+        submit('neo4j', None, self._init_neo4j)
+        submit('embedding_model', 'embedding_model', self._init_embedding_model)
+        submit('intent_model', 'intent_predictor', self._init_intent_predictor)
+        submit('cypher_templates', 'cypher_templates', self._init_cypher_templates)
+        submit('answer_cache', 'answer_cache', self._init_answer_cache, ['embedding_model'])
+        submit('query_cache', 'query_cache', self._init_query_cache)
+        submit('session_store', 'session_store', self._init_session_store)
+        for label in VECTOR_LABELS:
+            submit(f'vector:{label}', None, lambda label=label: self._init_neo4j_vector(label),
+                   ['neo4j', 'embedding_model'])
+        submit('entity_index', 'entity_index', self._init_entity_index, ['neo4j'])
+        submit('alias_dictionary', 'alias_dictionary', self._init_alias_dictionary, ['entity_index'])
+        executor.shutdown(wait=False)
+        return self
+
+    def preload(self):
+        '''多进程部署时在master进程中调用:只加载不涉及网络连接的只读组件,fork后由各worker共享'''
+        if any(config.LLM_BACKENDS[name]['type'] == 'huggingface' for name in config.LLM_STAGE_BACKENDS.values()):
+            # 进程内小模型的权重同样在fork前加载
+            self._load_component('llm', 'llms', self._init_llms, [])
+        self._load_component('embedding_model', 'embedding_model', self._init_embedding_model, [])
+        self._load_component('intent_model', 'intent_predictor', self._init_intent_predictor, [])
+        return self
+
+    def _load_component(self, name, attr, loader, requires):
+        '''加载单个组件并记录状态,依赖组件失败时本组件同样记为失败;已就绪的组件(如预加载过的)直接跳过'''
+        if attr is not None and getattr(self, attr) is not None:
+            self.components[name] = 'ready'
+            return getattr(self, attr)
+        started = time.perf_counter()
+        try:
+            for future in requires:
+                future.result()
+            self.components[name] = 'loading'
+            component = loader()
+        except Exception as e:
+            self.components[name] = 'failed'
+            self.startup_errors[name] = repr(e)
+            logger.error(f'❌组件{name}加载失败-->{e!r}')
+            raise
+        if attr is not None:
+            setattr(self, attr, component)
+        self.components[name] = 'disabled' if component is None else 'ready'
+        logger.info(f'✅组件{name}加载完成,耗时{time.perf_counter() - started:.2f}s')
+        return component
+
+    def wait_ready(self, timeout=None):
+        '''阻塞等待后台加载结束,必需组件加载失败时抛出对应异常'''
+        wait(self._startup_futures.values(), timeout=timeout)
+        for name in REQUIRED_COMPONENTS:
+            future = self._startup_futures[name]
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        return self.is_ready()
+
+    def is_ready(self):
+        '''必需组件全部就绪且可选组件都已加载结束(可选组件失败时按关闭处理)'''
+        if any(state in ('pending', 'loading') for state in self.components.values()):
+            return False
+        return all(self.components[name] == 'ready' for name in REQUIRED_COMPONENTS)
+
+    def readiness(self):
+        return {'ready': self.is_ready(),
+                'components': dict(self.components),
+                'errors': dict(self.startup_errors)}
+
+    def _init_neo4j(self):
+        if self.neo4j_pool is None:
+            self.neo4j_pool = Neo4jPool.from_config(config.NEO4J_CONFIG, config.NEO4J_POOL_CONFIG)
+        self.graph = self.neo4j_pool.graph
+        self.async_driver = self.neo4j_pool.async_driver
+        self.schema_snapshot = SchemaSnapshot(self.graph, config.GRAPH_SCHEMA_CACHE_PATH, config.GRAPH_VERSION_PATH)
+        return self.neo4j_pool
+
+    def _init_llms(self):
+        '''同名后端只创建一次,多个阶段共用'''
+        backends = {}
+        llms = {}
+        for stage, name in config.LLM_STAGE_BACKENDS.items():
+            if name not in backends:
+                backends[name] = create_llm(config.LLM_BACKENDS[name])
+            llms[stage] = backends[name]
+        return llms
+
+    def _init_embedding_model(self):
+        return HuggingFaceEmbeddings(model_name='BAAI/bge-small-zh-v1.5',
+                                     encode_kwargs={"normalize_embeddings": True})
+
+    def _init_cypher_templates(self):
+        if not config.CYPHER_TEMPLATE_ENABLED:
+            return None
+        return CypherTemplateStore(config.CYPHER_TEMPLATE_PATH, **getattr(config, 'CYPHER_TEMPLATE_EVICTION', {}))
+
+    def _init_metrics(self, metrics):
+        metrics.add_gauge('chat_ready', '服务是否已就绪', lambda: [({}, int(self.is_ready()))])
+        metrics.add_gauge('admission_in_flight', '各阶段正在调用大模型的请求数',
+                          lambda: self._admission_samples('in_flight'))
+        metrics.add_gauge('admission_queued', '各阶段排队中的请求数', lambda: self._admission_samples('queued'))
+        metrics.add_gauge('admission_rejected_total', '各阶段被拒绝的请求数',
+                          lambda: [({'stage': stage, 'reason': reason}, stats[f'rejected_{reason}'])
+                                   for stage, stats in self._admission_stats().items()
+                                   for reason in ('queue_full', 'timeout')], metric_type='counter')
+        metrics.add_gauge('answer_cache_entries', '回答缓存条目数',
+                          lambda: [({}, self.answer_cache.stats()['size'])] if self.answer_cache is not None else [])
+        metrics.add_gauge('answer_cache_lookups_total', '回答缓存查询次数',
+                          lambda: [({'result': result}, self.answer_cache.stats()[result])
+                                   for result in ('exact_hits', 'semantic_hits', 'misses')]
+                          if self.answer_cache is not None else [], metric_type='counter')
+        metrics.add_gauge('query_cache_bytes', '查询结果缓存占用的内存(估算,字节)',
+                          lambda: [({}, self.query_cache.stats()['bytes'])] if self.query_cache is not None else [])
+        metrics.add_gauge('query_cache_lookups_total', '查询结果缓存查询次数',
+                          lambda: [({'result': result}, self.query_cache.stats()[result])
+                                   for result in ('hits', 'misses')]
+                          if self.query_cache is not None else [], metric_type='counter')
+        metrics.add_gauge('chat_sessions', '保存中的会话数',
+                          lambda: [({}, self.session_store.stats()['sessions'])] if self.session_store is not None else [])
+        metrics.add_gauge('query_guard_total', '查询安全检查:EXPLAIN次数、改写/拒绝/超时的查询数',
+                          lambda: [({'event': event}, self.query_guard.stats()[event])
+                                   for event in ('explained', 'rewritten', 'rejected', 'timeouts')],
+                          metric_type='counter')
+        metrics.add_gauge('neo4j_connections_in_use', '正在使用的Neo4j连接数',
+                          lambda: [({'driver': driver}, self.neo4j_pool.stats()[driver]['in_use'])
+                                   for driver in ('sync', 'async')] if self.neo4j_pool is not None else [])
+        return metrics
+
+    def _admission_stats(self):
+        return self.admission.stats() if self.admission is not None else {}
+
+    def _admission_samples(self, field):
+        return [({'stage': stage}, stats[field]) for stage, stats in self._admission_stats().items()]
+
+    def _init_prompts(self):
+        '''预编译提示词模板,意图关键词、咨询类别这些固定内容提前填好'''
+        return {
+            'intent': PromptTemplate.from_template(INTENT_PROMPT).partial(
+                request_keywords="、".join(self.INTENT_INFO["request"]),
+                consult_keywords="、".join(self.INTENT_INFO["consult"])),
+            'batch_intent': PromptTemplate.from_template(BATCH_INTENT_PROMPT).partial(
+                request_keywords="、".join(self.INTENT_INFO["request"]),
+                consult_keywords="、".join(self.INTENT_INFO["consult"])),
+            'unknown': PromptTemplate.from_template(UNKNOWN_PROMPT),
+            'cypher': PromptTemplate.from_template(CYPHER_PROMPT).partial(
+                consult_types="、".join(self.INTENT_INFO["consult"])),
+            'extract': PromptTemplate.from_template(EXTRACT_PROMPT),
+            'fused': PromptTemplate.from_template(FUSED_PROMPT).partial(
+                request_keywords="、".join(self.INTENT_INFO["request"]),
+                consult_types="、".join(self.INTENT_INFO["consult"])),
+            'answer': PromptTemplate.from_template(ANSWER_PROMPT),
+        }
+
+    def _init_intent_predictor(self):
+        '''本地意图分类模型:llm模式或模型文件不存在时返回None,全部走大模型'''
+        if config.INTENT_CLASSIFY_MODE == 'llm':
+            return None
+        if not config.INTENT_MODEL_PATH.exists():
+            logger.warning(f'⚠️未找到本地意图分类模型{config.INTENT_MODEL_PATH},意图识别将使用大模型(可执行python main.py intent_train训练)')
+            return None
+        return IntentPredictor()
+
+    def _init_answer_cache(self):
+        cache_config = config.ANSWER_CACHE_CONFIG
+        if not cache_config['enabled']:
+            return None
+        return AnswerCache(self.embedding_model,
+                           max_entries=cache_config['max_entries'],
+                           ttl_seconds=cache_config['ttl_seconds'],
+                           similarity_threshold=cache_config['similarity_threshold'],
+                           semantic=cache_config['semantic'])
+
+    def _semantic_key(self, question, prediction):
+        '''
+        回答缓存语义匹配的附加条件:(本地模型预测的咨询子类别, 问题中提到的图谱实体),两个问题完全相同才共用回答
+        (“高血压宜吃什么”和“高血压忌吃什么”实体相同、向量相近,但子类别不同);
+        没有本地模型或别名表、预测不出咨询子类别或没有提到实体时返回None,只做精确匹配
+        '''
+        if self.alias_dictionary is None or prediction is None or not prediction['consult']:
+            return None
+        entities = self.alias_dictionary.mentions(question)
+        if not entities:
+            return None
+        return prediction['consult'][0], entities
+
+    def _cache_lookup_key(self, question):
+        '''查回答缓存前先算本地模型的预测结果,返回(预测结果, 语义匹配条件),预测结果随后交给意图识别复用'''
+        prediction = self._predict_intent(question)
+        return prediction, self._semantic_key(question, prediction)
+
+    @staticmethod
+    def _skip_answer_cache(probe, query_result):
+        '''查询结果为空(包括被查询安全检查拒绝)时回答只是“没有查到”,不写入回答缓存'''
+        if probe is not None and not query_result:
+            probe['cacheable'] = False
+
+    def _init_query_cache(self):
+        cache_config = config.QUERY_CACHE_CONFIG
+        if not cache_config['enabled']:
+            return None
+        return QueryCache(config.GRAPH_VERSION_PATH,
+                          max_bytes=cache_config['max_mb'] * 1024 * 1024,
+                          check_interval=cache_config['version_check_interval'])
+
+    def _init_session_store(self):
+        if not config.SESSION_CONFIG['enabled']:
+            return None
+        return create_session_store(config.SESSION_CONFIG)
+
+    def _init_entity_index(self):
+        '''
+        优先从本地.npy文件内存映射加载;不存在、要求重建,或保存时的图谱版本号与当前不一致(json_sync导入过数据)时
+        从图数据库读取后保存。别名表由索引中的名称构建,随索引一起更新
+        '''
+        index_config = config.ENTITY_INDEX_CONFIG
+        if not index_config['enabled']:
+            return None
+        index_dir = index_config['index_dir']
+        graph_version = read_graph_version(config.GRAPH_VERSION_PATH)
+        saved_version = EntityIndex.saved_version(index_dir)
+        if not index_config['rebuild'] and any(index_dir.glob('*.npy')):
+            if saved_version == graph_version:
+                return EntityIndex.load(index_dir)
+            logger.info(f'🧲实体对齐索引的图谱版本{saved_version}与当前版本{graph_version}不一致,重新构建')
+        entity_index = EntityIndex.from_graph(self.graph)
+        entity_index.save(index_dir, graph_version)
+        logger.info(f'🧲实体对齐索引已构建-->{index_dir}')
+        return entity_index
+
+    def _init_alias_dictionary(self):
+        alias_config = config.ENTITY_ALIAS_CONFIG
+        if not alias_config['enabled']:
+            return None
+        names_by_label = {}
+        for label, prop in LABEL_TEXT_PROPERTY.items():
+            if self.entity_index is not None and label in self.entity_index:
+                names_by_label[label] = self.entity_index.texts(label)
+            else:
+                rows = self.graph.query(f'MATCH (n:{label}) WHERE n.{prop} IS NOT NULL RETURN n.{prop} AS text')
+                names_by_label[label] = [row['text'] for row in rows]
+        return AliasDictionary(names_by_label, AliasDictionary.load_aliases(alias_config['alias_path']))
+
+    def _init_neo4j_vector(self, label):
+        self.neo4j_vectors[label] = self._create_neo4j_vector(label)
+        return self.neo4j_vectors[label]
 
     def _create_neo4j_vector(self, label):
         if label == 'PreventWay':
@@ -52,166 +517,946 @@ class ChatService:
             index_name = f'{label.lower()}_vector_index'
             keyword_index_name = f'{label.lower()}_full_text_index'
 
-        return Neo4jVector.from_existing_index(
+        return self.neo4j_pool.vector_store(
             self.embedding_model,
-            url=config.NEO4J_CONFIG['uri'],
-            username=config.NEO4J_CONFIG['auth'][0],
-            password=config.NEO4J_CONFIG['auth'][1],
             index_name=index_name,
             keyword_index_name=keyword_index_name,
             search_type=SearchType.HYBRID
         )
     #✨🎈❗❗❗❗❗主方法
     # 修改chat主方法，添加意图分流逻辑🌻🌻🌻
-    # 在chat方法最开头先调用_classify_intent，根据意图走不同流程：
+    # 在chat方法最开头先调用_classify_intent_speculatively，根据意图走不同流程：
     # 若为consult（医疗咨询）：走原有 “生成
     # Cypher→查图谱→生成回答” 流程；
     # 若为request（事务办理）：直接返回操作引导（如 “请点击【挂号预约】按钮进行操作”），无需查图谱；
     # 若为unknown（未知）：返回提示（如 “暂未支持该需求，请换个问题试试”）。
-    def chat(self, question):
-        intent = self._classify_intent(question)
-        print('\n\n')
-        print(f'🎯用户意图分类结果:{intent}')
-        print('='*50)
+    def chat(self, question, session_id=None):
+        '''session_id:多轮对话的会话id,同一会话的追问可以省略上文提到的疾病等实体;为None时是无状态的单轮问答'''
+        with self.metrics.request('chat'):
+            session = self._open_session(session_id)
+            # 有上文的追问(如“那它忌吃什么”)在不同会话里含义不同,不读写回答缓存
+            if self.answer_cache is None or self._has_context(session):
+                answer = self._chat(question, session)
+            else:
+                with self.metrics.span('cache'):
+                    prediction, semantic_key = self._cache_lookup_key(question)
+                    answer, probe = self.answer_cache.lookup(question, semantic_key)
+                if answer is not None:
+                    logger.info(f'💾回答缓存命中-->{question}')
+                    self._record_turn(session, question)
+                else:
+                    answer = self._chat(question, session, prediction, probe)
+                    self.answer_cache.store(probe, answer)
+            self._save_session(session)
+            return answer
+
+    def _chat(self, question, session=None, prediction=None, probe=None):
+        '''prediction:查回答缓存时已算好的本地模型预测结果;probe:回答缓存的probe,查询结果为空时标记为不写入缓存'''
+        # 明显的事务办理问题(如“我要挂号”)直接返回引导,不调用任何模型
+        guide = self._fast_route(question)
+        if guide is not None:
+            return guide
+        with self.metrics.span('intent'):
+            # 本地模型的预测结果(意图、咨询子类别)只算一次,后面选模板候选时直接使用
+            if prediction is None:
+                prediction = self._predict_intent(question)
+            intent, prepared = self._classify_intent_speculatively(question, prediction, session)
+        self.metrics.count_intent(intent)
+        logger.info(f'🎯用户意图分类结果:{intent}')
         #⛳意图1：事务办理（request）→ 直接返回操作引导
         if intent == "request":
-            # 可根据具体关键词细化引导（如含“挂号”则引导挂号，含“报告”则引导查报告）
-            for req_keyword in self.INTENT_INFO["request"]:
-                # 把关键词和问题都转成小写，再判断是否包含核心词（更灵活）
-                # if req_keyword.replace("/", "").lower() in question.lower():
-                # if req_keyword in question:
-                # 1.🥀拆分关键词为核心词（比如“费用支付/退费”拆成["费用", "支付", "退费"]）
-                core_words = req_keyword.replace("/", " ").split()  # 先把/换成空格，再按空格拆分
-                # 2.🌾检查用户问题是否包含任何一个核心词（忽略大小写）
-                if any(word.lower() in question.lower() for word in core_words):
-                    return f"请通过【{req_keyword}】功能入口进行操作（点击页面对应按钮即可）"
-            return "请选择页面中的事务功能按钮（如挂号预约、报告查询等）进行操作"
+            return self._request_guide(question, prepared)
 
         #⛳意图2：未知需求→返回提示
         # elif intent == "unknown":
         #     return "暂未支持该类型的需求，请尝试咨询医疗相关问题（如“感冒症状”）或选择页面事务按钮"
         elif intent == "unknown":
             # 调用大模型，让大模型尝试回答未知问题
-            unknown_prompt = PromptTemplate.from_template('''
-                你是一个医疗行业领域的智能医生小助手,精通各种医学知识以及熟悉所有的医院诊断流程。
-                请你根据自己仅有的知识，尽可能回答用户的问题。如果确实无法回答，就回复“暂未支持该需求，请换个问题试试”。
-                
-                要求:
-                1.回答简洁、准确,使用人类的自然语言。
-                2.仅输出普通文本。
-                3.直接给出具体结论，无需额外冗余内容。
-
-                用户问题：{question}
-            ''')
-            formatted_prompt = unknown_prompt.format(question=question)
-            return self.str_parser.invoke(self.llm.invoke(formatted_prompt))
+            with self.metrics.span('answer'):
+                output = self._invoke_llm('answer', self._build_unknown_prompt(question, session))
+                return self.str_parser.invoke(output)
 
         #⛳意图3：医疗咨询（consult）→ 走原有图谱查询流程（以下为原有代码，不变）
         else:
             # 1.根据用户的question以及图数据库的schema 生成cypher语句以及需要对齐的实体
-            result = self._generate_cypher(question)
+            # 2.通过混合检索去做实体对齐(推测执行时这两步已经和意图识别同时进行,融合调用时cypher已经随意图一起生成)
+            if isinstance(prepared, Future):
+                result = prepared.result()
+            else:
+                result = self._prepare_consult(question, generated=prepared, session=session, prediction=prediction)
             cypher = result['cypher_query']
-            entities_to_align = result['entities_to_align']
-            print(f'🎉第一步结果-->{result}')
-            print(f'🎉生成的查询语句-->{cypher}')
-            print('=' * 50)
-
-            # 2.通过混合检索去做实体对齐
-            aligned_entities = self._entity_align(entities_to_align)
-            print(f'🥪第二步需要对齐的实体-->{aligned_entities}')
-            print('='*50)
+            aligned_entities = result['entities_to_align']
 
             # 3.执行cypher语句
-            query_result = self._execute_query(cypher,aligned_entities)
-            # print(f'🍱第三步执行cypher语句的结果-->{query_result}')
+            with self.metrics.span('query'):
+                query_result = self._execute_query(cypher,aligned_entities, session)
+            logger.debug(f'🍱第三步执行cypher语句的结果-->{query_result}')
+            self._remember_template(result, query_result)
+            self._skip_answer_cache(probe, query_result)
 
             # 4.根据用户问题和查询结果生成自然语言回复
-            answer = self._generate_answer(question,query_result)
+            with self.metrics.span('answer'):
+                answer = self._generate_answer(question,query_result, session)
+            self._record_turn(session, question, result, query_result)
             return answer
 
-    #🌻🌻🌻 新增：意图分类方法
-    def _classify_intent(self, question):
-        """判断用户问题的意图：request（事务）、consult（咨询）、unknown（未知）"""
-        # 1. 把意图关键词拼接成提示，让LLM判断
-        intent_prompt = PromptTemplate.from_template('''
-            请判断用户问题属于以下哪种意图：
-            - request（事务办理）：包含{request_keywords}
-            - consult（医疗咨询）：包含{consult_keywords}
-            若都不属于，输出"unknown"。
-            要求：仅输出"request"、"consult"或"unknown"，不添加任何多余内容。
-            用户问题：{question}
-        ''')
-        # 2. 格式化提示（把意图关键词列表转成字符串）
-        formatted_prompt = intent_prompt.format(
-            request_keywords="、".join(self.INTENT_INFO["request"]),
-            consult_keywords="、".join(self.INTENT_INFO["consult"]),
-            question=question
-        )
-        # 3. 调用LLM获取意图结果
-        intent_result = self.llm.invoke(formatted_prompt)
+    # 异步版本的chat:各阶段使用LLM/向量库的异步调用以及Neo4j异步驱动,等待网络时不占用工作线程
+    async def achat(self, question, session_id=None):
+        with self.metrics.request('achat'):
+            async with self._asession(session_id) as session:
+                if self.answer_cache is None or self._has_context(session):
+                    answer = await self._achat(question, session)
+                else:
+                    with self.metrics.span('cache'):
+                        prediction, semantic_key = self._cache_lookup_key(question)
+                        answer, probe = await self.answer_cache.alookup(question, semantic_key)
+                    if answer is not None:
+                        logger.info(f'💾回答缓存命中-->{question}')
+                        self._record_turn(session, question)
+                    else:
+                        answer = await self._achat(question, session, prediction, probe)
+                        self.answer_cache.store(probe, answer)
+            return answer
+
+
+    async def _achat(self, question, session=None, prediction=None, probe=None):
+        guide = self._fast_route(question)
+        if guide is not None:
+            return guide
+        with self.metrics.span('intent'):
+            if prediction is None:
+                prediction = self._predict_intent(question)
+            intent, prepared = await self._aclassify_intent_speculatively(question, prediction, session)
+        self.metrics.count_intent(intent)
+        logger.info(f'🎯用户意图分类结果:{intent}')
+        if intent == "request":
+            return self._request_guide(question, prepared)
+        elif intent == "unknown":
+            with self.metrics.span('answer'):
+                output = await self._ainvoke_llm('answer', self._build_unknown_prompt(question, session))
+            return self.str_parser.invoke(output)
+        else:
+            if isinstance(prepared, asyncio.Task):
+                result = await prepared
+            else:
+                result = await self._aprepare_consult(question, generated=prepared, session=session,
+                                                      prediction=prediction)
+            cypher = result['cypher_query']
+            aligned_entities = result['entities_to_align']
+            with self.metrics.span('query'):
+                query_result = await self._aexecute_query(cypher, aligned_entities, session)
+            self._remember_template(result, query_result)
+            self._skip_answer_cache(probe, query_result)
+            with self.metrics.span('answer'):
+                answer = await self._agenerate_answer(question, query_result, session)
+            self._record_turn(session, question, result, query_result)
+            return answer
+
+    # 流式版本:依次产出意图、实体对齐进度,以及回答的增量token,供/chat/stream推送给前端
+    async def astream_chat(self, question, session_id=None):
+        with self.metrics.request('stream'):
+            async with self._asession(session_id) as session:
+                prediction = probe = None
+                if self.answer_cache is not None and not self._has_context(session):
+                    with self.metrics.span('cache'):
+                        prediction, semantic_key = self._cache_lookup_key(question)
+                        answer, probe = await self.answer_cache.alookup(question, semantic_key)
+                    if answer is not None:
+                        self._record_turn(session, question)
+                        yield {'event': 'cache', 'data': 'hit'}
+                        yield {'event': 'token', 'data': answer}
+                        yield {'event': 'done', 'data': ''}
+                        return
+                tokens = []
+                async for event in self._astream_chat(question, session, prediction, probe):
+                    if event['event'] == 'token':
+                        tokens.append(event['data'])
+                    yield event
+                if probe is not None:
+                    self.answer_cache.store(probe, ''.join(tokens))
+
+    async def _astream_chat(self, question, session=None, prediction=None, probe=None):
+        guide = self._fast_route(question)
+        prepared = None
+        if guide is not None:
+            intent = "request"
+        else:
+            with self.metrics.span('intent'):
+                if prediction is None:
+                    prediction = self._predict_intent(question)
+                intent, prepared = await self._aclassify_intent_speculatively(question, prediction, session)
+            self.metrics.count_intent(intent)
+        yield {'event': 'intent', 'data': intent}
+        if guide is not None:
+            yield {'event': 'token', 'data': guide}
+        elif intent == "request":
+            yield {'event': 'token', 'data': self._request_guide(question, prepared)}
+        elif intent == "unknown":
+            # 只统计大模型生成token的时间,不含客户端读取流的时间
+            with self.metrics.span('answer') as span:
+                async for token in self._astream_llm('answer', self._build_unknown_prompt(question, session)):
+                    with span.paused():
+                        yield {'event': 'token', 'data': token}
+        else:
+            if isinstance(prepared, asyncio.Task):
+                # 推测执行时实体已经对齐完成,直接推送对齐结果
+                result = await prepared
+                for done_count, aligned in enumerate(result['entities_to_align'], 1):
+                    yield {'event': 'align',
+                           'data': {'entity': aligned['entity'], 'label': aligned['label'],
+                                    'done': done_count, 'total': len(result['entities_to_align'])}}
+            else:
+                result = prepared
+                if result is None:
+                    with self.metrics.span('cypher'):
+                        result = await self._agenerate_cypher(question, session, prediction)
+
+                # 会话上文中对齐过的实体最先推送,其余的哪个先对齐完成就先推送哪个
+                with self.metrics.span('align') as span:
+                    pending = self._reuse_entities(result['entities_to_align'], session)
+                    tasks = [self._aresolved(item) for item in result['entities_to_align'] if item not in pending]
+                    tasks += await self._aalign_tasks(pending)
+                    for done_count, task in enumerate(asyncio.as_completed(tasks), 1):
+                        aligned = await task
+                        with span.paused():
+                            yield {'event': 'align',
+                                   'data': {'entity': aligned['entity'], 'label': aligned['label'],
+                                            'done': done_count, 'total': len(tasks)}}
+            cypher = result['cypher_query']
+            entities_to_align = result['entities_to_align']
+
+            with self.metrics.span('query'):
+                query_result = await self._aexecute_query(cypher, entities_to_align, session)
+            self._remember_template(result, query_result)
+            self._skip_answer_cache(probe, query_result)
+            with self.metrics.span('answer') as span:
+                async for token in self._astream_llm('answer',
+                                                     self._build_answer_prompt(question, query_result, session)):
+                    with span.paused():
+                        yield {'event': 'token', 'data': token}
+            self._record_turn(session, question, result, query_result)
+        yield {'event': 'done', 'data': ''}
+
+    # 批量问答:意图识别合并成一次大模型调用,所有问题的实体一次计算向量,相同的图谱查询只执行一次,
+    # 各问题的cypher生成、回答生成并发进行;返回的回答与问题顺序一致
+    async def abatch_chat(self, questions):
+        with self.metrics.request('batch'):
+            # 同一批里重复的问题只处理一次
+            unique = list(dict.fromkeys(questions))
+            answers = dict.fromkeys(unique)
+            predictions = dict.fromkeys(unique)
+            probes = dict.fromkeys(unique)
+            if self.answer_cache is not None:
+                with self.metrics.span('cache'):
+                    keys = {question: self._cache_lookup_key(question) for question in unique}
+                    lookups = await asyncio.gather(*[self.answer_cache.alookup(question, keys[question][1])
+                                                     for question in unique])
+                for question, (answer, probe) in zip(unique, lookups):
+                    answers[question], probes[question] = answer, probe
+                    predictions[question] = keys[question][0]
+            pending = [question for question in unique if answers[question] is None]
+            outcomes = await self._abatch_chat(pending, [predictions[question] for question in pending],
+                                               [probes[question] for question in pending])
+            for question, answer in zip(pending, outcomes):
+                if isinstance(answer, BaseException):
+                    # 单个问题失败只影响它自己的回答,也不写入回答缓存
+                    answers[question] = self._batch_error_answer(answer)
+                    continue
+                answers[question] = answer
+                if probes[question] is not None:
+                    self.answer_cache.store(probes[question], answer)
+            return [answers[question] for question in questions]
+
+    async def _abatch_chat(self, questions, predictions=None, probes=None):
+        '''
+        返回与questions一一对应的回答;批量流程中某个问题出错(如cypher的JSON不合格、Neo4j报错)时只把该问题
+        改走单个问题的流程,仍然失败(或准入控制拒绝)时对应位置为异常对象。
+        predictions/probes为与questions一一对应的本地模型预测结果/回答缓存的probe(查回答缓存时得到)
+        '''
+        predictions = predictions or [None] * len(questions)
+        probes = probes or [None] * len(questions)
+        answers = [self._fast_route(question) for question in questions]
+        routed = [i for i, answer in enumerate(answers) if answer is None]
+        failed = {}
+        predictions = {i: predictions[i] if predictions[i] is not None else self._predict_intent(questions[i])
+                       for i in routed}
+        with self.metrics.span('intent'):
+            intents = await self._abatch_classify_intent([questions[i] for i in routed],
+                                                         [predictions[i] for i in routed])
+        consult, unknown = [], []
+        for i, intent in self._batch_outcomes(questions, routed, intents, 'intent', failed).items():
+            self.metrics.count_intent(intent)
+            if intent == "request":
+                answers[i] = self._request_guide(questions[i])
+            elif intent == "unknown":
+                unknown.append(i)
+            else:
+                consult.append(i)
+        logger.info(f'🎯批量意图分类结果:{len(consult)}个consult,{len(unknown)}个unknown,'
+                    f'{len(routed) - len(consult) - len(unknown) - len(failed)}个request')
+
+        with self.metrics.span('cypher'):
+            generated = await asyncio.gather(*[self._agenerate_cypher(questions[i], prediction=predictions[i])
+                                               for i in consult], return_exceptions=True)
+        results = self._batch_outcomes(questions, consult, generated, 'cypher', failed)
+        with self.metrics.span('align'):
+            align_errors = await self._abatch_align(results)
+        for i, error in align_errors.items():
+            self._batch_outcomes(questions, [i], [error], 'align', failed)
+            del results[i]
+        with self.metrics.span('query'):
+            queried = await self._abatch_execute_query(list(results.values()))
+        query_results = self._batch_outcomes(questions, list(results), queried, 'query', failed)
+        for i, query_result in query_results.items():
+            self._remember_template(results[i], query_result)
+            self._skip_answer_cache(probes[i], query_result)
+
+        with self.metrics.span('answer'):
+            generated = await asyncio.gather(
+                *[self._agenerate_answer(questions[i], query_result) for i, query_result in query_results.items()],
+                *[self._ainvoke_llm('answer', self._build_unknown_prompt(questions[i])) for i in unknown],
+                return_exceptions=True)
+        outputs = self._batch_outcomes(questions, [*query_results, *unknown], generated, 'answer', failed)
+        for i, output in outputs.items():
+            answers[i] = self.str_parser.invoke(output)
+
+        # 准入控制拒绝说明大模型已饱和,不再重试;其余的按单个问题重新处理一次
+        retry = [i for i, error in failed.items() if not isinstance(error, AdmissionRejected)]
+        for i, error in failed.items():
+            answers[i] = error
+        retried = await asyncio.gather(*[self._achat(questions[i], prediction=predictions[i], probe=probes[i])
+                                         for i in retry], return_exceptions=True)
+        for i, answer in zip(retry, retried):
+            answers[i] = answer
+            if isinstance(answer, BaseException):
+                logger.error(f'❌批量问答中的问题单独处理仍然失败-->{questions[i]}:{answer!r}')
+        return answers
+
+    @staticmethod
+    def _batch_outcomes(questions, indices, outcomes, stage, failed):
+        '''gather(return_exceptions=True)的结果按问题序号拆分:出错的问题记入failed,返回{问题序号:结果}'''
+        succeeded = {}
+        for i, outcome in zip(indices, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning(f'⚠️批量问答的{stage}阶段出错,该问题改为单独处理-->{questions[i]}:{outcome!r}')
+                failed[i] = outcome
+            else:
+                succeeded[i] = outcome
+        return succeeded
+
+    @staticmethod
+    def _batch_error_answer(error):
+        if isinstance(error, AdmissionRejected):
+            return "当前咨询人数较多,请稍后再试"
+        return "暂时无法回答这个问题,请稍后再试"
+
+    async def _abatch_classify_intent(self, questions, predictions):
+        '''本地模型判断不了的问题,每intent_batch_size个合并成一次大模型调用;出错的问题对应位置为异常对象'''
+        intents = [self._local_intent(prediction) for prediction in predictions]
+        remaining = [i for i, intent in enumerate(intents) if intent is None]
+        size = config.BATCH_CHAT_CONFIG['intent_batch_size']
+        chunks = [remaining[start:start + size] for start in range(0, len(remaining), size)]
+        chunk_intents = await asyncio.gather(*[self._abatch_llm_intent([questions[i] for i in chunk])
+                                               for chunk in chunks], return_exceptions=True)
+        for chunk, llm_intents in zip(chunks, chunk_intents):
+            if isinstance(llm_intents, BaseException):
+                llm_intents = [llm_intents] * len(chunk)
+            for i, intent in zip(chunk, llm_intents):
+                intents[i] = intent
+        return intents
+
+    async def _abatch_llm_intent(self, questions):
+        '''输出不是与问题一一对应的意图列表时,改为逐个调用'''
+        if len(questions) > 1:
+            output = await self._ainvoke_llm('intent', self._build_batch_intent_prompt(questions))
+            try:
+                intents = self.json_parser.invoke(output)
+            except OutputParserException:
+                intents = None
+            if (isinstance(intents, list) and len(intents) == len(questions)
+                    and all(intent in ("request", "consult", "unknown") for intent in intents)):
+                return intents
+            logger.warning(f'⚠️批量意图识别的输出不合格,改为逐个调用-->{output.content}')
+        return await asyncio.gather(*[self._allm_intent(question) for question in questions], return_exceptions=True)
+
+    def _build_batch_intent_prompt(self, questions):
+        numbered = '\n'.join(f'{i}.{question}' for i, question in enumerate(questions, 1))
+        return self.prompts['batch_intent'].format(questions=numbered)
+
+    async def _abatch_align(self, results):
+        '''
+        results为{问题序号:cypher生成结果};所有问题的待对齐实体去重后一次计算向量,再并发检索,结果写回各问题的实体。
+        返回{问题序号:异常},只包含有实体对齐失败的问题
+        '''
+        pending = {i: [item for item in result['entities_to_align'] if not self._exact_align(item)]
+                   for i, result in results.items()}
+        keys = list(dict.fromkeys((item['label'], item['entity']) for items in pending.values() for item in items))
+        if not keys:
+            return {}
+        try:
+            embeddings = await self.embedding_model.aembed_documents([entity for _, entity in keys])
+        except Exception as e:
+            return {i: e for i, items in pending.items() if items}
+        aligned = await asyncio.gather(*[self._aalign_one({'label': label, 'entity': entity}, embedding)
+                                         for (label, entity), embedding in zip(keys, embeddings)],
+                                       return_exceptions=True)
+        outcomes = dict(zip(keys, aligned))
+        errors = {}
+        for i, items in pending.items():
+            for item in items:
+                outcome = outcomes[(item['label'], item['entity'])]
+                if isinstance(outcome, BaseException):
+                    errors[i] = outcome
+                else:
+                    item['entity'] = outcome['entity']
+        return errors
+
+    async def _abatch_execute_query(self, results):
+        '''相同的cypher+参数只查询一次,多个问题共用查询结果;查询出错时共用它的问题对应位置为异常对象'''
+        keys = [query_key(result['cypher_query'], self._build_query_params(result['entities_to_align']))
+                for result in results]
+        unique = {}
+        for key, result in zip(keys, results):
+            unique.setdefault(key, result)
+        query_results = await asyncio.gather(*[self._aexecute_query(result['cypher_query'],
+                                                                    result['entities_to_align'])
+                                               for result in unique.values()], return_exceptions=True)
+        by_key = dict(zip(unique, query_results))
+        return [by_key[key] for key in keys]
+
+    #✨所有大模型调用都经过准入控制:按阶段限制并发,饱和时抛出AdmissionRejected;拿到额度后才开始计时
+    def _llm_slot(self, stage):
+        return nullcontext() if self.admission is None else self.admission.slot(stage)
+
+    def _allm_slot(self, stage):
+        return nullcontext() if self.admission is None else self.admission.aslot(stage)
+
+    def _invoke_llm(self, stage, prompt):
+        with self._llm_slot(stage), self.metrics.llm_call(stage) as call:
+            result = self.llms[stage].invoke(prompt)
+            call.record(result)
+            return result
+
+    async def _ainvoke_llm(self, stage, prompt):
+        async with self._allm_slot(stage):
+            with self.metrics.llm_call(stage) as call:
+                result = await self.llms[stage].ainvoke(prompt)
+                call.record(result)
+                return result
+
+    async def _astream_llm(self, stage, prompt):
+        # 流式输出期间一直占用该阶段的额度,token数在最后一个chunk的usage_metadata中
+        async with self._allm_slot(stage):
+            with self.metrics.llm_call(stage) as call:
+                async for chunk in self.llms[stage].astream(prompt):
+                    call.record(chunk)
+                    if chunk.content:
+                        with call.paused():
+                            yield chunk.content
+
+    def _fast_route(self, question):
+        '''模型调用之前的关键词路由:纯事务问题返回操作引导,否则返回None'''
+        if not config.REQUEST_ROUTER_ENABLED:
+            return None
+        req_keyword = self.request_router.route(question)
+        if req_keyword is None:
+            return None
+        logger.info(f'⚡关键词路由命中事务-->{req_keyword}')
+        return self._format_guide(req_keyword)
+
+    def _request_guide(self, question, fused=None):
+        '''事务办理(request):根据关键词返回对应功能入口的操作引导;融合调用已给出事务类别时直接使用'''
+        if fused is not None and fused.get('request_type') in self.INTENT_INFO["request"]:
+            return self._format_guide(fused['request_type'])
+        # 可根据具体关键词细化引导（如含“挂号”则引导挂号，含“报告”则引导查报告）
+        # 关键词路由没有短路的问题才会走到这里,沿用按功能入口顺序匹配核心词的方式
+        for req_keyword in self.INTENT_INFO["request"]:
+            # 把关键词和问题都转成小写，再判断是否包含核心词（更灵活）
+            # 1.🥀拆分关键词为核心词（比如“费用支付/退费”拆成["费用", "支付", "退费"]）
+            core_words = req_keyword.replace("/", " ").split()  # 先把/换成空格，再按空格拆分
+            # 2.🌾检查用户问题是否包含任何一个核心词（忽略大小写）
+            if any(word.lower() in question.lower() for word in core_words):
+                return self._format_guide(req_keyword)
+        return "请选择页面中的事务功能按钮（如挂号预约、报告查询等）进行操作"
+
+    def _format_guide(self, req_keyword):
+        return f"请通过【{req_keyword}】功能入口进行操作（点击页面对应按钮即可）"
+
+    def _build_unknown_prompt(self, question, session=None):
+        return self.prompts['unknown'].format(question=self._with_context(question, session))
+
+    #✨多轮会话:上文拼进提示词补全指代,对齐过的实体、执行过的查询在同一会话内复用
+    def _open_session(self, session_id):
+        '''请求带session_id且启用了会话时返回会话上下文,否则返回None(无状态问答)'''
+        if session_id is None or self.session_store is None:
+            return None
+        session = self.session_store.get(session_id)
+        if session.has_context():
+            self.metrics.count_session('context')
+        return session
+
+    def _save_session(self, session):
+        if session is not None:
+            self.session_store.save(session)
+
+    @asynccontextmanager
+    async def _asession(self, session_id):
+        '''
+        异步版本的_open_session+_save_session:同一会话的请求排队依次处理(见SessionLocks),
+        shelve等读写文件的会话存储放到线程中执行;问答出错时不写回
+        '''
+        if session_id is None or self.session_store is None:
+            yield None
+            return
+        async with self.session_locks.hold(session_id):
+            if self.session_store.blocking:
+                session = await asyncio.to_thread(self._open_session, session_id)
+            else:
+                session = self._open_session(session_id)
+            yield session
+            if self.session_store.blocking:
+                await asyncio.to_thread(self._save_session, session)
+            else:
+                self._save_session(session)
+
+    @staticmethod
+    def _has_context(session):
+        return session is not None and session.has_context()
+
+    def _with_context(self, question, session):
+        '''有上文时把最近几轮的问题和实体拼在用户问题后面,交给大模型补全“它”“这个病”等指代'''
+        if not self._has_context(session):
+            return question
+        return f'{question}(对话上文:{session.context_text(config.SESSION_CONFIG["context_turns"])})'
+
+    def _reuse_entities(self, entities_to_align, session):
+        '''返回仍需对齐的实体:会话上文中对齐过的实体直接复用对齐结果'''
+        if session is None:
+            return entities_to_align
+        pending = session.resolve(entities_to_align)
+        if len(pending) < len(entities_to_align):
+            self.metrics.count_session('entity_reused', len(entities_to_align) - len(pending))
+        return pending
+
+    def _session_rows(self, session, cypher, params):
+        '''会话上一轮执行过同一条查询时直接使用其结果'''
+        if session is None:
+            return None
+        query_result = session.rows(cypher, params)
+        if query_result is not None:
+            logger.info(f'🧷复用会话上文的查询结果-->{params}')
+            self.metrics.count_session('rows_reused')
+        return query_result
+
+    def _record_turn(self, session, question, result=None, query_result=None):
+        '''consult问题记录对齐后的实体和查询结果;命中回答缓存时只记录问题'''
+        if session is None:
+            return
+        params = None if result is None else self._build_query_params(result['entities_to_align'])
+        session.add_turn(question, result, params, query_result)
+
+    #🌻🌻🌻 新增：意图分类方法(本地模型判断不了时调用LLM;入口为下面的_classify_intent_speculatively)
+    def _llm_intent(self, question, session=None):
+        intent_result = self._invoke_llm('intent', self._build_intent_prompt(question, session))
         return self.str_parser.invoke(intent_result).strip()
 
+    async def _allm_intent(self, question, session=None):
+        intent_result = await self._ainvoke_llm('intent', self._build_intent_prompt(question, session))
+        return self.str_parser.invoke(intent_result).strip()
 
-    def _generate_cypher(self, question):
-        prompt = '''
-                你是一个专业的Neo4j Cypher查询生成器,你的任务是根据用户问题生成一条Cypher查询语句,用于从知识图谱中获取回答用户问题所需的信息。
-                
-                用户问题:{question}
-                知识图谱结构信息:{schema_info}
-                
-                要求:
-                1.生成参数化Cypher查询语句,用param_0,param_1等代替具体值
-                2.识别需要对齐的实体
-                3.必须严格使用以下JSON格式输出结果
-                {{
-                    "cypher_query": "生成的Cypher语句",
-                    "entities_to_align":[
-                        {{
-                            "param_name": "param_0",
-                            "entity": "原始实体名称",
-                            "label": "节点类型"
-                        }}
-                    ]
-                }}
+    #✨意图需要大模型判断时,提前拿到consult流程需要的cypher,省掉一次大模型往返:
+    # 融合调用:一次调用同时输出意图和cypher,输出不符合格式时退回多次调用的流程
+    # 推测执行:consult占绝大多数,等待意图结果的同时生成cypher并对齐实体,意图不是consult时丢弃
+    def _classify_intent_speculatively(self, question, prediction, session=None):
+        '''
+        判断用户问题的意图：request（事务）、consult（咨询）、unknown（未知），本地模型优先,判断不了时调用LLM;
+        返回(意图, prepared):prepared为融合调用的结果字典(cypher尚未对齐实体)、
+        推测执行cypher生成+实体对齐的Future,或None(本地模型已能判断意图/未启用/意图不是consult)
+        '''
+        local_intent = self._local_intent(prediction)
+        if local_intent is not None:
+            return local_intent, None
+        if config.FUSED_PROMPT_ENABLED:
+            fused = self._parse_fused(self._invoke_llm('fused', self._build_fused_prompt(question, prediction,
+                                                                                        session)))
+            if fused is not None:
+                return fused.pop('intent'), fused
+        if self.speculative_executor is None:
+            return self._llm_intent(question, session), None
+        speculation = self.speculative_executor.submit(self._prepare_consult, question, None, session, prediction)
+        try:
+            intent = self._llm_intent(question, session)
+        except BaseException:
+            speculation.cancel()
+            raise
+        return intent, self._settle_speculation(speculation, intent)
+
+    async def _aclassify_intent_speculatively(self, question, prediction, session=None):
+        local_intent = self._local_intent(prediction)
+        if local_intent is not None:
+            return local_intent, None
+        if config.FUSED_PROMPT_ENABLED:
+            fused = self._parse_fused(await self._ainvoke_llm('fused', self._build_fused_prompt(question, prediction,
+                                                                                                session)))
+            if fused is not None:
+                return fused.pop('intent'), fused
+        if not config.SPECULATIVE_CONSULT_CONFIG['enabled']:
+            return await self._allm_intent(question, session), None
+        speculation = asyncio.create_task(self._aprepare_consult(question, session=session, prediction=prediction))
+        # 被丢弃的任务出错时不再报"Task exception was never retrieved"
+        speculation.add_done_callback(lambda task: task.cancelled() or task.exception())
+        try:
+            intent = await self._allm_intent(question, session)
+        except BaseException:
+            speculation.cancel()
+            raise
+        return intent, self._settle_speculation(speculation, intent)
+
+    def _settle_speculation(self, speculation, intent):
+        '''意图不是consult时丢弃预先执行的结果:还没开始/还在等待的直接取消,已在线程中执行的让它跑完后丢弃'''
+        if intent in ("request", "unknown"):
+            speculation.cancel()
+            self.metrics.count_speculation('discarded')
+            logger.info(f'🗑️意图为{intent},丢弃推测执行的cypher')
+            return None
+        self.metrics.count_speculation('used')
+        return speculation
+
+    def _build_fused_prompt(self, question, prediction, session=None):
+        candidates = self._template_candidates(prediction)
+        candidates_info = '；'.join(f'{consult_type}:' + '或'.join(str(list(labels)) for labels in label_sets)
+                                   for consult_type, label_sets in candidates.items()) or '无'
+        return self.prompts['fused'].format(question=self._with_context(question, session), schema_info=self.schema_snapshot.get(),
+                                            candidates=candidates_info)
+
+    def _parse_fused(self, output):
+        '''
+        校验融合调用的输出(JSON格式、字段取值、节点类型),不合格时返回None;
+        consult意图优先使用预置查询库/模板中验证过的cypher,没有时才使用生成的cypher
+        '''
+        try:
+            fused = FusedOutput.model_validate(self.json_parser.invoke(output)).model_dump()
+            unknown_labels = {item['label'] for item in fused['entities_to_align']} - set(VECTOR_LABELS)
+            if unknown_labels:
+                raise ValueError(f'未知的节点类型{unknown_labels}')
+            if fused['intent'] != "consult":
+                result = {'request_type': fused['request_type']}
+            else:
+                result = self._match_template(fused)
+                if result is None:
+                    if not fused['cypher_query'].strip():
+                        raise ValueError('没有可用的预置查询/模板,也没有生成cypher')
+                    result = self._prepare_generated(fused)
+        except (OutputParserException, ValidationError, ValueError) as e:
+            logger.warning(f'⚠️融合调用的输出不合格,改为分步调用-->{e}')
+            self.metrics.count_fused('fallback')
+            return None
+        self.metrics.count_fused('ok')
+        return {**result, 'intent': fused['intent']}
+
+    def _prepare_consult(self, question, generated=None, session=None, prediction=None):
+        '''consult流程的前两步:生成cypher(generated为融合调用已生成的结果时跳过)、实体对齐(会话上文中对齐过的实体直接复用)'''
+        result = generated
+        if result is None:
+            with self.metrics.span('cypher'):
+                result = self._generate_cypher(question, session, prediction)
+        logger.debug(f'🎉第一步结果-->{result}')
+        logger.info(f'🎉生成的查询语句-->{result["cypher_query"]}')
+        with self.metrics.span('align'):
+            self._entity_align(self._reuse_entities(result['entities_to_align'], session))
+        logger.info(f'🥪第二步需要对齐的实体-->{result["entities_to_align"]}')
+        return result
+
+    async def _aprepare_consult(self, question, generated=None, session=None, prediction=None):
+        result = generated
+        if result is None:
+            with self.metrics.span('cypher'):
+                result = await self._agenerate_cypher(question, session, prediction)
+        logger.info(f'🎉生成的查询语句-->{result["cypher_query"]}')
+        with self.metrics.span('align'):
+            await self._aentity_align(self._reuse_entities(result['entities_to_align'], session))
+        return result
+
+    def _predict_intent(self, question):
+        '''本地意图模型的预测结果{intent, confidence, consult},未启用本地模型时返回None'''
+        if self.intent_predictor is None:
+            return None
+        prediction = self.intent_predictor.predict(question)
+        logger.debug(f'🧭本地意图模型结果-->{prediction}')
+        return prediction
+
+    @staticmethod
+    def _local_intent(prediction):
+        '''
+        本地模型识别的意图;未启用本地模型时返回None,交给大模型判断。
+        hybrid模式下置信度不足,或判为request/consult却没有任何一个子类别超过阈值时也返回None:
+        训练数据里没有闲聊等无关问题,“今天天气怎么样”会被高置信度地判成request,但给不出事务类别
+        '''
+        if prediction is None:
+            return None
+        if config.INTENT_CLASSIFY_MODE == 'hybrid':
+            if prediction['confidence'] < config.INTENT_CONFIDENCE_THRESHOLD:
+                return None
+            if prediction['intent'] in ('request', 'consult') and not prediction[prediction['intent']]:
+                return None
+        return prediction['intent']
+
+    def _build_intent_prompt(self, question, session=None):
+        return self.prompts['intent'].format(question=self._with_context(question, session))
+
+
+    def _generate_cypher(self, question, session=None, prediction=None):
+        '''prediction为本地意图模型已有的预测结果,用来缩小模板候选范围'''
+        candidates = self._template_candidates(prediction)
+        if candidates:
+            # 有可用模板时只让大模型抽取实体(提示词不带schema),命中模板即可直接使用;
+            # 抽取结果不合格或没有命中模板时再用完整的cypher提示词
+            output = self._invoke_llm('cypher', self._build_extract_prompt(question, candidates, session))
+            result = self._parse_extracted(output)
+            if result is not None:
+                return result
+        output = self._invoke_llm('cypher', self._build_cypher_prompt(question, session))
+        return self._prepare_generated(self.json_parser.invoke(output))
+
+    async def _agenerate_cypher(self, question, session=None, prediction=None):
+        candidates = self._template_candidates(prediction)
+        if candidates:
+            output = await self._ainvoke_llm('cypher', self._build_extract_prompt(question, candidates, session))
+            result = self._parse_extracted(output)
+            if result is not None:
+                return result
+        output = await self._ainvoke_llm('cypher', self._build_cypher_prompt(question, session))
+        return self._prepare_generated(self.json_parser.invoke(output))
+
+    def _parse_extracted(self, output):
+        '''实体抽取的输出命中预置查询/模板时返回cypher生成结果;输出不合格或没有命中时返回None'''
+        try:
+            return self._match_template(self.json_parser.invoke(output))
+        except (OutputParserException, AttributeError, KeyError, TypeError) as e:
+            logger.warning(f'⚠️实体抽取的输出不合格,改用完整的cypher提示词-->{e!r}')
+            return None
+
+    def _template_candidates(self, prediction):
+        '''
+        可能命中的预置查询/模板 {咨询子类别:[(节点类型,...),...]}。
+        本地意图模型(prediction为其预测结果)能判断子类别时只看该子类别,否则列出所有可用的子类别交给大模型选择
         '''
+        if not config.CYPHER_LIBRARY_ENABLED and self.cypher_templates is None:
+            return {}
+        consult_types = self.INTENT_INFO["consult"]
+        if prediction is not None:
+            consult_types = prediction['consult'][:1] or consult_types
+        candidates = {}
+        for consult_type in consult_types:
+            label_sets = []
+            if config.CYPHER_LIBRARY_ENABLED and consult_type in CONSULT_QUERIES:
+                label_sets.append(CONSULT_QUERIES[consult_type][0])
+            if self.cypher_templates is not None:
+                label_sets += [labels for labels in self.cypher_templates.label_sets(consult_type)
+                               if labels not in label_sets]
+            if label_sets:
+                candidates[consult_type] = label_sets
+        return candidates
+
+    def _match_template(self, extracted):
+        '''先查手写的预置查询库,再查运行中积累的模板'''
+        consult_type = extracted.get('consult_type')
+        entities = [{'param_name': f'param_{i}', 'entity': item['entity'], 'label': item['label']}
+                    for i, item in enumerate(extracted.get('entities_to_align', []))]
+        _, entities = canonicalize('', entities)
+        labels = [item['label'] for item in entities]
+        cypher = get_library_query(consult_type, labels) if config.CYPHER_LIBRARY_ENABLED else None
+        if cypher is not None:
+            logger.info(f'📚预置查询命中-->{consult_type}:{cypher}')
+        elif self.cypher_templates is not None:
+            cypher = self.cypher_templates.get(consult_type, labels)
+            if cypher is not None:
+                logger.info(f'📐cypher模板命中-->{consult_type}:{cypher}')
+                return {'cypher_query': cypher, 'entities_to_align': entities, 'consult_type': consult_type,
+                        'from_template': True}
+        if cypher is None:
+            return None
+        return {'cypher_query': cypher, 'entities_to_align': entities, 'consult_type': consult_type}
+
+    def _prepare_generated(self, result):
+        '''统一参数编号、改写成不返回向量且带LIMIT的查询,并在实体对齐(会原地改写实体)之前判断这条cypher能否作为模板'''
+        result['cypher_query'], result['entities_to_align'] = canonicalize(result['cypher_query'],
+                                                                          result['entities_to_align'])
+        if config.CYPHER_GUARD_CONFIG['enabled']:
+            result['cypher_query'] = guard_cypher(result['cypher_query'], config.CYPHER_GUARD_CONFIG['limit'])
+        # 预置查询库已覆盖的形状不再另存模板
+        labels = [item['label'] for item in result['entities_to_align']]
+        result['template_candidate'] = (self.cypher_templates is not None
+                                        and result.get('consult_type') in self.INTENT_INFO["consult"]
+                                        and not (config.CYPHER_LIBRARY_ENABLED
+                                                 and get_library_query(result['consult_type'], labels))
+                                        and is_reusable(result['cypher_query'], result['entities_to_align']))
+        return result
 
-        prompt = PromptTemplate.from_template(prompt)
-        prompt = prompt.format(question=question, schema_info=self.graph.schema)
-        # print(f'🍅知识图谱机构信息:{self.graph.schema}')
+    def _remember_template(self, result, query_result):
+        '''生成的cypher查到了结果才视为验证通过,存为模板;命中的模板则记下这次有没有查到结果(连续查不到时淘汰)'''
+        labels = [item['label'] for item in result['entities_to_align']]
+        if result.get('template_candidate') and query_result:
+            self.cypher_templates.put(result['consult_type'], result['cypher_query'], labels)
+        elif result.get('from_template'):
+            self.cypher_templates.report(result['consult_type'], labels, bool(query_result))
 
+    def _build_extract_prompt(self, question, candidates, session=None):
+        candidates_info = '；'.join(f'{consult_type}:' + '或'.join(str(list(labels)) for labels in label_sets)
+                                   for consult_type, label_sets in candidates.items())
+        return self.prompts['extract'].format(question=self._with_context(question, session),
+                                              candidates=candidates_info)
 
-        output = self.llm.invoke(prompt)
-        # print(self.str_parser.invoke(output))
-        return self.json_parser.invoke(output)
+    def _build_cypher_prompt(self, question, session=None):
+        return self.prompts['cypher'].format(question=self._with_context(question, session),
+                                             schema_info=self.schema_snapshot.get())
 
     def _entity_align(self, entities_to_align):
-        for index, entity_to_align in enumerate(entities_to_align):
-            label = entity_to_align['label']
-            entity = entity_to_align['entity']
-            aligned_entity = self.neo4j_vectors[label].similarity_search(entity,k=1)[0].page_content
-            print(f'💚原实体:{entity}-->对齐实体:{aligned_entity}')
-            print('='*50)
-            entities_to_align[index]['entity'] = aligned_entity #🔥原地修改
+        # 精确名称/别名命中的实体直接对齐,其余的才做向量检索
+        pending = [item for item in entities_to_align if not self._exact_align(item)]
+        if not pending:
+            return entities_to_align
+        # 一次前向计算得到所有实体的向量,再把各实体的混合检索并发发往Neo4j
+        embeddings = self.embedding_model.embed_documents([item['entity'] for item in pending])
+        list(self.align_executor.map(self._align_one, pending, embeddings))
         return entities_to_align
 
-    def _execute_query(self, cypher, aligned_entities):
-        params = {aligned_entity['param_name']: aligned_entity['entity'] for aligned_entity in aligned_entities}
-        return  self.graph.query(cypher,params=params)
+    def _align_one(self, entity_to_align, embedding):
+        entity = entity_to_align['entity']
+        aligned_entity = self._local_align(entity_to_align, embedding)
+        if aligned_entity is None:
+            # 传入query时仍是向量+全文的混合检索,只是不再重复计算向量
+            docs = self.neo4j_vectors[entity_to_align['label']].similarity_search_by_vector(embedding, k=1,
+                                                                                          query=entity)
+            aligned_entity = docs[0].page_content
+        logger.info(f'💚原实体:{entity}-->对齐实体:{aligned_entity}')
+        entity_to_align['entity'] = aligned_entity #🔥原地修改
+        return entity_to_align
 
-    def _generate_answer(self, question, query_result):
-        prompt = '''
-                你是一个医疗行业领域的智能医生小助手,精通各种医学知识以及熟悉所有的医院诊断流程。根据用户问题,以及数据库查询结果生成回答。
-                要求:
-                1.回答简洁、准确,使用人类的自然语言。
-                2.仅输出普通文本。
-                3.直接给出具体结论，无需额外冗余内容。
-                用户问题:{question}
-                数据库返回结果:{query_result}
-        '''
-        prompt = prompt.format(question=question,query_result=query_result)
-        result = self.llm.invoke(prompt)
+    def _exact_align(self, entity_to_align):
+        if self.alias_dictionary is None:
+            return False
+        aligned_entity = self.alias_dictionary.lookup(entity_to_align['label'], entity_to_align['entity'])
+        if aligned_entity is None:
+            return False
+        logger.info(f'🎯原实体:{entity_to_align["entity"]}-->精确对齐实体:{aligned_entity}')
+        entity_to_align['entity'] = aligned_entity
+        return True
+
+    def _local_align(self, entity_to_align, embedding):
+        '''进程内索引对齐,未启用或该节点类型不在索引中时返回None'''
+        label = entity_to_align['label']
+        if self.entity_index is None or label not in self.entity_index:
+            return None
+        return self.entity_index.search(label, entity_to_align['entity'], embedding, k=1)[0][0]
+
+    async def _aentity_align(self, entities_to_align):
+        # 各实体互不依赖,并发检索
+        await asyncio.gather(*await self._aalign_tasks(entities_to_align))
+        return entities_to_align
+
+    async def _aalign_tasks(self, entities_to_align):
+        '''批量计算向量后,为每个实体返回一个待执行的检索协程(精确命中的实体返回已对齐的结果)'''
+        resolved = [item for item in entities_to_align if self._exact_align(item)]
+        pending = [item for item in entities_to_align if item not in resolved]
+        tasks = [self._aresolved(item) for item in resolved]
+        if pending:
+            embeddings = await self.embedding_model.aembed_documents([item['entity'] for item in pending])
+            tasks += [self._aalign_one(item, embedding) for item, embedding in zip(pending, embeddings)]
+        return tasks
+
+    @staticmethod
+    async def _aresolved(entity_to_align):
+        return entity_to_align
+
+    async def _aalign_one(self, entity_to_align, embedding):
+        entity = entity_to_align['entity']
+        aligned_entity = self._local_align(entity_to_align, embedding)
+        if aligned_entity is None:
+            docs = await self.neo4j_vectors[entity_to_align['label']].asimilarity_search_by_vector(embedding, k=1,
+                                                                                                  query=entity)
+            aligned_entity = docs[0].page_content
+        logger.info(f'💚原实体:{entity}-->对齐实体:{aligned_entity}')
+        entity_to_align['entity'] = aligned_entity #🔥原地修改
+        return entity_to_align
+
+    def _execute_query(self, cypher, aligned_entities, session=None):
+        params = self._build_query_params(aligned_entities)
+        query_result = self._session_rows(session, cypher, params)
+        if query_result is not None:
+            return query_result
+        key, query_result = self._cached_query(cypher, params)
+        if query_result is not None:
+            return query_result
+        try:
+            checked = self.query_guard.check(cypher, params, self.neo4j_pool.explain)
+            try:
+                query_result = self.neo4j_pool.query(checked, params, timeout=config.QUERY_GUARD_CONFIG['timeout'])
+            except Exception as e:
+                if not is_timeout(e):
+                    raise
+                raise self.query_guard.record_timeout(checked, params) from e
+        except UnsafeQueryError:
+            # 宁可这个问题没有查询结果,也不让一条坏查询拖慢数据库
+            return []
+        self._cache_query(key, query_result)
+        return query_result
+
+    async def _aexecute_query(self, cypher, aligned_entities, session=None):
+        params = self._build_query_params(aligned_entities)
+        query_result = self._session_rows(session, cypher, params)
+        if query_result is not None:
+            return query_result
+        key, query_result = self._cached_query(cypher, params)
+        if query_result is not None:
+            return query_result
+        try:
+            checked = await self.query_guard.acheck(cypher, params, self.neo4j_pool.aexplain)
+            try:
+                query_result = await self.neo4j_pool.aquery(checked, params,
+                                                            timeout=config.QUERY_GUARD_CONFIG['timeout'])
+            except Exception as e:
+                if not is_timeout(e):
+                    raise
+                raise self.query_guard.record_timeout(checked, params) from e
+        except UnsafeQueryError:
+            return []
+        self._cache_query(key, query_result)
+        return query_result
+
+    def _cached_query(self, cypher, params):
+        '''返回(缓存key, 缓存的查询结果或None);未启用查询缓存时都为None'''
+        if self.query_cache is None:
+            return None, None
+        key = query_key(cypher, params)
+        query_result = self.query_cache.get(key)
+        if query_result is not None:
+            logger.info(f'💾查询结果缓存命中-->{params}')
+        return key, query_result
+
+    def _cache_query(self, key, query_result):
+        if key is not None:
+            self.query_cache.put(key, query_result)
+
+    def _build_query_params(self, aligned_entities):
+        return {aligned_entity['param_name']: aligned_entity['entity'] for aligned_entity in aligned_entities}
+
+    def _generate_answer(self, question, query_result, session=None):
+        result = self._invoke_llm('answer', self._build_answer_prompt(question, query_result, session))
         return self.str_parser.invoke(result)
 
+    async def _agenerate_answer(self, question, query_result, session=None):
+        result = await self._ainvoke_llm('answer', self._build_answer_prompt(question, query_result, session))
+        return self.str_parser.invoke(result)
+
+    def _build_answer_prompt(self, question, query_result, session=None):
+        guard_config = config.CYPHER_GUARD_CONFIG
+        if guard_config['enabled']:
+            # 去掉向量、截断长文本、限制行数,合并各行相同的列
+            query_result = condense_rows(query_result, guard_config['answer_max_rows'],
+                                         guard_config['answer_max_text_chars'])
+        return self.prompts['answer'].format(question=self._with_context(question, session), query_result=query_result)
+
 
 if __name__ == '__main__':
     chat_service = ChatService()
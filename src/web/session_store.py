@@ -0,0 +1,245 @@
+import asyncio
+import json
+import logging
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from web.query_cache import query_key
+
+logger = logging.getLogger(__name__)
+
+#🌻 多轮对话的会话上下文:每个会话保存最近几轮consult问题对齐后的实体和查询结果,
+# 追问(如“那它忌吃什么”)时把上文交给大模型补全指代,已对齐过的实体直接复用,相同的查询直接使用上一轮的结果;
+# 会话超过ttl_seconds没有新的提问即过期,每个会话最多保留max_turns轮、约max_bytes字节(超出时先丢弃最早的轮次)
+
+
+def _estimate_bytes(turns):
+    return len(json.dumps(turns, ensure_ascii=False, default=str).encode('utf-8'))
+
+
+class ChatSession:
+    '''
+    一个会话的上下文,turns为[{question, entities:[{label, mention, entity}], query_key, rows}],按时间顺序;
+    处理一个问题期间只在本对象上修改,回答完成后由SessionStore.save写回
+    '''
+
+    def __init__(self, session_id, turns=None):
+        self.session_id = session_id
+        self.turns = list(turns or [])
+
+    def has_context(self):
+        return bool(self.turns)
+
+    def context_text(self, max_turns):
+        '''最近max_turns轮的问题及对齐后的实体,拼到cypher/回答提示词的用户问题后面'''
+        lines = []
+        for turn in self.turns[-max_turns:]:
+            entities = '、'.join(f'{item["entity"]}({item["label"]})' for item in turn['entities'])
+            lines.append(f'“{turn["question"]}”' + (f',涉及实体:{entities}' if entities else ''))
+        return '；'.join(lines)
+
+    def resolve(self, entities_to_align):
+        '''
+        之前轮次对齐过的实体(原始名称或对齐后的名称相同)直接复用对齐结果,返回仍需对齐的实体;
+        会原地改写实体,并用mention记下原始名称
+        '''
+        known = {}
+        for turn in self.turns:
+            for item in turn['entities']:
+                known[(item['label'], item['mention'])] = item['entity']
+                known[(item['label'], item['entity'])] = item['entity']
+        pending = []
+        for item in entities_to_align:
+            item['mention'] = item['entity']
+            aligned_entity = known.get((item['label'], item['entity']))
+            if aligned_entity is None:
+                pending.append(item)
+            else:
+                logger.info(f'🧷会话上文已对齐:{item["entity"]}-->{aligned_entity}')
+                item['entity'] = aligned_entity
+        return pending
+
+    def rows(self, cypher, params):
+        '''之前轮次执行过同一条查询时返回其结果,否则返回None'''
+        key = query_key(cypher, params)
+        for turn in reversed(self.turns):
+            if turn['query_key'] == key and turn['rows'] is not None:
+                return turn['rows']
+        return None
+
+    def add_turn(self, question, result=None, params=None, rows=None):
+        '''记录一轮问答;result为None(如命中回答缓存)时只记录问题'''
+        entities = [] if result is None else [
+            {'label': item['label'], 'mention': item.get('mention', item['entity']), 'entity': item['entity']}
+            for item in result['entities_to_align']]
+        self.turns.append({'question': question, 'entities': entities,
+                           'query_key': None if result is None else query_key(result['cypher_query'], params),
+                           'rows': rows})
+
+
+class SessionStore:
+    '''
+    进程内会话存储:超过ttl_seconds未访问的会话过期,会话数超过max_sessions时按LRU淘汰;
+    子类覆盖_read/_write/_remove即可换成其他存储(如ShelveSessionStore)。
+    每个worker进程各有一份,多进程部署时负载均衡需要按session_id粘滞路由,否则追问落到别的worker上就没有上文
+    '''
+
+    # get/save是否有文件读写(有时异步流程放到线程中执行,不阻塞事件循环)
+    blocking = False
+
+    def __init__(self, ttl_seconds=1800, max_sessions=10000, max_turns=10, max_bytes=256 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+
+        self._sessions = OrderedDict()  # {session_id:(turns, 过期时间)},顺序即LRU顺序
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'expirations': 0, 'evictions': 0, 'trimmed_turns': 0}
+
+    def get(self, session_id):
+        '''返回会话上下文,不存在或已过期时返回空会话'''
+        with self._lock:
+            entry = self._read(session_id)
+            # 过期时间用墙上时间,写入文件的会话在服务重启后仍能判断是否过期
+            if entry is not None and entry[1] < time.time():
+                self._remove(session_id)
+                self.counters['expirations'] += 1
+                entry = None
+            self.counters['hits' if entry is not None else 'misses'] += 1
+        return ChatSession(session_id, entry[0] if entry is not None else None)
+
+    def save(self, session):
+        '''写回会话并刷新过期时间;超过max_turns轮或max_bytes字节时丢弃最早的轮次,单轮仍超出时不保存其查询结果'''
+        turns = session.turns[-self.max_turns:]
+        trimmed = len(session.turns) - len(turns)
+        while len(turns) > 1 and _estimate_bytes(turns) > self.max_bytes:
+            turns = turns[1:]
+            trimmed += 1
+        if turns and _estimate_bytes(turns) > self.max_bytes:
+            turns = [{**turns[0], 'rows': None}]
+        with self._lock:
+            self.counters['trimmed_turns'] += trimmed
+            self._write(session.session_id, (turns, time.time() + self.ttl_seconds))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._remove(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'sessions': self._size()}
+
+    def close(self):
+        pass
+
+    # 以下方法在持有锁时调用
+    def _read(self, session_id):
+        entry = self._sessions.get(session_id)
+        if entry is not None:
+            self._sessions.move_to_end(session_id)
+        return entry
+
+    def _write(self, session_id, entry):
+        self._sessions[session_id] = entry
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def _remove(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    def _size(self):
+        return len(self._sessions)
+
+
+class ShelveSessionStore(SessionStore):
+    '''
+    会话保存在本地键值文件(shelve/dbm)中,服务重启后会话仍然有效;
+    过期的会话在读取时删除,另外每隔sweep_interval秒扫描一次全部会话。
+    dbm文件不支持多个进程同时写入,多进程部署(workers>1)时不能使用,见check_session_config
+    '''
+
+    blocking = True
+
+    def __init__(self, path, sweep_interval=600.0, **kwargs):
+        super().__init__(**kwargs)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._shelf = shelve.open(str(path))
+        self._swept_at = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._shelf.close()
+
+    def _read(self, session_id):
+        return self._shelf.get(session_id)
+
+    def _write(self, session_id, entry):
+        self._shelf[session_id] = entry
+        if time.monotonic() - self._swept_at >= self.sweep_interval:
+            self._sweep()
+
+    def _remove(self, session_id):
+        if session_id in self._shelf:
+            del self._shelf[session_id]
+
+    def _size(self):
+        return len(self._shelf)
+
+    def _sweep(self):
+        self._swept_at = time.monotonic()
+        now = time.time()
+        expired = [session_id for session_id in self._shelf.keys() if self._shelf[session_id][1] < now]
+        for session_id in expired:
+            del self._shelf[session_id]
+        self.counters['expirations'] += len(expired)
+
+
+class SessionLocks:
+    '''
+    每个session_id一把asyncio.Lock:同一会话的并发请求依次执行读取-问答-写回,
+    否则两个请求读到同一份上文,后写回的会覆盖先写回的轮次;没有请求持有或等待时删除该锁
+    '''
+
+    def __init__(self):
+        self._locks = {}  # {session_id:[锁,持有或等待的请求数]}
+
+    @asynccontextmanager
+    async def hold(self, session_id):
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[session_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+
+def check_session_config(session_config, workers):
+    '''启动服务前检查会话配置:shelve文件不能被多个worker进程同时打开'''
+    if session_config['enabled'] and session_config['store'] == 'shelve' and workers > 1:
+        raise ValueError(f'会话存储shelve不支持多进程部署(workers={workers}),'
+                         f'请改用memory并在负载均衡上按session_id粘滞路由')
+
+
+def create_session_store(session_config):
+    '''session_config为config.SESSION_CONFIG,store为memory(进程内)或shelve(本地文件)'''
+    options = {'ttl_seconds': session_config['ttl_seconds'], 'max_sessions': session_config['max_sessions'],
+               'max_turns': session_config['max_turns'], 'max_bytes': session_config['max_kb'] * 1024}
+    if session_config['store'] == 'memory':
+        return SessionStore(**options)
+    if session_config['store'] == 'shelve':
+        return ShelveSessionStore(session_config['shelve_path'], **options)
+    raise ValueError(f'未知的会话存储类型:{session_config["store"]}')
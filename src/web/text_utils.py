@@ -0,0 +1,32 @@
+# 繁体-->简体:优先使用opencc(可选依赖),未安装时退回下面的常用字对照表
+_TRADITIONAL = '醫藥療癥狀頭腸發燒嚨膽腎臟壓過膚損傷瘡瘍變貧輕劑灣門診掛號檢驗報斷預約費複傳憂鬱癲癇衛層濕熱氣嘔暈脹瀉腫塊結節點關痺臨產婦兒隨體癢瘧癱腦膿脈竇'
+_SIMPLIFIED = '医药疗症状头肠发烧咙胆肾脏压过肤损伤疮疡变贫轻剂湾门诊挂号检验报断预约费复传忧郁癫痫卫层湿热气呕晕胀泻肿块结节点关痹临产妇儿随体痒疟瘫脑脓脉窦'
+_T2S_TABLE = str.maketrans(_TRADITIONAL, _SIMPLIFIED)
+
+try:
+    from opencc import OpenCC
+    _t2s_converter = OpenCC('t2s')
+except ImportError:
+    _t2s_converter = None
+
+
+def dbc2sbc(text):
+    '''全角转半角(与uie_pytorch/utils.py中的dbc2sbc一致)'''
+    rs = ''
+    for char in text:
+        code = ord(char)
+        if code == 0x3000:
+            code = 0x0020
+        else:
+            code -= 0xFEE0
+        if not (0x0021 <= code <= 0x7E):
+            rs += char
+            continue
+        rs += chr(code)
+    return rs
+
+
+def to_simplified(text):
+    if _t2s_converter is not None:
+        return _t2s_converter.convert(text)
+    return text.translate(_T2S_TABLE)
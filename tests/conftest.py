@@ -0,0 +1,14 @@
+import importlib
+import sys
+from pathlib import Path
+
+# 代码在src目录下运行(命名空间包),测试时把src加入导入路径
+SRC_DIR = Path(__file__).parent.parent / 'src'
+sys.path.insert(0, str(SRC_DIR))
+
+# configuration/config.py是各自从config_demo.py复制的本地配置(不提交),没有时用config_demo
+try:
+    importlib.import_module('configuration.config')
+except ModuleNotFoundError:
+    sys.modules['configuration.config'] = importlib.import_module('configuration.config_demo')
+    importlib.import_module('configuration').config = sys.modules['configuration.config']
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from web.answer_cache import AnswerCache, normalize_question
+from web.server import ChatService
+
+
+class FakeEmbeddings:
+    '''相同的字用相同的维度,字面相近的问题向量也相近'''
+
+    def embed_query(self, text):
+        vector = np.zeros(64, dtype=np.float32)
+        for char in normalize_question(text):
+            vector[ord(char) % 64] += 1.0
+        return vector.tolist()
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(FakeEmbeddings(), max_entries=8, similarity_threshold=0.8)
+
+
+def remember(cache, question, answer, semantic_key):
+    _, probe = cache.lookup(question, semantic_key)
+    cache.store(probe, answer)
+
+
+def test_exact_hit_ignores_punctuation(cache):
+    remember(cache, '高血压吃什么药？', '降压药', None)
+    assert cache.lookup('高血压 吃什么药', None)[0] == '降压药'
+
+
+def test_semantic_hit_needs_the_same_key(cache):
+    remember(cache, '高血压应该吃什么药', '降压药', ('疾病对应药物', {'高血压'}))
+    assert cache.lookup('高血压该吃什么药', ('疾病对应药物', {'高血压'}))[0] == '降压药'
+    # 实体不同
+    assert cache.lookup('低血压该吃什么药', ('疾病对应药物', {'低血压'}))[0] is None
+
+
+def test_opposite_sub_types_do_not_share_answers(cache):
+    # 宜吃/忌吃:实体相同、字面只差一个字,咨询子类别不同
+    remember(cache, '高血压宜吃什么', '芹菜', ('疾病宜吃食物', {'高血压'}))
+    assert cache.lookup('高血压忌吃什么', ('疾病忌吃食物', {'高血压'}))[0] is None
+    assert cache.stats()['semantic_hits'] == 0
+
+
+def test_without_semantic_key_only_exact_match(cache):
+    remember(cache, '高血压应该吃什么药', '降压药', ('疾病对应药物', {'高血压'}))
+    assert cache.lookup('高血压该吃什么药', None)[0] is None
+
+
+def test_uncacheable_answer_is_not_stored(cache):
+    _, probe = cache.lookup('罕见病吃什么药', ('疾病对应药物', {'罕见病'}))
+    ChatService._skip_answer_cache(probe, [])
+    cache.store(probe, '没有查到相关信息')
+    assert cache.lookup('罕见病吃什么药', None)[0] is None
+    assert cache.stats()['size'] == 0
+
+
+def test_non_empty_query_result_keeps_answer_cacheable(cache):
+    _, probe = cache.lookup('高血压吃什么药', None)
+    ChatService._skip_answer_cache(probe, [{'drug': '降压药'}])
+    cache.store(probe, '降压药')
+    assert cache.lookup('高血压吃什么药', None)[0] == '降压药'
@@ -0,0 +1,55 @@
+import pytest
+
+from web.cypher_guard import guard_cypher
+
+
+@pytest.mark.parametrize('cypher, expected', [
+    ('MATCH (d:Disease) RETURN d.name',
+     'MATCH (d:Disease) RETURN d.name LIMIT 50'),
+    ('MATCH (d:Disease) RETURN d.name LIMIT 10',
+     'MATCH (d:Disease) RETURN d.name LIMIT 10'),
+    ('MATCH (d:Disease) RETURN d.name LIMIT 1000',
+     'MATCH (d:Disease) RETURN d.name LIMIT 50'),
+    # 参数化的LIMIT无法确定大小,换成上限;$limit不能被当成LIMIT关键字
+    ('MATCH (d:Disease) RETURN d.name LIMIT $limit',
+     'MATCH (d:Disease) RETURN d.name LIMIT 50'),
+    ('MATCH (d:Disease) RETURN d.name ORDER BY d.name;',
+     'MATCH (d:Disease) RETURN d.name ORDER BY d.name LIMIT 50'),
+])
+def test_limit(cypher, expected):
+    assert guard_cypher(cypher, 50) == expected
+
+
+@pytest.mark.parametrize('cypher', [
+    'MATCH (d:Disease) RETURN count(d)',
+    'MATCH (d:Disease) RETURN count(d) AS total, avg(d.cure_rate) AS rate',
+    'MATCH (d:Disease)-[:has_symptom]->(s) RETURN count(DISTINCT s) AS total',
+])
+def test_aggregate_only_return_is_not_limited(cypher):
+    assert guard_cypher(cypher, 50) == cypher
+
+
+def test_grouped_aggregate_is_limited():
+    assert guard_cypher('MATCH (d:Disease)-[:has_symptom]->(s) RETURN d.name, count(s)', 50).endswith('LIMIT 50')
+
+
+def test_whole_node_drops_embedding():
+    assert guard_cypher('MATCH (d:Disease {name: $name}) RETURN d', 50) == (
+        'MATCH (d:Disease {name: $name}) RETURN d {.*, embedding: null} AS d LIMIT 50')
+
+
+def test_embedding_property_is_not_returned():
+    assert guard_cypher('MATCH (d:Disease) RETURN d.name, d.embedding', 50) == (
+        'MATCH (d:Disease) RETURN d.name LIMIT 50')
+
+
+def test_path_is_projected():
+    guarded = guard_cypher('MATCH p = (d:Disease)-[:has_symptom]->(s) RETURN p', 50)
+    assert 'nodes: [node_ IN nodes(p) | node_ {.*, embedding: null}]' in guarded
+    assert 'relationships: [rel_ IN relationships(p) | type(rel_)]' in guarded
+    assert guarded.endswith('AS p LIMIT 50')
+
+
+def test_union_branches_are_guarded_separately():
+    assert guard_cypher('MATCH (d:Disease) RETURN d.name AS name UNION MATCH (s:Symptom) RETURN s.name AS name', 50) == (
+        'MATCH (d:Disease) RETURN d.name AS name LIMIT 50 UNION MATCH (s:Symptom) RETURN s.name AS name LIMIT 50')
@@ -0,0 +1,42 @@
+import json
+
+from web.cypher_template import CypherTemplateStore, canonicalize, is_reusable
+
+
+def test_canonicalize_orders_params_by_label():
+    cypher, entities = canonicalize(
+        'MATCH (d:Drug {name:$param_0})<-[:has_drug]-(s:Disease {name:$param_1}) RETURN s.name',
+        [{'param_name': 'param_0', 'entity': '阿司匹林', 'label': 'Drug'},
+         {'param_name': 'param_1', 'entity': '高血压', 'label': 'Disease'}])
+    assert cypher == 'MATCH (d:Drug {name:$param_1})<-[:has_drug]-(s:Disease {name:$param_0}) RETURN s.name'
+    assert [item['label'] for item in entities] == ['Disease', 'Drug']
+
+
+def test_hard_coded_entity_is_not_reusable():
+    entities = [{'param_name': 'param_0', 'entity': '高血压', 'label': 'Disease'}]
+    assert not is_reusable("MATCH (d:Disease {name:'高血压'}) RETURN d.name", entities)
+    assert is_reusable('MATCH (d:Disease {name:$param_0}) RETURN d.name', entities)
+
+
+def test_changes_are_saved_by_flush_not_by_put(tmp_path):
+    path = tmp_path / 'templates.json'
+    store = CypherTemplateStore(path, flush_interval=3600)
+    store.put('疾病对应药物', 'MATCH (d:Disease {name:$param_0}) RETURN d.name', ['Disease'])
+    assert not path.exists()
+    store.close()
+    assert [item['consult_type'] for item in json.loads(path.read_text(encoding='utf-8'))] == ['疾病对应药物']
+    assert CypherTemplateStore(path).get('疾病对应药物', ['Disease']) is not None
+    # 只留下模板文件,没有残留的临时文件
+    assert [p.name for p in tmp_path.iterdir()] == ['templates.json']
+
+
+def test_template_evicted_after_consecutive_empty_results(tmp_path):
+    store = CypherTemplateStore(tmp_path / 'templates.json', max_empty_results=2, flush_interval=3600)
+    store.put('疾病对应药物', 'MATCH (d:Disease {name:$param_0}) RETURN d.name', ['Disease'])
+    store.report('疾病对应药物', ['Disease'], False)
+    store.report('疾病对应药物', ['Disease'], True)
+    store.report('疾病对应药物', ['Disease'], False)
+    assert store.get('疾病对应药物', ['Disease']) is not None
+    store.report('疾病对应药物', ['Disease'], False)
+    assert store.get('疾病对应药物', ['Disease']) is None
+    store.close()
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from configuration import config
+from web.intent_router import KeywordAutomaton, RequestRouter
+from web.server import INTENT_INFO
+
+
+@pytest.fixture(scope='module')
+def router():
+    return RequestRouter(INTENT_INFO['request'])
+
+
+def load_rows():
+    with open(config.INTENT_DATA_PATH, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = KeywordAutomaton()
+    for keyword in ['挂号', '挂号机', '号机']:
+        automaton.add(keyword, keyword)
+    matches = automaton.build().find_all('自助挂号机')
+    assert sorted((start, end, keyword) for start, end, keyword, _ in matches) == [
+        (2, 4, '挂号'), (2, 5, '挂号机'), (3, 5, '号机')]
+
+
+@pytest.mark.parametrize('question, expected', [
+    ('我要挂号', '挂号预约'),
+    ('我想缴费', '费用支付/退费'),
+    ('病历邮寄怎么办理', '病例邮寄'),
+    # 提到两个功能入口
+    ('预约下周的住院，投诉医生服务态度', None),
+    ('办理住院手续时发现身份证信息有误，需要修改', None),
+    ('自助挂号机卡纸', None),
+    # 事务+病情
+    ('我要挂号，感冒了', None),
+    ('高血压挂哪个科', None),
+])
+def test_route(router, question, expected):
+    assert router.route(question) == expected
+
+
+def test_multi_label_rows_are_never_routed(router):
+    '''包含咨询意图或多个事务类别的问题一律交给意图识别'''
+    routed = [row['text'] for row in load_rows()
+              if (set(row['intent']) != {'request'} or len(set(row['request'])) > 1) and router.route(row['text'])]
+    assert routed == []
+
+
+def test_single_label_rows_route_to_their_label(router):
+    rows = [row for row in load_rows() if set(row['intent']) == {'request'} and len(set(row['request'])) == 1]
+    routed = [(row['text'], router.route(row['text']), row['request'][0]) for row in rows]
+    routed = [item for item in routed if item[1] is not None]
+    assert routed
+    assert [item for item in routed if item[1] != item[2]] == []
@@ -0,0 +1,59 @@
+import pytest
+
+from configuration import config
+from intent_classify.predict import IntentPredictor
+from web.server import ChatService
+
+
+class FakeModel:
+    '''只返回固定概率的意图模型'''
+
+    def __init__(self, proba):
+        self.proba = proba
+
+    def predict_proba(self, question):
+        return self.proba
+
+
+def predictor(proba):
+    instance = IntentPredictor.__new__(IntentPredictor)
+    instance.model = FakeModel(proba)
+    instance.threshold = 0.5
+    return instance
+
+
+@pytest.fixture(autouse=True)
+def hybrid_mode(monkeypatch):
+    monkeypatch.setattr(config, 'INTENT_CLASSIFY_MODE', 'hybrid')
+    monkeypatch.setattr(config, 'INTENT_CONFIDENCE_THRESHOLD', 0.8)
+
+
+def test_off_topic_request_without_sub_label_goes_to_llm():
+    # “帮我写一首诗”:训练数据没有无关问题,模型高置信度判成request,但没有任何事务类别
+    prediction = predictor({'intent:request': 0.96, 'intent:consult': 0.02,
+                            'request:挂号预约': 0.1}).predict('帮我写一首诗')
+    assert prediction['intent'] == 'request' and prediction['confidence'] > 0.9
+    assert ChatService._local_intent(prediction) is None
+
+
+def test_consult_without_sub_label_goes_to_llm():
+    prediction = predictor({'intent:request': 0.01, 'intent:consult': 0.95}).predict('今天天气怎么样')
+    assert ChatService._local_intent(prediction) is None
+
+
+def test_confident_prediction_with_sub_label_is_used():
+    prediction = predictor({'intent:request': 0.02, 'intent:consult': 0.97,
+                            'consult:疾病对应药物': 0.9}).predict('高血压吃什么药')
+    assert ChatService._local_intent(prediction) == 'consult'
+
+
+def test_low_confidence_goes_to_llm():
+    prediction = predictor({'intent:request': 0.3, 'intent:consult': 0.7,
+                            'consult:疾病对应药物': 0.9}).predict('高血压吃什么药')
+    assert ChatService._local_intent(prediction) is None
+
+
+def test_local_mode_keeps_the_model_result(monkeypatch):
+    monkeypatch.setattr(config, 'INTENT_CLASSIFY_MODE', 'local')
+    prediction = predictor({'intent:request': 0.96, 'intent:consult': 0.02}).predict('帮我写一首诗')
+    assert ChatService._local_intent(prediction) == 'request'
@@ -0,0 +1,20 @@
+import time
+
+from web.metrics import ChatMetrics
+
+
+def test_unexpected_intent_counted_as_other():
+    metrics = ChatMetrics()
+    for intent in ['consult', 'request', 'unknown', '我觉得这是consult', '']:
+        metrics.count_intent(intent)
+    text = metrics.render()
+    assert 'chat_intent_total{intent="other"} 2' in text
+    assert '我觉得' not in text
+
+
+def test_paused_time_is_not_counted():
+    metrics = ChatMetrics()
+    with metrics.span('answer') as span:
+        with span.paused():
+            time.sleep(0.05)
+    assert span.elapsed() < 0.05
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from web.query_guard import QueryGuard, UnsafeQueryError, bound_var_length
+
+CYPHER = 'MATCH (d:Disease {name: $name})-[:has_symptom]->(s) RETURN s.name'
+PLAN = {'operatorType': 'NodeIndexSeek@neo4j', 'children': []}
+
+
+def explain(cypher, params):
+    return PLAN
+
+
+def test_timeout_bans_only_the_same_params():
+    guard = QueryGuard()
+    checked = guard.check(CYPHER, {'name': '感冒'}, explain)
+    guard.record_timeout(checked, {'name': '感冒'})
+    with pytest.raises(UnsafeQueryError):
+        guard.check(CYPHER, {'name': '感冒'}, explain)
+    # 同一模板换一组参数不受影响
+    assert guard.check(CYPHER, {'name': '高血压'}, explain) == checked
+
+
+def test_timeout_ban_expires():
+    guard = QueryGuard(timeout_ban_seconds=0.05)
+    checked = guard.check(CYPHER, {'name': '感冒'}, explain)
+    guard.record_timeout(checked, {'name': '感冒'})
+    with pytest.raises(UnsafeQueryError):
+        guard.check(CYPHER, {'name': '感冒'}, explain)
+    time.sleep(0.06)
+    assert guard.check(CYPHER, {'name': '感冒'}, explain) == checked
+    assert guard.stats()['timeout_bans'] == 0
+
+
+def test_unsafe_plan_is_rejected():
+    guard = QueryGuard()
+    with pytest.raises(UnsafeQueryError) as error:
+        guard.check('MATCH (n) RETURN n', {}, lambda cypher, params: {'operatorType': 'AllNodesScan', 'children': []})
+    assert error.value.reason == 'AllNodesScan'
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    ('-[*]->', '-[*1..3]->'),
+    ('-[r:HAVE*..10]->', '-[r:HAVE*..3]->'),
+    ('-[*2]->', '-[*2]->'),
+    ('-[*5..]->', '-[*5..5]->'),
+])
+def test_bound_var_length(pattern, expected):
+    assert bound_var_length(f'MATCH (a){pattern}(b) RETURN b', 3) == f'MATCH (a){expected}(b) RETURN b'
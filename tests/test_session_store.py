@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from web.server import ChatService
+from web.session_store import SessionLocks, SessionStore, ShelveSessionStore, check_session_config
+
+
+@pytest.fixture(params=['memory', 'shelve'])
+def service(request, tmp_path):
+    service = ChatService(lazy=True)
+    if request.param == 'memory':
+        service.session_store = SessionStore()
+    else:
+        service.session_store = ShelveSessionStore(tmp_path / 'sessions')
+    yield service
+    service.session_store.close()
+
+
+async def ask(service, session_id, question):
+    async with service._asession(session_id) as session:
+        # 模拟问答期间的大模型调用,让同一会话的两个请求在没有锁时交错执行
+        await asyncio.sleep(0.01)
+        session.add_turn(question)
+
+
+def test_concurrent_requests_on_one_session_keep_both_turns(service):
+    async def main():
+        await asyncio.gather(ask(service, 's1', '高血压吃什么药'), ask(service, 's1', '那它忌吃什么'))
+    asyncio.run(main())
+    turns = service.session_store.get('s1').turns
+    assert sorted(turn['question'] for turn in turns) == ['那它忌吃什么', '高血压吃什么药']
+    assert len(service.session_locks) == 0
+
+
+def test_failed_request_is_not_saved(service):
+    async def main():
+        with pytest.raises(RuntimeError):
+            async with service._asession('s1') as session:
+                session.add_turn('高血压吃什么药')
+                raise RuntimeError('大模型调用失败')
+    asyncio.run(main())
+    assert not service.session_store.get('s1').has_context()
+    assert len(service.session_locks) == 0
+
+
+def test_session_locks_serialise_one_session_only():
+    locks = SessionLocks()
+    order = []
+
+    async def hold(session_id, name):
+        async with locks.hold(session_id):
+            order.append(f'{name}:start')
+            await asyncio.sleep(0.01)
+            order.append(f'{name}:end')
+
+    async def main():
+        await asyncio.gather(hold('a', 'a1'), hold('a', 'a2'), hold('b', 'b1'))
+    asyncio.run(main())
+    assert order.index('a1:end') < order.index('a2:start')
+    assert order.index('b1:start') < order.index('a1:end')
+
+
+def test_shelve_store_refused_with_several_workers():
+    session_config = {'enabled': True, 'store': 'shelve'}
+    check_session_config(session_config, 1)
+    check_session_config({**session_config, 'store': 'memory'}, 4)
+    with pytest.raises(ValueError):
+        check_session_config(session_config, 4)